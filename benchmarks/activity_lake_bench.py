@@ -0,0 +1,100 @@
+"""The JSON interactions file against the partitioned Parquet activity lake, in-process.
+
+    python benchmarks/activity_lake_bench.py --interactions 1000000 --days 60 --appends 200
+
+Times logging one interaction (rewriting the JSON file, as spark.read.json + overwrite did,
+against a new lake file), then reading everything and a single user's recent likes before
+and after compaction. Spark reads the same layout; the local backend is what is timed here.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import pandas as pd
+from utils import activity_lake
+
+INTERACTION_TYPES = ["view", "like", "share", "comment"]
+
+def synthetic_rows(interactions, users, videos, days, seed=0):
+    """(User_ID, Video_ID, Interaction_Type, timestamp) rows over the last days, mostly views."""
+    rng = random.Random(seed)
+    end = datetime(2024, 6, 1)
+    return [(f"user_{rng.randrange(users)}", f"video_{rng.randrange(videos)}",
+             rng.choices(INTERACTION_TYPES, weights=[10, 3, 1, 1])[0],
+             end - timedelta(seconds=rng.randrange(days * 86400)))
+            for _ in range(interactions)]
+
+def timed(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def directory_stats(root):
+    files = [os.path.join(directory, name) for directory, _, names in os.walk(root) for name in names]
+    return len(files), sum(os.path.getsize(path) for path in files)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interactions", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--videos", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--appends", type=int, default=200, help="single-interaction appends before compacting")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="sparkplay-lake-bench-")
+    rows = synthetic_rows(args.interactions, args.users, args.videos, args.days)
+    json_path = os.path.join(directory, "interactions.json")
+    lake = os.path.join(directory, activity_lake.ACTIVITY_LAKE_DIR)
+    frame = pd.DataFrame([row[:3] for row in rows], columns=activity_lake.ACTIVITY_COLUMNS)
+    frame.to_json(json_path, orient="records", lines=True)
+    activity_lake.append(rows, root=lake)
+
+    def json_read():
+        return pd.read_json(json_path, lines=True)
+
+    def json_log():
+        # Read, union and overwrite: what logging one interaction cost with the JSON file
+        updated = pd.concat([json_read(), pd.DataFrame([("user_0", "video_0", "view")], columns=activity_lake.ACTIVITY_COLUMNS)])
+        updated.to_json(json_path, orient="records", lines=True)
+
+    since = datetime(2024, 6, 1) - timedelta(days=7)
+    user = next(row[0] for row in rows if row[2] == "like" and row[3] >= since)
+
+    def user_query():
+        return activity_lake.read(["Video_ID"], root=lake, users=[user], interaction_types=["like"], since=since)
+
+    print(f"interactions={args.interactions:,} users={args.users:,} days={args.days} appends={args.appends}")
+    json_seconds, _ = timed(json_log, 1)
+    lake_seconds, _ = timed(lambda: activity_lake.append([(user, "video_0", "view")], root=lake))
+    print(f"log one interaction: json rewrite {json_seconds * 1e3:,.1f} ms, lake append {lake_seconds * 1e3:.2f} ms")
+
+    seconds, result = timed(json_read, 1)
+    print(f"{'json full scan':<35} {seconds * 1e3:>7.1f} ms {len(result):>10,} rows")
+    for _ in range(args.appends):
+        activity_lake.append([(rows[random.randrange(len(rows))][0], "video_1", "view")], root=lake)
+    for label in ("before compaction", "after compaction"):
+        if label == "after compaction":
+            start = time.perf_counter()
+            activity_lake.compact(lake, min_files=2)
+            print(f"compaction {time.perf_counter() - start:.2f}s")
+        files, size = directory_stats(lake)
+        seconds, result = timed(lambda: activity_lake.read(root=lake))
+        print(f"{'lake full scan, ' + label:<35} {seconds * 1e3:>7.1f} ms {len(result):>10,} rows ({files:,} files, {size / 1e6:.1f} MB)")
+        seconds, result = timed(user_query)
+        print(f"{'lake one user, 7 days of likes':<35} {seconds * 1e3:>7.1f} ms {len(result):>10,} rows")
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""The old placeholder recommend_videos against the ALS engines, on synthetic interactions.
+
+    python benchmarks/als_bench.py --users 10000 --videos 2000 --interactions 200000 --sample 5
+    python benchmarks/als_bench.py --engines local
+
+The placeholder and spark engines need pyspark and a Java runtime; local (utils.local_als,
+the in-process counterpart the compute backend uses below its Spark threshold) does not.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils import local_als, spark_als
+
+def placeholder_recommend(user_activity_df, user_id, num_recommendations=3):
+    """recommend_videos as it was: one Spark job per candidate video."""
+    from pyspark.sql.functions import col
+    user_interactions = user_activity_df.filter(col("User_ID") == user_id)
+    all_videos = user_activity_df.select("Video_ID").distinct().rdd.flatMap(lambda x: x).collect()
+    recommended_videos = [video for video in all_videos if video not in user_interactions.select("Video_ID").rdd.flatMap(lambda x: x).collect()]
+    return recommended_videos[:num_recommendations]
+
+def synthetic_activity(users, videos, interactions, seed=0):
+    """Activity store records with a popularity skew, as utils.user_activity keeps them."""
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(videos)]
+    activity = {}
+    for _ in range(interactions):
+        username = f"user_{rng.randrange(users)}"
+        video_id = f"video_{rng.choices(range(videos), weights)[0]}"
+        record = activity.setdefault(username, {"liked": [], "disliked": [], "comments": {}, "shares": [], "viewed": []})
+        kind = rng.choices(["viewed", "liked", "shares"], [0.8, 0.15, 0.05])[0]
+        if video_id not in record[kind]:
+            record[kind].append(video_id)
+    return activity
+
+def placeholder(spark, activity, sample):
+    # The placeholder reads flat (User_ID, Video_ID, Interaction_Type) rows
+    flat = spark.createDataFrame([(user, video, kind) for user, record in activity.items()
+                                  for kind in ("viewed", "liked", "shares") for video in record[kind]],
+                                 "User_ID string, Video_ID string, Interaction_Type string").cache()
+    flat.count()
+    start = time.perf_counter()
+    for username in sample:
+        placeholder_recommend(flat, username)
+    print(f"placeholder recommend_videos: {(time.perf_counter() - start) / len(sample):.2f}s per user")
+
+def spark_engine(spark, activity, sample, exclude):
+    interactions = spark_als.interactions_frame(spark, activity).cache()
+    interactions.count()
+    start = time.perf_counter()
+    model = spark_als.train(interactions, path=os.path.join(tempfile.mkdtemp(prefix="sparkplay-als-"), "model"))
+    train_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for username in sample:
+        spark_als.recommend(spark, model, [username], 3, {username: exclude[username]})
+    single_seconds = (time.perf_counter() - start) / len(sample)
+    start = time.perf_counter()
+    batch = spark_als.recommend(spark, model, sample, 3, exclude)
+    batch_seconds = time.perf_counter() - start
+
+    print(f"ALS train (incl. indexing and save): {train_seconds:.2f}s")
+    print(f"ALS recommendForUserSubset: {single_seconds:.2f}s per user, {batch_seconds:.2f}s for all {len(batch)} sampled users")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--videos", type=int, default=2000)
+    parser.add_argument("--interactions", type=int, default=200000)
+    parser.add_argument("--sample", type=int, default=5, help="users served by each engine")
+    parser.add_argument("--engines", default="placeholder,spark,local", help="comma-separated: placeholder, spark, local")
+    args = parser.parse_args()
+    engines = args.engines.split(",")
+
+    activity = synthetic_activity(args.users, args.videos, args.interactions)
+    sample = random.Random(1).sample(sorted(activity), args.sample)
+    exclude = {username: set(activity[username]["viewed"]) | set(activity[username]["liked"]) for username in sample}
+    print(f"users={args.users} videos={args.videos} interactions={args.interactions} sample={len(sample)}")
+
+    if "local" in engines:
+        start = time.perf_counter()
+        model = local_als.train(activity)
+        train_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for username in sample:
+            model.recommend([username], 3, {username: exclude[username]})
+        single_seconds = (time.perf_counter() - start) / len(sample)
+        print(f"local ALS train: {train_seconds:.2f}s; recommend: {single_seconds * 1e3:.2f} ms per user")
+    if "placeholder" not in engines and "spark" not in engines:
+        return
+
+    from pyspark.sql import SparkSession
+    spark = SparkSession.builder.appName("ALS benchmark").config("spark.driver.memory", "2g").getOrCreate()
+    spark.sparkContext.setLogLevel("WARN")
+    if "placeholder" in engines:
+        placeholder(spark, activity, sample)
+    if "spark" in engines:
+        spark_engine(spark, activity, sample, exclude)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Cold-start time of the compute backends: process start to the first activity query and recommendation.
+
+    python benchmarks/backend_startup_bench.py --users 2000 --runs 3
+    python benchmarks/backend_startup_bench.py --backends local
+
+Each run is a fresh Python process on a synthetic store, so Spark pays its JVM startup as it
+would when the app starts. The spark backend needs pyspark and a Java runtime.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+def make_store(directory, users, videos=200, seed=0):
+    """Write an activity store and an activity lake of the kind main.py reads."""
+    from utils import activity_lake
+    from utils.file_store import write_json
+    rng = random.Random(seed)
+    activity, rows = {}, []
+    for i in range(users):
+        username = f"user_{i}"
+        viewed = [f"video_{rng.randrange(videos)}" for _ in range(rng.randint(1, 12))]
+        activity[username] = {"liked": viewed[:2], "disliked": [], "comments": {}, "shares": [], "viewed": viewed}
+        rows += [(username, video_id, "view") for video_id in viewed]
+    write_json(os.path.join(directory, "user_activity.json"), activity)
+    activity_lake.append(rows, root=os.path.join(directory, activity_lake.ACTIVITY_LAKE_DIR))
+
+def child(backend_name):
+    """Run in the benchmark's subprocess: time the first queries and print them as JSON."""
+    timings = {}
+    start = time.perf_counter()
+    from utils import compute_backend
+    from utils.activity_lake import ACTIVITY_LAKE_DIR
+    backend = compute_backend.SPARK if backend_name == "spark" else compute_backend.LOCAL
+    timings["import"] = time.perf_counter() - start
+    start = time.perf_counter()
+    frame = backend.read_activity(ACTIVITY_LAKE_DIR)
+    count = frame.count() if backend_name == "spark" else len(frame)
+    timings["first_query"] = time.perf_counter() - start
+    start = time.perf_counter()
+    backend.recommend("user_0", 3, exclude={"video_0"})
+    timings["first_recommendation"] = time.perf_counter() - start
+    start = time.perf_counter()
+    backend.recommend("user_1", 3)
+    timings["warm_recommendation"] = time.perf_counter() - start
+    timings["rows"] = count
+    print(json.dumps(timings))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--backends", default="local,spark")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    directory = tempfile.mkdtemp(prefix="sparkplay-backend-bench-")
+    make_store(directory, args.users)
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    print(f"users={args.users} runs={args.runs}")
+    print(f"{'backend':<8} {'total s':>8} {'import s':>9} {'query s':>8} {'1st rec s':>10} {'warm rec s':>11}")
+    for backend in args.backends.split(","):
+        results = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", backend],
+                                     cwd=directory, env=env, capture_output=True, text=True)
+            total = time.perf_counter() - start
+            if process.returncode != 0:
+                print(f"{backend:<8} failed: {process.stderr.strip().splitlines()[-1]}")
+                break
+            results.append(dict(json.loads(process.stdout.strip().splitlines()[-1]), total=total))
+        if results:
+            median = {key: statistics.median(result[key] for result in results) for key in results[0]}
+            print(f"{backend:<8} {median['total']:>8.2f} {median['import']:>9.2f} {median['first_query']:>8.2f} "
+                  f"{median['first_recommendation']:>10.2f} {median['warm_recommendation']:>11.3f}")
+
+if __name__ == "__main__":
+    main()
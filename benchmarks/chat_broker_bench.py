@@ -0,0 +1,101 @@
+"""Latency and throughput of the live chat broker with many concurrent conversations.
+
+    python benchmarks/chat_broker_bench.py --conversations 500 --subscribers 2 --messages 20
+    python benchmarks/chat_broker_bench.py --with-store   # persist through send_user_message too
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils import chat_broker, chat_store
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--conversations", type=int, default=500)
+    parser.add_argument("--subscribers", type=int, default=2, help="subscribers per conversation")
+    parser.add_argument("--messages", type=int, default=20, help="messages per conversation")
+    parser.add_argument("--publishers", type=int, default=8, help="publishing threads")
+    parser.add_argument("--with-store", action="store_true", help="send through utils.user_activity.send_user_message")
+    args = parser.parse_args()
+
+    if args.with_store:
+        os.chdir(tempfile.mkdtemp(prefix="sparkplay-chat-bench-"))
+    from utils.user_activity import send_user_message
+
+    broker = chat_broker.get_broker()
+    pairs = [(f"user_{i}", f"peer_{i}") for i in range(args.conversations)]
+    keys = [chat_store.user_conversation_key(a, b) for a, b in pairs]
+    expected = args.conversations * args.subscribers * args.messages
+    latencies = []
+    done = threading.Event()
+
+    async def consume(subscription):
+        for _ in range(args.messages):
+            message = await subscription.get()
+            if "sent" in message:
+                latencies.append(time.perf_counter() - message["sent"])
+            else:  # Stored messages: measure from the timestamp taken before persisting
+                latencies.append((datetime.now() - datetime.fromisoformat(message["timestamp"])).total_seconds())
+        if len(latencies) >= expected:
+            done.set()
+
+    for key in keys:
+        for _ in range(args.subscribers):
+            subscription = broker.subscribe(key)
+            asyncio.run_coroutine_threadsafe(consume(subscription), broker.loop)
+
+    def publish(worker):
+        for n in range(args.messages):
+            for i in range(worker, args.conversations, args.publishers):
+                sender, recipient = pairs[i]
+                if args.with_store:
+                    send_user_message(sender, recipient, f"message {n}")
+                else:
+                    broker.publish(keys[i], {"sender": sender, "message": f"message {n}", "sent": time.perf_counter()})
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=publish, args=(w,)) for w in range(args.publishers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.wait(timeout=60)
+    elapsed = time.perf_counter() - start
+
+    sent = args.conversations * args.messages
+    print(f"conversations={args.conversations} subscribers/conv={args.subscribers} messages={sent} "
+          f"store={'on' if args.with_store else 'off'}")
+    print(f"delivered {len(latencies)}/{expected} in {elapsed:.3f}s "
+          f"-> {sent / elapsed:,.0f} msgs/s published, {len(latencies) / elapsed:,.0f} deliveries/s")
+    if latencies:
+        print(f"latency p50={percentile(latencies, 0.50) * 1e3:.3f}ms "
+              f"p99={percentile(latencies, 0.99) * 1e3:.3f}ms "
+              f"mean={statistics.mean(latencies) * 1e3:.3f}ms")
+    print(f"broker stats: {broker.stats}")
+
+    # Unloaded latency: one message in flight at a time
+    ping = broker.subscribe("bench+ping")
+    idle = []
+    for _ in range(200):
+        sent = time.perf_counter()
+        broker.publish("bench+ping", {"sent": sent})
+        asyncio.run_coroutine_threadsafe(ping.get(), broker.loop).result()
+        idle.append(time.perf_counter() - sent)
+    print(f"idle publish->receive latency p50={percentile(idle, 0.50) * 1e3:.3f}ms "
+          f"p99={percentile(idle, 0.99) * 1e3:.3f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Offline quality and latency of the recommenders on synthetic interactions, split by time.
+
+    python benchmarks/recommender_eval.py --users 1000,100000,1000000 --k 10
+    python benchmarks/recommender_eval.py --users 1000 --engines dense-baseline,neighbour-index
+
+Every dataset is cut at one point in time: activity before it is what each engine is built
+from, the videos a user liked or viewed after it (and had not seen before) are what it should
+recommend. Per engine and dataset size it prints build time, peak memory (RSS growth of the
+forked process that builds and serves it), p50/p99 latency of one user's recommendations, and
+recall@k, NDCG@k and catalog coverage over the sampled users.
+
+Engines:
+    dense-baseline   the original recommend_videos_cf (dense matrix, cosine_similarity per call)
+    item-similarity  utils.item_similarity, the incrementally maintained model
+    neighbour-index  utils.neighbour_index top-K index
+    cf+content       recommend_videos_cf as served: neighbour index blended with TF-IDF content
+    batch            utils.batch_recommendations, everyone scored up front, served by lookup
+    popularity       utils.popularity genre/location lists (the cold-start engine)
+    als              utils.spark_als (recommend_videos); needs pyspark and a Java runtime
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils.batch_recommendations import score_chunk, similarity_matrix, CHUNK_CELLS
+from utils.content_similarity import ContentModel, blend_scores
+from utils.item_similarity import ItemSimilarity, ratings_matrix, LIKE_WEIGHT, VIEW_WEIGHT
+from utils.neighbour_index import NeighbourIndex, top_k_neighbours, write_index
+from utils.popularity import Popularity
+from utils.video_sets import ActivitySets, VideoIndex
+
+GENRES = ["Action", "Comedy", "Music"]
+LOCATIONS = ["Delhi", "London", "USA", "Singapore"]
+GENRE_WORDS = {
+    "Action": "explosive chase stunt battle mission agent rivals danger revenge escape",
+    "Comedy": "hilarious prank sitcom laughs awkward roommates parody standup quirky family",
+    "Music": "concert album acoustic beats symphony vocals festival remix rhythm ballad",
+}
+DAYS = 30
+TEST_FRACTION = 0.2  # Share of the time span held out for testing
+
+class Dataset:
+    """Catalog, user profiles and the train activity and test videos of one synthetic dataset."""
+
+    def __init__(self, videos, profiles, train, test):
+        self.videos = videos
+        self.profiles = profiles  # username -> {"location", "favorite_genre"}
+        self.train = train  # username -> activity record, as utils.user_activity keeps them
+        self.test = test  # username -> set of video IDs first liked or viewed after the split
+        self.activity_sets = ActivitySets.from_activity_data(train, VideoIndex(video["Video_ID"] for video in videos))
+
+    def seen(self, username):
+        activity = self.train.get(username, {})
+        return set(activity.get("liked", [])) | set(activity.get("viewed", [])) | set(activity.get("disliked", []))
+
+    def ratings(self, username):
+        """{video ID: rating} with the weights of the interaction matrix."""
+        activity = self.train.get(username, {})
+        ratings = {video_id: VIEW_WEIGHT for video_id in activity.get("viewed", [])}
+        ratings.update((video_id, LIKE_WEIGHT) for video_id in activity.get("liked", []))
+        return ratings
+
+def make_dataset(user_count, video_count, mean_events, seed=0):
+    """Users who mostly watch their favorite genre, videos with Zipf-like popularity."""
+    rng = np.random.default_rng(seed)
+    words = random.Random(seed)
+    genres = rng.integers(len(GENRES), size=video_count)
+    videos = [{"Video_ID": f"video_{i}", "Genre": GENRES[genre],
+               "Title": " ".join(words.sample(GENRE_WORDS[GENRES[genre]].split(), 2)).title(),
+               "Description": " ".join(words.sample(GENRE_WORDS[GENRES[genre]].split(), 5))}
+              for i, genre in enumerate(genres)]
+    popularity = 1.0 / (1 + rng.permutation(video_count)) ** 0.8
+    pools = []
+    for genre in range(len(GENRES)):
+        members = np.flatnonzero(genres == genre)
+        pools.append((members, np.cumsum(popularity[members]) / popularity[members].sum()))
+    everything = (np.arange(video_count), np.cumsum(popularity) / popularity.sum())
+
+    favorite = rng.integers(len(GENRES), size=user_count)
+    location = rng.integers(len(LOCATIONS), size=user_count)
+    counts = rng.geometric(1.0 / mean_events, size=user_count)
+    users = np.repeat(np.arange(user_count), counts)
+    event_count = len(users)
+    video = np.empty(event_count, dtype=np.int64)
+    draws = rng.random(event_count)
+    in_genre = rng.random(event_count) < 0.8
+    for genre, (members, cumulative) in enumerate(pools):
+        chosen = in_genre & (favorite[users] == genre)
+        video[chosen] = members[np.minimum(np.searchsorted(cumulative, draws[chosen]), len(members) - 1)]
+    video[~in_genre] = np.minimum(np.searchsorted(everything[1], draws[~in_genre]), video_count - 1)
+    timestamps = rng.random(event_count) * DAYS * 86400
+    liked = rng.random(event_count) < 0.25
+    shared = rng.random(event_count) < 0.05
+
+    cutoff = DAYS * 86400 * (1 - TEST_FRACTION)
+    order = np.lexsort((timestamps, users))
+    bounds = np.searchsorted(users[order], np.arange(user_count + 1))
+    profiles, train, test = {}, {}, {}
+    for user in range(user_count):
+        username = f"user_{user}"
+        profiles[username] = {"location": LOCATIONS[location[user]], "favorite_genre": GENRES[favorite[user]]}
+        events = order[bounds[user]:bounds[user + 1]]
+        before = events[timestamps[events] < cutoff]
+        after = events[timestamps[events] >= cutoff]
+        if len(before):
+            viewed = list(dict.fromkeys(f"video_{i}" for i in video[before]))
+            train[username] = {"liked": list(dict.fromkeys(f"video_{i}" for i in video[before[liked[before]]])),
+                               "disliked": [], "comments": {},
+                               "shares": list(dict.fromkeys(f"video_{i}" for i in video[before[shared[before]]])),
+                               "viewed": viewed}
+        future = {f"video_{i}" for i in video[after]} - set(train.get(username, {}).get("viewed", []))
+        if future:
+            test[username] = future
+    return Dataset(videos, profiles, train, test)
+
+def top_videos(scores, video_ids, exclude, count):
+    """IDs of the `count` highest positive scores, skipping excluded videos."""
+    best = []
+    for column in np.argsort(-scores, kind="stable"):
+        if scores[column] <= 0 or len(best) == count:
+            break
+        if video_ids[column] not in exclude:
+            best.append(video_ids[column])
+    return best
+
+def build_dense_baseline(dataset, k):
+    video_ids = [video["Video_ID"] for video in dataset.videos]
+    usernames = list(dataset.train)
+    user_rows = {username: row for row, username in enumerate(usernames)}
+    video_columns = {video_id: column for column, video_id in enumerate(video_ids)}
+    matrix = np.zeros((len(usernames), len(video_ids)))
+    for username in usernames:
+        for video_id, rating in dataset.ratings(username).items():
+            matrix[user_rows[username], video_columns[video_id]] = rating
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    def serve(username):
+        if username not in user_rows:
+            return []
+        user_ratings = matrix[user_rows[username]]
+        recommendations = cosine_similarity(matrix.T).dot(user_ratings)
+        recommendations[user_ratings > 0] = -1
+        return [video_ids[i] for i in np.argsort(recommendations)[::-1][:k]]
+    return serve
+
+def build_item_similarity(dataset, k):
+    model = ItemSimilarity(dataset.activity_sets)
+    model.rebuild()
+
+    def serve(username):
+        scores = model.scores(dataset.ratings(username))
+        seen = dataset.seen(username)
+        return [video_id for video_id in sorted(scores, key=scores.get, reverse=True) if video_id not in seen][:k]
+    return serve
+
+def _build_index(dataset, directory):
+    _, ratings = ratings_matrix(dataset.activity_sets)
+    neighbours, scores = top_k_neighbours(ratings)
+    path = os.path.join(directory, "video_neighbours.idx")
+    write_index(path, dataset.activity_sets.index.video_ids, neighbours, scores)
+    return NeighbourIndex(path)
+
+def build_neighbour_index(dataset, k):
+    index = _build_index(dataset, tempfile.mkdtemp(prefix="sparkplay-eval-"))
+    return lambda username: index.recommend(dataset.ratings(username), k)
+
+def build_cf_content(dataset, k):
+    index = _build_index(dataset, tempfile.mkdtemp(prefix="sparkplay-eval-"))
+    content_model = ContentModel(dataset.videos)
+    video_ids = content_model.video_ids
+
+    def serve(username):
+        ratings = dataset.ratings(username)
+        scores = index.scores(ratings)
+        collaborative = np.array([scores.get(video_id, 0.0) for video_id in video_ids])
+        content = content_model.scores(ratings)
+        seen = [content_model.rows[video_id] for video_id in ratings]
+        collaborative[seen] = content[seen] = 0
+        return top_videos(blend_scores(collaborative, content), video_ids, ratings, k)
+    return serve
+
+def build_batch(dataset, k):
+    usernames, ratings = ratings_matrix(dataset.activity_sets)
+    similarity = similarity_matrix(ratings)
+    content_matrix = ContentModel(dataset.videos).rows_for(dataset.activity_sets.index.video_ids)
+    video_of = dataset.activity_sets.index.video_of
+    chunk_rows = max(1, CHUNK_CELLS // max(1, ratings.shape[1]))
+    stored = {}
+    for start in range(0, len(usernames), chunk_rows):
+        best = score_chunk(ratings[start:start + chunk_rows], similarity, k, content_matrix)
+        for offset, columns in enumerate(best):
+            stored[usernames[start + offset]] = [video_of(column) for column in columns if column >= 0]
+    return lambda username: stored.get(username, [])
+
+def build_popularity(dataset, k):
+    model = Popularity(dataset.activity_sets, dataset.videos, {username: profile["location"] for username, profile in dataset.profiles.items()})
+    model.rebuild()
+
+    def serve(username):
+        profile = dataset.profiles[username]
+        return model.recommend(profile["favorite_genre"], profile["location"], k, dataset.seen(username))
+    return serve
+
+def build_als(dataset, k):
+    from pyspark.sql import SparkSession
+    from utils import spark_als
+    spark = SparkSession.builder.appName("Recommender evaluation").config("spark.driver.memory", "4g").getOrCreate()
+    spark.sparkContext.setLogLevel("WARN")
+    model = spark_als.train(spark_als.interactions_frame(spark, dataset.train), path=None)
+    return lambda username: spark_als.recommend(spark, model, [username], k, {username: dataset.seen(username)}).get(username, [])
+
+# name -> (builder, largest dataset it is run on; None for no limit)
+ENGINES = {
+    "dense-baseline": (build_dense_baseline, 10000),
+    "item-similarity": (build_item_similarity, 100000),
+    "neighbour-index": (build_neighbour_index, None),
+    "cf+content": (build_cf_content, None),
+    "batch": (build_batch, None),
+    "popularity": (build_popularity, None),
+    "als": (build_als, None),
+}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def evaluate(dataset, engine, k, sample):
+    """Build and serve one engine; returns a dict of metrics."""
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    serve = ENGINES[engine][0](dataset, k)
+    build_seconds = time.perf_counter() - start
+
+    latencies, recall, ndcg, recommended = [], [], [], set()
+    for username in sample:
+        start = time.perf_counter()
+        recommendations = serve(username)[:k]
+        latencies.append(time.perf_counter() - start)
+        relevant = dataset.test[username]
+        hits = [rank for rank, video_id in enumerate(recommendations) if video_id in relevant]
+        recall.append(len(hits) / len(relevant))
+        ideal = sum(1 / math.log2(rank + 2) for rank in range(min(k, len(relevant))))
+        ndcg.append(sum(1 / math.log2(rank + 2) for rank in hits) / ideal)
+        recommended.update(recommendations)
+    return {
+        "build": build_seconds,
+        # ru_maxrss is in KiB on Linux
+        "memory": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss) / 1024,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "recall": sum(recall) / len(recall),
+        "ndcg": sum(ndcg) / len(ndcg),
+        "coverage": len(recommended) / len(dataset.videos),
+    }
+
+def _evaluate_in_child(connection, dataset, engine, k, sample):
+    try:
+        connection.send(evaluate(dataset, engine, k, sample))
+    except Exception as error:  # Report and let the other engines run
+        connection.send({"error": f"{type(error).__name__}: {error}"})
+
+def run_isolated(dataset, engine, k, sample):
+    """Evaluate in a forked process so peak memory and caches are per engine."""
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_evaluate_in_child, args=(sender, dataset, engine, k, sample))
+    process.start()
+    result = receiver.recv()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", default="1000,100000,1000000", help="comma-separated dataset sizes")
+    parser.add_argument("--videos", type=int, default=2000)
+    parser.add_argument("--events", type=float, default=10, help="mean interactions per user")
+    parser.add_argument("--engines", default=",".join(ENGINES))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--sample", type=int, default=1000, help="test users served per engine")
+    args = parser.parse_args()
+
+    print(f"{'users':>9} {'engine':<16} {'build s':>8} {'peak MB':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'recall@' + str(args.k):>10} {'NDCG@' + str(args.k):>8} {'coverage':>9}")
+    for user_count in (int(n) for n in args.users.split(",")):
+        start = time.perf_counter()
+        dataset = make_dataset(user_count, args.videos, args.events)
+        sample = random.Random(1).sample(sorted(dataset.test), min(args.sample, len(dataset.test)))
+        print(f"# {user_count} users: {sum(len(a['viewed']) for a in dataset.train.values())} train views, "
+              f"{len(dataset.test)} test users, generated in {time.perf_counter() - start:.1f}s")
+        for engine in args.engines.split(","):
+            limit = ENGINES[engine][1]
+            if limit is not None and user_count > limit:
+                print(f"{user_count:>9} {engine:<16} skipped (over {limit} users)")
+                continue
+            result = run_isolated(dataset, engine, args.k, sample)
+            if "error" in result:
+                print(f"{user_count:>9} {engine:<16} failed: {result['error']}")
+                continue
+            print(f"{user_count:>9} {engine:<16} {result['build']:>8.2f} {result['memory']:>8.1f} {result['p50']:>8.2f} "
+                  f"{result['p99']:>8.2f} {result['recall']:>10.4f} {result['ndcg']:>8.4f} {result['coverage']:>9.3f}")
+
+if __name__ == "__main__":
+    main()
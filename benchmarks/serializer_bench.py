@@ -0,0 +1,82 @@
+"""Load/save time and file size of the store serializers on synthetic user datasets.
+
+    python benchmarks/serializer_bench.py --users 10000,100000,1000000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils import serializers
+from utils.file_store import read_json, write_json
+
+def make_datasets(user_count, video_count=200, seed=0):
+    """Return (user_data, activity_data) shaped like user_data.json and user_activity.json."""
+    rng = random.Random(seed)
+    videos = [f"video_{i}" for i in range(video_count)]
+    user_data, activity_data = {}, {}
+    for i in range(user_count):
+        username = f"user_{i}"
+        user_data[username] = {"password": f"{rng.getrandbits(64):016x}", "age": rng.randint(13, 80),
+                               "location": rng.choice(["Chennai", "Delhi", "Mumbai", "Pune"]),
+                               "preferences": rng.sample(["music", "sports", "news", "comedy", "tech"], 2)}
+        viewed = rng.sample(videos, rng.randint(1, 8))
+        activity_data[username] = {"liked": viewed[:2], "disliked": [], "comments": {},
+                                   "shares": viewed[:1], "viewed": viewed}
+    return user_data, activity_data
+
+def measure(path, data, fmt, indent):
+    serializers.SERIALIZER = fmt
+    start = time.perf_counter()
+    write_json(path, data, indent=indent if fmt == "json" else None)
+    save = time.perf_counter() - start
+    gc.collect()
+    start = time.perf_counter()
+    read_json(path)
+    load = time.perf_counter() - start
+    return save, load, os.path.getsize(path)
+
+def measure_baseline(path, data):
+    """The stores before serializers existed: stdlib json, indent=4, text mode."""
+    start = time.perf_counter()
+    with open(path, "w") as file:
+        json.dump(data, file, indent=4)
+    save = time.perf_counter() - start
+    gc.collect()
+    start = time.perf_counter()
+    with open(path, "r") as file:
+        json.load(file)
+    load = time.perf_counter() - start
+    return save, load, os.path.getsize(path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", default="10000,100000,1000000", help="comma-separated dataset sizes")
+    parser.add_argument("--formats", default=",".join(serializers.FORMATS))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sparkplay-serializer-bench-")
+    print(f"{'users':>9} {'dataset':<9} {'format':<8} {'save s':>8} {'load s':>8} {'size MB':>9}")
+    for user_count in (int(n) for n in args.users.split(",")):
+        user_data, activity_data = make_datasets(user_count)
+        for name, data in (("user_data", user_data), ("activity", activity_data)):
+            for fmt in ["baseline"] + args.formats.split(","):
+                path = os.path.join(workdir, f"{name}_{user_count}.{fmt}")
+                if fmt == "baseline":
+                    save, load, size = measure_baseline(path, data)
+                else:
+                    save, load, size = measure(path, data, fmt, indent=4)
+                print(f"{user_count:>9} {name:<9} {fmt:<8} {save:>8.3f} {load:>8.3f} {size / 1e6:>9.2f}")
+                os.remove(path)
+        del user_data, activity_data
+        gc.collect()
+
+if __name__ == "__main__":
+    main()
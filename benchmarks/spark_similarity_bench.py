@@ -0,0 +1,90 @@
+"""Spark columnSimilarities top-K build against the single-node one, across partition counts.
+
+    python benchmarks/spark_similarity_bench.py --users 100000 --videos 20000 --partitions 1,2,4,8,16
+    python benchmarks/spark_similarity_bench.py --threshold 0   # exact, no DIMSUM sampling
+
+Runs Spark in local mode on all cores. The ratings are written to a temporary activity lake
+as views and likes, which the Spark build reads as it does in production; the single-node
+build gets them as a matrix. Recall is the share of the single-node top-K neighbours
+(utils.neighbour_index) that the Spark build also found. Needs pyspark and a Java runtime.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from scipy.sparse import csr_matrix
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from pyspark.sql import SparkSession
+from utils import activity_lake
+from utils.neighbour_index import top_k_neighbours, TOP_K
+from utils.spark_similarity import lake_ratings, rating_rows, top_k_similarities, SIMILARITY_THRESHOLD
+
+def synthetic_ratings(users, videos, per_user, seed=0):
+    """Users x videos ratings (like 1, view 0.5) with Zipf-like video popularity."""
+    rng = np.random.default_rng(seed)
+    counts = rng.geometric(1.0 / per_user, size=users)
+    rows = np.repeat(np.arange(users), counts)
+    popularity = np.cumsum(1.0 / np.arange(1, videos + 1) ** 0.8)
+    columns = np.minimum(np.searchsorted(popularity / popularity[-1], rng.random(len(rows))), videos - 1)
+    values = np.where(rng.random(len(rows)) < 0.25, 1.0, 0.5).astype(np.float32)
+    ratings = csr_matrix((values, (rows, columns)), shape=(users, videos))
+    ratings.data = np.minimum(ratings.data, 1.0)  # Repeated draws of a cell add up
+    return ratings
+
+def write_lake(ratings, root):
+    """Store each rating as a view, plus a like where it is 1."""
+    coo = ratings.tocoo()
+    timestamp = datetime(2024, 6, 1)
+    rows = [(f"user_{user}", f"video_{video}", "view", timestamp) for user, video in zip(coo.row.tolist(), coo.col.tolist())]
+    liked = coo.data == 1.0
+    rows += [(f"user_{user}", f"video_{video}", "like", timestamp) for user, video in zip(coo.row[liked].tolist(), coo.col[liked].tolist())]
+    activity_lake.append(rows, root=root)
+
+def recall(expected, found):
+    hits = total = 0
+    for want, got in zip(expected, found):
+        want = set(want[want >= 0])
+        hits += len(want & set(got[got >= 0]))
+        total += len(want)
+    return hits / total if total else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--videos", type=int, default=20000)
+    parser.add_argument("--per-user", type=float, default=10, help="mean rated videos per user")
+    parser.add_argument("--partitions", default="1,2,4,8,16", help="comma-separated partition counts")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    args = parser.parse_args()
+
+    ratings = synthetic_ratings(args.users, args.videos, args.per_user)
+    start = time.perf_counter()
+    expected, _ = top_k_neighbours(ratings, args.k)
+    print(f"users={args.users} videos={args.videos} ratings={ratings.nnz} k={args.k} threshold={args.threshold}")
+    print(f"{'single node':<14} {time.perf_counter() - start:>8.2f}s")
+
+    spark = SparkSession.builder.master("local[*]").appName("Similarity benchmark") \
+        .config("spark.driver.memory", "4g").getOrCreate()
+    spark.sparkContext.setLogLevel("WARN")
+    directory = tempfile.mkdtemp(prefix="sparkplay-similarity-bench-")
+    lake = os.path.join(directory, activity_lake.ACTIVITY_LAKE_DIR)
+    write_lake(ratings, lake)
+    for partitions in (int(n) for n in args.partitions.split(",")):
+        start = time.perf_counter()
+        # Columns in the synthetic matrix's order, so the two builds' neighbours compare directly
+        lake_frame, video_ids = lake_ratings(spark, lake, [f"video_{video}" for video in range(args.videos)])
+        found, _ = top_k_similarities(rating_rows(lake_frame, len(video_ids), partitions), len(video_ids), args.k, args.threshold)
+        seconds = time.perf_counter() - start
+        print(f"{partitions:>3} partitions {seconds:>8.2f}s  recall@{args.k} {recall(expected, found):.3f}")
+    shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Hammer the activity, chat and user stores from several processes and check nothing is lost.
+
+    python benchmarks/stress_activity_store.py --processes 8 --likes 300
+    SPARKPLAY_STORAGE=sqlite python benchmarks/stress_activity_store.py
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+def worker(workdir, worker_id, likes, messages):
+    os.chdir(workdir)
+    from utils import activity_log
+    from utils.user_activity import update_like, track_view, send_user_message, flush_activity
+    from utils.user_auth import sign_up
+
+    activity_log.SNAPSHOT_THRESHOLD_BYTES = 4096  # Rotate snapshots constantly under contention
+    username = f"stress_{worker_id}"
+    sign_up(username, "pw", "30", "F", "Delhi", "Action")
+    for k in range(likes):
+        update_like(username, f"video_{k}")
+        track_view(username, f"video_{k}")
+        if k % 25 == 0:
+            flush_activity()
+    for k in range(messages):
+        send_user_message(username, "stress_peer", f"message {k}")
+    # Child processes exit without running atexit handlers, so flush explicitly
+    flush_activity()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--likes", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="sparkplay-stress-")
+    os.chdir(workdir)
+    context = multiprocessing.get_context("spawn")
+    start = time.perf_counter()
+    processes = [context.Process(target=worker, args=(workdir, i, args.likes, args.messages))
+                 for i in range(args.processes)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    if any(process.exitcode != 0 for process in processes):
+        sys.exit("A worker process crashed")
+
+    from utils.user_activity import load_user_activity, fetch_user_chat
+    from utils.user_auth import load_user_data
+
+    activity_data = load_user_activity()
+    user_data = load_user_data()
+    failures = []
+    expected = {f"video_{k}" for k in range(args.likes)}
+    for i in range(args.processes):
+        username = f"stress_{i}"
+        user_activity = activity_data.get(username, {})
+        if set(user_activity.get("liked", [])) != expected:
+            failures.append(f"{username}: {len(user_activity.get('liked', []))}/{args.likes} likes")
+        if set(user_activity.get("viewed", [])) != expected:
+            failures.append(f"{username}: {len(user_activity.get('viewed', []))}/{args.likes} views")
+        if username not in user_data:
+            failures.append(f"{username}: sign-up lost")
+        sent = [m for m in fetch_user_chat(username, "stress_peer") if m.get("sender") == username]
+        if len(sent) != args.messages:
+            failures.append(f"{username}: {len(sent)}/{args.messages} messages")
+
+    events = args.processes * (2 * args.likes + args.messages + 1)
+    print(f"{args.processes} processes, {events} writes in {elapsed:.2f}s ({events / elapsed:.0f} writes/s), data in {workdir}")
+    if failures:
+        print("LOST UPDATES:")
+        for failure in failures:
+            print("  " + failure)
+        sys.exit(1)
+    print("OK: no events lost")
+
+if __name__ == "__main__":
+    main()
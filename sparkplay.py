@@ -1,14 +1,19 @@
 import streamlit as st
 import os
-import json
 import numpy as np
 import smtplib
 import random
+import time
 from email.mime.text import MIMEText
-from sklearn.metrics.pairwise import cosine_similarity
-from utils.user_auth import login, sign_up
+from utils.user_auth import login, sign_up, load_user_data
+from utils.batch_recommendations import get_recommendations as get_batch_recommendations
+from utils.cf_recommendations import recommend as recommend_videos_cf
+from utils.popularity import is_cold_start, cold_start_recommendations, fallback_recommendations
+from utils.derived_models import warm_up as warm_up_derived_models, ready as derived_models_ready
+from utils.next_video import get_model as get_next_video_model
+from utils.recommendation_cache import recommendation_cache, model_version as recommendation_model_version
 from utils.user_activity import (update_like, update_dislike, add_comment, share_video, track_view)
-from utils.user_activity import (get_user_activity, update_like, update_dislike, add_comment, share_video, fetch_chat_messages, send_chat_message, track_view, send_user_message, fetch_user_chat)
+from utils.user_activity import (get_user_activity, update_like, update_dislike, add_comment, share_video, fetch_chat_messages, send_chat_message, track_view, send_user_message, fetch_user_chat_updates, subscribe_user_chat)
 from utils.data import video_metadata  # Import video metadata from a separate file
 from users.developer import developer_dashboard
 from users.data_analyst import data_analyst_dashboard
@@ -18,15 +23,9 @@ from users.system_administrator import system_administrator_dashboard
 from users.admin import admin_dashboard
 from tensorflow.keras.models import load_model
 import cv2
-from pyspark.sql import SparkSession
-from pyspark.sql.functions import col
-from pyspark.sql.types import StringType, StructType, StructField
-
-# Initialize Spark Session
-spark = SparkSession.builder \
-    .appName("Video Recommendation App") \
-    .config("spark.driver.memory", "2g") \
-    .getOrCreate()
+# Spark is started on first use, and only for data above the threshold (see utils.compute_backend)
+from utils.compute_backend import get_backend, activity_store_paths
+from utils.activity_lake import ACTIVITY_LAKE_DIR
 
 # Set up Streamlit page
 st.set_page_config(page_title="Sparkplay", layout="wide")
@@ -41,8 +40,6 @@ if "show_signup" not in st.session_state:
     st.session_state.show_signup = False
 if "current_video" not in st.session_state:
     st.session_state.current_video = None
-if "user_interactions" not in st.session_state:
-    st.session_state.user_interactions = []
 if "history" not in st.session_state:
     st.session_state.history = []
 if "liked_videos" not in st.session_state:
@@ -61,6 +58,9 @@ MODEL_PATH = "video_classification_model.h5"
 FRAMES_PER_VIDEO = 30
 FRAME_SIZE = (64, 64)
 CATEGORIES = ["Action", "Comedy", "Music"] 
+CHAT_HISTORY_LIMIT = 50  # Messages loaded when a chat is first opened
+CHAT_REFRESH_SECONDS = 1  # How often the chat panel checks for new messages
+CHAT_POLL_FALLBACK_SECONDS = 10  # Re-read the store anyway, for senders on other app processes
 
 # Load the video classification model
 model = load_model("video_classification_model.h5")
@@ -140,84 +140,71 @@ def send_otp(email):
 
 # Function to fetch user_ids dynamically
 def fetch_user_ids():
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "r") as file:
-            user_data = json.load(file)
-        return list(user_data.keys())
-    return []
-
-# Function to load user activity as a PySpark DataFrame
-def load_user_activity():
-    schema = StructType([
-        StructField("User_ID", StringType(), True),
-        StructField("Video_ID", StringType(), True),
-        StructField("Interaction_Type", StringType(), True)
-    ])
-
-    if os.path.exists(USER_ACTIVITY_FILE):
-        return spark.read.json(USER_ACTIVITY_FILE, schema=schema)
-    else:
-        return spark.createDataFrame([], schema=schema)
+    return list(load_user_data().keys())
+
+# Function to load user activity as a DataFrame (PySpark for large data, pandas otherwise). The filters are
+# pushed down to the Parquet activity lake, so only matching partitions, row groups and columns are read
+def load_user_activity(user_id=None, interaction_types=None, since=None, columns=None):
+    users = [user_id] if user_id is not None else None
+    return get_backend([ACTIVITY_LAKE_DIR]).read_activity(ACTIVITY_LAKE_DIR, columns, users=users,
+                                                          interaction_types=interaction_types, since=since)
     
-# Function to create an interaction matrix
-def create_interaction_matrix(user_interactions, video_metadata, user_ids):
-    video_ids = [video["Video_ID"] for video in video_metadata]
-    interaction_matrix = np.zeros((len(user_ids), len(video_ids)))
-    for interaction in user_interactions:
-        user_idx = user_ids.index(interaction["User_ID"])
-        video_idx = video_ids.index(interaction["Video_ID"])
-        if interaction["Interaction_Type"] == "like":
-            interaction_matrix[user_idx, video_idx] = 1
-        elif interaction["Interaction_Type"] == "view":
-            interaction_matrix[user_idx, video_idx] = 0.5
-    return interaction_matrix
-
-# Function to recommend videos
-def recommend_videos_cf(user_id, interaction_matrix, video_metadata, user_ids, num_recommendations=3):
-    video_ids = [video["Video_ID"] for video in video_metadata]
-    user_idx = user_ids.index(user_id)
-    user_ratings = interaction_matrix[user_idx]
-
-    # Calculate video similarity
-    video_similarity = cosine_similarity(interaction_matrix.T)
-
-    # Compute recommendation scores
-    recommendations = video_similarity.dot(user_ratings)
-    recommendations[user_ratings > 0] = -1  # Exclude watched/liked videos
-
-    # Get top recommendations
-    recommended_video_indices = np.argsort(recommendations)[::-1][:num_recommendations]
-    return [video_metadata[i] for i in recommended_video_indices]
-
-# Function to log user activity
-def log_user_activity(user_id, video_id, interaction_type):
-    user_activity_df = load_user_activity()
-
-    # Create a new row for the interaction
-    new_interaction = [(user_id, video_id, interaction_type)]
-    new_interaction_df = spark.createDataFrame(new_interaction, ["User_ID", "Video_ID", "Interaction_Type"])
-
-    # Append the new interaction
-    updated_user_activity_df = user_activity_df.union(new_interaction_df)
-
-    # Save updated activity back to JSON
-    updated_user_activity_df.write.json(USER_ACTIVITY_FILE, mode="overwrite")
-
-# Function to recommend videos using collaborative filtering
+# Function to compute a user's recommendations: precomputed by the batch job unless their activity changed since
+# (new users with next to no activity get popularity lists instead)
+def compute_recommendations(username):
+    if is_cold_start(get_user_activity(username)):
+        video_ids = cold_start_recommendations(username)
+    else:
+        video_ids = get_batch_recommendations(username)
+    if video_ids is not None:
+        videos_by_id = {video["Video_ID"]: video for video in video_metadata}
+        return [videos_by_id[video_id] for video_id in video_ids if video_id in videos_by_id]
+    return recommend_videos_cf(username, video_metadata)
+
+# Function to get popular videos of the user's genre and location, for when others take too long; it never waits
+# for the models to load (see utils.popularity.fallback_recommendations)
+def popular_recommendations(username, exclude=(), num_recommendations=3):
+    videos_by_id = {video["Video_ID"]: video for video in video_metadata}
+    return [videos_by_id[video_id] for video_id in fallback_recommendations(username, num_recommendations, exclude) if video_id in videos_by_id]
+
+# Function to recommend videos using collaborative filtering (implicit-feedback ALS: utils.spark_als on Spark,
+# utils.local_als in-process for small stores)
 def recommend_videos(user_id, num_recommendations=3):
-    user_activity_df = load_user_activity()
-
-    # Filter interactions for the current user
-    user_interactions = user_activity_df.filter(col("User_ID") == user_id)
-
-    # Get all video IDs
-    all_videos = user_activity_df.select("Video_ID").distinct().rdd.flatMap(lambda x: x).collect()
-
-    # Calculate recommendation scores (placeholder similarity logic)
-    recommended_videos = [video for video in all_videos if video not in user_interactions.select("Video_ID").rdd.flatMap(lambda x: x).collect()]
-
-    # Return top recommendations
-    return recommended_videos[:num_recommendations]
+    # Leave out what the user already watched or liked
+    user_activity = get_user_activity(user_id)
+    seen = set(user_activity.get("viewed", [])) | set(user_activity["liked"])
+    return get_backend(activity_store_paths()).recommend(user_id, num_recommendations, exclude=seen)
+
+# Function to render the live chat panel; it reruns on its own without rerunning the page
+@st.fragment(run_every=CHAT_REFRESH_SECONDS)
+def render_chat(username, recipient):
+    st.subheader(f"Chat with {recipient}")
+
+    chat_state = st.session_state.setdefault(f"chat_{recipient}", {"cursor": None, "messages": [], "subscription": None, "last_poll": 0.0})
+    if chat_state["subscription"] is None:
+        chat_state["subscription"] = subscribe_user_chat(username, recipient)
+
+    # Only read the store when the broker announced new messages (or the fallback poll is due)
+    notified = chat_state["subscription"].drain()
+    if chat_state["cursor"] is None or notified or time.time() - chat_state["last_poll"] > CHAT_POLL_FALLBACK_SECONDS:
+        new_messages, chat_state["cursor"], reset = fetch_user_chat_updates(
+            username, recipient, chat_state["cursor"], last=CHAT_HISTORY_LIMIT)
+        chat_state["messages"] = new_messages if reset else chat_state["messages"] + new_messages
+        chat_state["last_poll"] = time.time()
+
+    st.divider()
+    st.write("Messages:")
+    for msg in chat_state["messages"]:
+        st.markdown(f"**{msg['sender']}**: {msg['message']} (_{msg['timestamp']}_)")
+
+    # Input for new message
+    new_message = st.text_input("Type your message", key="new_message_input")
+    if st.button("Send", key="send_message_button"):
+        if new_message.strip():
+            send_user_message(username, recipient, new_message)
+            st.rerun(scope="fragment")
+        else:
+            st.error("Message cannot be empty!")
 
 # Top-right buttons for Sign In, Sign Up, and Logout
 col1, col2, col3, col4 = st.columns([7, 1, 1, 1])
@@ -448,6 +435,9 @@ if not st.session_state.logged_in:
         """
         )
 
+# Load the recommendation models in the background, so no page waits for them (only the first rerun starts it)
+warm_up_derived_models()
+
 # Fetch user_ids dynamically
 user_ids = fetch_user_ids()
 
@@ -487,11 +477,7 @@ if st.session_state.logged_in:
         # Function to fetch user activity
         def fetch_user_activity(username):
             """Fetch activity data for the given user."""
-            if os.path.exists(USER_ACTIVITY_FILE):
-                with open(USER_ACTIVITY_FILE, "r") as file:
-                    user_activity = json.load(file)
-                return user_activity.get(username, {})
-            return {}
+            return get_user_activity(username)
 
         # Sidebar for chat toggle and chat recipient selection
         st.sidebar.subheader("Options")
@@ -548,10 +534,9 @@ if st.session_state.logged_in:
                 st.video(f"Videos_Data/{st.session_state.current_video}.mp4")
                 st.caption(f"Currently Watching: {st.session_state.current_video}")
 
-                # Update history and interactions
+                # Update history and record the view
                 if st.session_state.current_video not in st.session_state.history:
                     st.session_state.history.append(st.session_state.current_video)
-                st.session_state.user_interactions.append({"User_ID": st.session_state.username, "Video_ID": st.session_state.current_video, "Interaction_Type": "view"})
                 track_view(st.session_state.username, st.session_state.current_video)
 
                 # Interaction buttons
@@ -577,9 +562,13 @@ if st.session_state.logged_in:
                         else:
                             st.error("Comment cannot be empty!")
 
-                # Display recommended videos
-                interaction_matrix = create_interaction_matrix(st.session_state.user_interactions, video_metadata, user_ids)
-                recommendations = recommend_videos_cf(st.session_state.username, interaction_matrix, video_metadata, user_ids)
+                # Display recommended videos, cached until the user's activity or the models change; if computing
+                # them takes longer than the serving deadline, show popular videos and use the result on the next rerun
+                username = st.session_state.username
+                recommendations = recommendation_cache.get_within(
+                    username, recommendation_model_version(len(video_metadata)),
+                    lambda: compute_recommendations(username),
+                    lambda: popular_recommendations(username, exclude=st.session_state.history))
 
                 st.subheader("Recommended Videos")
                 recommended_cols = st.columns(3)
@@ -590,6 +579,26 @@ if st.session_state.logged_in:
                         if st.button(f"Play {video['Title']}", key=f"play_{video['Video_ID']}"):
                             st.session_state.current_video = video["Video_ID"]
                             st.experimental_set_query_params(rerun="true")
+
+                # Up next: what viewers most often watched after this video (and the one before it); the row
+                # appears once the background warm-up has loaded the model, so rendering never waits for it
+                history = st.session_state.history
+                position = history.index(st.session_state.current_video)
+                up_next_ids = []
+                if derived_models_ready():
+                    up_next_ids = get_next_video_model().up_next(st.session_state.current_video, history[position - 1] if position else None,
+                                                                 count=3, exclude=history)
+                videos_by_id = {video["Video_ID"]: video for video in video_metadata}
+                up_next = [videos_by_id[video_id] for video_id in up_next_ids if video_id in videos_by_id]
+                if up_next:
+                    st.subheader("Up Next")
+                    up_next_cols = st.columns(3)
+                    for i, video in enumerate(up_next):
+                        with up_next_cols[i % 3]:
+                            st.caption(video["Title"])
+                            if st.button(f"Play {video['Title']}", key=f"next_{video['Video_ID']}"):
+                                st.session_state.current_video = video["Video_ID"]
+                                st.experimental_set_query_params(rerun="true")
             else:
                 # Show all videos
                 st.subheader("All Videos")
@@ -605,23 +614,7 @@ if st.session_state.logged_in:
         # Chat section
         if st.session_state.show_chat and recipient:
             with chat_col:
-                st.subheader(f"Chat with {recipient}")
-
-                # Fetch chat messages
-                messages = fetch_user_chat(st.session_state.username, recipient)
-                st.divider()
-                st.write("Messages:")
-                for msg in messages:
-                    st.markdown(f"**{msg['sender']}**: {msg['message']} (_{msg['timestamp']}_)")
-
-                # Input for new message
-                new_message = st.text_input("Type your message", key="new_message_input")
-                if st.button("Send", key="send_message_button"):
-                    if new_message.strip():
-                        send_user_message(st.session_state.username, recipient, new_message)
-                        st.experimental_set_query_params(rerun="true")
-                    else:
-                        st.error("Message cannot be empty!")
+                render_chat(st.session_state.username, recipient)
 
         # Function to allow normal users to view videos offline
         def view_video_offline(video_file):
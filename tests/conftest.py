@@ -0,0 +1,45 @@
+"""Every test runs in an empty working directory of its own, where the stores' relative paths point.
+
+    python -m pytest tests
+"""
+import atexit
+import os
+import shutil
+import sys
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from utils import derived_models, neighbour_index, read_cache, user_activity
+from utils.write_behind import WriteBehindBuffer
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """An empty store in tmp_path, without the buffered events, listeners or models of earlier tests."""
+    monkeypatch.chdir(tmp_path)
+    buffer = WriteBehindBuffer(user_activity.record_events)
+    monkeypatch.setattr(user_activity, "write_buffer", buffer)
+    monkeypatch.setattr(user_activity, "_listeners", [])
+    monkeypatch.setattr(user_activity, "_recorders", [])
+    monkeypatch.setattr(user_activity, "_synced_versions", [])
+    monkeypatch.setattr(user_activity, "_snapshot", (None, {}))
+    monkeypatch.setattr(derived_models, "_models", None)
+    monkeypatch.setattr(derived_models, "_warm_up_started", False)
+    monkeypatch.setattr(neighbour_index, "_index", None)
+    monkeypatch.setattr(neighbour_index, "_index_version", None)
+    read_cache.invalidate()
+    yield tmp_path
+    buffer.flush()  # While the working directory is still tmp_path
+    if derived_models._models is not None:
+        # Saved at exit they would be written wherever the interpreter ends up
+        for model in derived_models._models.models.values():
+            atexit.unregister(model.save)
+    read_cache.invalidate()
+
+@pytest.fixture
+def repo_data(store):
+    """The store with a copy of the checked-in user_activity.json and user_data.json."""
+    for name in ("user_activity.json", "user_data.json"):
+        shutil.copy(os.path.join(REPO_ROOT, name), store / name)
+    return store
@@ -0,0 +1,23 @@
+"""The activity lake receives every flushed activity event."""
+from datetime import datetime, timedelta
+from utils import activity_lake, user_activity
+from utils.activity_log import make_event
+
+def test_flushed_events_reach_the_lake(store):
+    user_activity.track_view("ana", "video_1")
+    user_activity.update_like("ana", "video_001")  # Legacy ID, stored canonical
+    user_activity.share_video("ben", "video_2")
+    user_activity.flush_activity()
+    rows = activity_lake.read()
+    assert sorted(map(tuple, rows[activity_lake.ACTIVITY_COLUMNS].values)) == [
+        ("ana", "video_1", "like"), ("ana", "video_1", "view"), ("ben", "video_2", "share")]
+    assert activity_lake.read(users=["ana"], interaction_types=["like"])["Video_ID"].tolist() == ["video_1"]
+
+def test_backfill_adds_only_older_events(store):
+    user_activity.track_view("ana", "video_1")
+    user_activity.flush_activity()
+    old = make_event("view", "ben", "video_2")
+    old["timestamp"] = (datetime.now() - timedelta(days=3)).isoformat()
+    history = [old, make_event("view", "ana", "video_1")]  # The second one the lake already has
+    assert activity_lake.backfill(history) == 1
+    assert sorted(activity_lake.read()["User_ID"]) == ["ana", "ben"]
@@ -0,0 +1,21 @@
+"""The JSON activity store: snapshot plus event log, folded on read."""
+import json
+from utils import derived_models, user_activity
+from utils.activity_log import is_normalized
+
+def test_legacy_snapshot_is_normalized_in_memory_only(repo_data):
+    path = repo_data / "user_activity.json"
+    original = path.read_bytes()
+    assert not is_normalized(json.loads(original))  # Legacy IDs and repeats in the checked-in data
+    assert is_normalized(user_activity.load_user_activity())
+    assert path.read_bytes() == original
+    # The models loaded on the first run reflect the store as it is
+    assert derived_models.get_models().synced.current()
+
+def test_legacy_snapshot_is_written_normalized_by_the_next_snapshot(repo_data):
+    user_activity.track_view("Rohan", "video_7")
+    user_activity.flush_activity()
+    user_activity.snapshot_activity()
+    stored = json.loads((repo_data / "user_activity.json").read_text())
+    assert is_normalized(stored)
+    assert "video_7" in stored["Rohan"]["viewed"]
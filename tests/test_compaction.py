@@ -0,0 +1,67 @@
+"""Folding the event log into the snapshot, and compacting the raw history."""
+import json
+import os
+from utils import compaction, user_activity
+from utils.activity_log import append_events, make_event, read_events
+from utils.compaction import dedupe_events
+
+def event_at(timestamp, event_type, username, video_id, **fields):
+    event = make_event(event_type, username, video_id, **fields)
+    event["timestamp"] = timestamp
+    return event
+
+def test_snapshot_folds_the_log_and_archives_its_events(store):
+    user_activity.track_view("ana", "video_1")
+    user_activity.update_like("ana", "video_1")
+    user_activity.share_video("ben", "video_2")
+    user_activity.flush_activity()
+    before = user_activity.load_user_activity()
+    assert user_activity.snapshot_activity() == 3
+    assert not os.path.exists(user_activity.USER_ACTIVITY_LOG_FILE) or os.path.getsize(user_activity.USER_ACTIVITY_LOG_FILE) == 0
+    assert not os.path.exists(user_activity.USER_ACTIVITY_ROTATING_FILE)
+    assert json.loads((store / user_activity.USER_ACTIVITY_FILE).read_text()) == before
+    history = store / user_activity.USER_ACTIVITY_HISTORY_DIR
+    assert sum(len(list(read_events(str(path)))) for path in history.iterdir()) == 3
+    assert user_activity.snapshot_activity() == 0  # Nothing left to fold
+
+def test_reads_replay_a_rotation_in_progress(store):
+    user_activity.track_view("ana", "video_1")
+    user_activity.flush_activity()
+    user_activity.snapshot_activity()
+    append_events(user_activity.USER_ACTIVITY_ROTATING_FILE, [make_event("view", "ana", "video_2")])
+    append_events(user_activity.USER_ACTIVITY_LOG_FILE, [make_event("like", "ana", "video_2")])
+    assert user_activity.load_user_activity()["ana"]["viewed"] == ["video_1", "video_2"]
+    assert user_activity.snapshot_activity() == 1  # Finishes the interrupted rotation first
+    assert user_activity.load_user_activity()["ana"]["liked"] == ["video_2"]
+
+def test_dedupe_keeps_toggles_and_rewatches():
+    events = [event_at("2026-01-01T10:00:00", "view", "ana", "video_1"),
+              event_at("2026-01-01T10:00:01", "view", "ana", "video_1"),  # Back to back: dropped
+              event_at("2026-01-01T10:00:02", "like", "ana", "video_1"),
+              event_at("2026-01-01T10:00:03", "like", "ana", "video_1"),  # A toggle: kept
+              event_at("2026-01-01T10:00:04", "view", "ana", "video_1"),  # After other events: kept
+              event_at("2026-01-01T10:00:05", "comment", "ana", "video_1", comment="hi"),
+              event_at("2026-01-01T10:00:06", "comment", "ana", "video_1", comment="hi"),  # Double submit: dropped
+              event_at("2026-01-01T10:01:00", "comment", "ana", "video_1", comment="hi")]
+    kept = dedupe_events(events)
+    assert [event["timestamp"][-2:] for event in kept] == ["00", "02", "03", "04", "05", "00"]
+
+def test_compaction_dedupes_and_rolls_up_the_history(store):
+    history = store / user_activity.USER_ACTIVITY_HISTORY_DIR
+    history.mkdir()
+    old = [event_at("2020-01-01T10:00:00", "view", "ana", "video_1"), event_at("2020-01-01T11:00:00", "like", "ana", "video_1")]
+    append_events(str(history / "2020-01-01.jsonl"), old)
+    user_activity.save_user_activity({"ana": {"liked": ["video_1"], "disliked": [], "comments": {}, "shares": [], "viewed": ["video_1"]}})
+    user_activity.track_view("ben", "video_2")
+    user_activity.flush_activity()
+    append_events(user_activity.USER_ACTIVITY_LOG_FILE, [make_event("view", "ben", "video_2")])  # Another process's repeat
+    before = user_activity.load_stored_activity()
+
+    report = compaction.compact_activity(retention_days=90)
+    assert report["events_folded"] == 2
+    assert report["events_deduplicated"] == 1
+    assert report["days_rolled_up"] == 1
+    assert not (history / "2020-01-01.jsonl").exists()
+    rollups = json.loads((store / compaction.ROLLUPS_FILE).read_text())
+    assert rollups["activity"]["2020-01-01"] == {"video_1": {"view": 1, "like": 1}}
+    assert user_activity.load_stored_activity() == before
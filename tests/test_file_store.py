@@ -0,0 +1,36 @@
+"""Optimistic read-modify-write of the JSON stores."""
+from utils import file_store
+from utils.file_store import read_json, update_json, write_json
+
+def test_update_retries_on_a_concurrent_write(store):
+    write_json("counts.json", {"a": 1})
+    calls = []
+
+    def increment(data):
+        calls.append(dict(data))
+        if len(calls) == 1:
+            write_json("counts.json", {"a": 1, "b": 1})  # Another writer between the read and the write
+        data["a"] += 1
+        return data["a"]
+
+    assert update_json("counts.json", increment) == 2
+    assert calls == [{"a": 1}, {"a": 1, "b": 1}]  # Retried on the fresh data
+    assert read_json("counts.json") == {"a": 2, "b": 1}
+
+def test_update_takes_the_lock_after_its_retries(store):
+    write_json("counts.json", {"writes": 0})
+    calls = []
+
+    def always_conflicting(data):
+        calls.append(data["writes"])
+        if len(calls) <= file_store.UPDATE_RETRIES:
+            write_json("counts.json", {"writes": data["writes"] + 1})
+        data["writes"] += 100
+
+    update_json("counts.json", always_conflicting)
+    assert len(calls) == file_store.UPDATE_RETRIES + 1
+    assert read_json("counts.json") == {"writes": file_store.UPDATE_RETRIES + 100}
+
+def test_update_creates_a_missing_file(store):
+    update_json("new.json", lambda data: data.setdefault("items", []).append(1))
+    assert read_json("new.json") == {"items": [1]}
@@ -0,0 +1,38 @@
+"""The in-process ALS model retrains off the request path."""
+import threading
+from utils import local_als, user_activity
+
+def test_changed_store_retrains_in_the_background(store, monkeypatch):
+    monkeypatch.setattr(local_als, "_model", None)
+    monkeypatch.setattr(local_als, "_model_version", None)
+    monkeypatch.setattr(local_als, "_retraining", False)
+    for username, video_id in (("ana", "video_1"), ("ana", "video_2"), ("ben", "video_2")):
+        user_activity.track_view(username, video_id)
+    user_activity.flush_activity()
+    first = local_als.get_model()  # Nothing to serve yet, so trained in the call
+    assert first.usernames == ["ana", "ben"]
+
+    release, trained = threading.Event(), threading.Event()
+    train, calls = local_als.train, []
+
+    def slow_train(activity_data):
+        calls.append(len(activity_data))
+        release.wait(10)
+        model = train(activity_data)
+        trained.set()
+        return model
+
+    monkeypatch.setattr(local_als, "train", slow_train)
+    user_activity.track_view("cy", "video_3")
+    user_activity.flush_activity()
+    assert local_als.get_model() is first  # Within the interval: no retrain
+    monkeypatch.setattr(local_als, "RETRAIN_INTERVAL_SECONDS", 0)
+    assert local_als.get_model() is first  # Retraining, the old model serves
+    assert local_als.get_model() is first  # And only one retrain runs
+    release.set()
+    assert trained.wait(10)
+    for thread in threading.enumerate():
+        if thread.name == "local-als-retrain":
+            thread.join(10)
+    assert len(calls) == 1
+    assert "cy" in local_als.get_model().usernames
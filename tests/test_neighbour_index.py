@@ -0,0 +1,53 @@
+"""Whether a neighbour index still reflects the store it was built from."""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from utils import activity_lake, cf_recommendations, derived_models, neighbour_index, user_activity
+
+def test_store_built_index_goes_stale_on_a_write(store):
+    user_activity.track_view("ana", "video_1")
+    user_activity.track_view("ana", "video_2")
+    neighbour_index.build_index()
+    assert neighbour_index.get_index().current()
+    user_activity.track_view("ben", "video_3")
+    user_activity.flush_activity()
+    assert not neighbour_index.get_index().current()
+
+def test_lake_built_index_follows_the_lake(store):
+    activity_lake.append([("ana", "video_1", "view")])
+    neighbours, scores = np.full((1, 2), -1, dtype=np.int32), np.zeros((1, 2), dtype=np.float32)
+    neighbour_index.write_index(neighbour_index.NEIGHBOUR_INDEX_FILE, ["video_1"], neighbours, scores,
+                                {"lake": activity_lake.ACTIVITY_LAKE_DIR, "lake_version": activity_lake.version()})
+    index = neighbour_index.get_index()
+    assert index.current()
+    activity_lake.append([("ben", "video_1", "view")])
+    assert not index.current()
+
+def test_stale_index_serves_within_its_bound(store):
+    user_activity.track_view("ana", "video_1")
+    neighbour_index.build_index()
+    user_activity.track_view("ben", "video_3")
+    user_activity.flush_activity()
+    index = neighbour_index.get_index()
+    assert not index.current()
+    assert index.fresh()
+    assert not index.fresh(max_stale=0)
+
+def test_recommendations_use_the_index_until_its_bound(store, monkeypatch):
+    for username in ("ana", "ben"):
+        user_activity.track_view(username, "video_1")
+        user_activity.track_view(username, "video_2")
+    neighbour_index.build_index()
+    user_activity.track_view("cy", "video_3")
+    user_activity.flush_activity()
+    derived_models.get_models()  # Loaded, so only the bound keeps the stale index serving
+
+    def item_similarity_scores(rated_videos):
+        return {"video_3": 1.0}
+
+    monkeypatch.setattr(cf_recommendations, "get_similarity_model", lambda: SimpleNamespace(scores=item_similarity_scores))
+    assert cf_recommendations.collaborative_scores({"video_1": 1.0}) == pytest.approx({"video_2": 1.0})
+    index = neighbour_index.get_index()
+    index.info["built_at"] = (datetime.now() - timedelta(seconds=neighbour_index.MAX_STALE_SECONDS + 60)).isoformat()
+    assert cf_recommendations.collaborative_scores({"video_1": 1.0}) == {"video_3": 1.0}
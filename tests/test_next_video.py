@@ -0,0 +1,33 @@
+"""Up-next transitions follow every view, rewatches included."""
+from utils import derived_models, next_video, user_activity
+from utils.next_video import NextVideoModel
+
+def watch(username, *video_ids):
+    for video_id in video_ids:
+        user_activity.track_view(username, video_id)
+
+def test_rewatches_are_transitions(store):
+    model = next_video.get_model()
+    watch("ana", "video_1", "video_2", "video_1", "video_1", "video_3")
+    assert model.up_next("video_2") == ["video_1"]
+    assert model.up_next("video_1") == ["video_2", "video_3"]  # Each once; the back-to-back repeat is not one
+    assert model.up_next("video_3") == []
+
+def test_rebuild_reads_the_raw_views(store):
+    watch("ana", "video_1", "video_2", "video_1", "video_3")
+    user_activity.flush_activity()
+    model = next_video.get_model()
+    counted = (model.transitions, model.pair_transitions)
+    rebuilt = user_activity.load_derived(NextVideoModel)
+    rebuilt.rebuild()
+    assert (rebuilt.transitions, rebuilt.pair_transitions) == counted
+    assert sorted(rebuilt.up_next("video_1")) == ["video_2", "video_3"]
+    assert rebuilt.up_next("video_2") == ["video_1"]
+
+def test_views_before_the_history_come_from_the_store(repo_data):
+    # The checked-in snapshot has no raw history: its viewed lists are the watch order
+    model = derived_models.get_models().models["next_video"]
+    order = model.activity_sets.users["Test"].viewed_order
+    assert model.transitions[order[0]][order[1]] >= 1
+    watch("Test", model.activity_sets.index.video_of(order[0]))  # A rewatch continues from the last view
+    assert model.transitions[order[-1]][order[0]] >= 1
@@ -0,0 +1,51 @@
+"""Recommendations never include a video the user has already seen."""
+from utils import batch_recommendations, cf_recommendations, popularity, user_activity
+from utils.activity_log import seen_videos
+from utils.file_store import write_json
+
+def video_ids(videos):
+    return [video["Video_ID"] for video in videos]
+
+def test_seen_videos():
+    activity = {"viewed": ["video_1"], "liked": ["video_2"], "disliked": ["video_3"], "shares": ["video_4"], "comments": {}}
+    assert seen_videos(activity) == {"video_1", "video_2", "video_3", "video_4"}
+
+def test_cf_skips_viewed_and_disliked(repo_data):
+    # In the checked-in data Test viewed and disliked video_2, which weighs nothing
+    assert "video_2" in user_activity.get_user_activity("Test")["disliked"]
+    for username in user_activity.load_user_activity():
+        recommended = set(video_ids(cf_recommendations.recommend(username)))
+        assert not recommended & seen_videos(user_activity.get_user_activity(username)), username
+
+def test_cf_skips_disliked_after_viewing(store):
+    for username in ("ana", "ben", "cy"):
+        for video_id in ("video_1", "video_2", "video_4", "video_5"):
+            user_activity.track_view(username, video_id)
+    user_activity.track_view("me", "video_1")
+    user_activity.update_like("me", "video_2")
+    user_activity.track_view("me", "video_4")
+    user_activity.update_dislike("me", "video_4")
+    recommended = video_ids(cf_recommendations.recommend("me"))
+    assert len(recommended) == 3
+    assert not set(recommended) & {"video_1", "video_2", "video_4"}
+    assert recommended[0] == "video_5"  # Viewed with everything the user liked or viewed
+
+def test_cold_start_skips_shared(repo_data):
+    # In the checked-in data Rohan shared video_1, the most popular video
+    assert "video_1" in user_activity.get_user_activity("Rohan")["shares"]
+    assert "video_1" not in popularity.cold_start_recommendations("Rohan")
+    for username in user_activity.load_user_activity():
+        recommended = set(popularity.cold_start_recommendations(username))
+        assert not recommended & seen_videos(user_activity.get_user_activity(username)), username
+
+def test_batch_skips_videos_disliked_since(store):
+    write_json("user_data.json", {username: {} for username in ("ana", "ben", "me")})
+    for username in ("ana", "ben"):
+        for video_id in ("video_1", "video_2", "video_3", "video_4", "video_5"):
+            user_activity.track_view(username, video_id)
+    user_activity.track_view("me", "video_1")
+    batch_recommendations.build_recommendations()
+    before = batch_recommendations.get_recommendations("me")
+    user_activity.update_dislike("me", before[0])
+    after = batch_recommendations.get_recommendations("me")
+    assert after is not None and before[0] not in after
@@ -0,0 +1,44 @@
+"""The Spark neighbour index build against the single-node one, in local mode.
+
+Skipped without pyspark and a Java runtime.
+"""
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+
+pytest.importorskip("pyspark")
+
+from utils import activity_lake, neighbour_index
+from utils.neighbour_index import top_k_neighbours
+
+@pytest.fixture(scope="module")
+def spark():
+    from pyspark.sql import SparkSession
+    try:
+        session = SparkSession.builder.master("local[2]").appName("sparkplay tests").getOrCreate()
+    except Exception as error:  # pyspark without a Java runtime
+        pytest.skip(f"no local Spark: {error}")
+    yield session
+    session.stop()
+
+def test_lake_build_matches_single_node(store, spark):
+    from utils import spark_similarity
+    users, videos, k = 200, 30, 5
+    ratings = sparse_random(users, videos, density=0.2, format="csr", random_state=0)
+    ratings.data = np.where(ratings.data < 0.3, 1.0, 0.5)  # Like or view
+    coo = ratings.tocoo()
+    rows = [(f"user_{u}", f"video_{v}", "view") for u, v in zip(coo.row, coo.col)]
+    rows += [(f"user_{u}", f"video_{v}", "like") for u, v, r in zip(coo.row, coo.col, coo.data) if r == 1.0]
+    activity_lake.append(rows)
+
+    lake_frame, video_ids = spark_similarity.lake_ratings(spark, video_ids=[f"video_{v}" for v in range(videos)])
+    found, found_scores = spark_similarity.top_k_similarities(spark_similarity.rating_rows(lake_frame, videos, 2), videos, k, 0)
+    expected, expected_scores = top_k_neighbours(ratings, k)
+    assert video_ids == [f"video_{v}" for v in range(videos)]
+    assert np.allclose(np.sort(found_scores, axis=1), np.sort(expected_scores, axis=1), atol=1e-5)
+
+    spark_similarity.build_index(spark, k=k, threshold=0, partitions=2)
+    index = neighbour_index.get_index()
+    assert index.info["lake_version"] == activity_lake.version() and index.current()
+    activity_lake.append([("user_0", "video_0", "view")])
+    assert not index.current()
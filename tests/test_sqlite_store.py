@@ -0,0 +1,31 @@
+"""The SQLite activity store and the migration into it."""
+import os
+import threading
+import pytest
+from utils import sqlite_store, user_activity
+from utils.activity_log import append_events, make_event
+
+@pytest.fixture
+def sqlite(monkeypatch):
+    monkeypatch.setattr(sqlite_store, "_local", threading.local())  # A connection to this test's database
+    yield sqlite_store
+    conn = getattr(sqlite_store._local, "conn", None)
+    if conn is not None:
+        conn.close()
+
+def test_events_store_canonical_ids(store, sqlite):
+    sqlite.apply_events([make_event("like", "ana", "E:/videoapp/Videos_Data/video_3.mp4"),
+                         make_event("view", "ana", "video_003"), make_event("view", "ana", "video_3")])
+    assert sqlite.get_user_videos("ana", "liked") == ["video_3"]
+    assert sqlite.get_user_videos("ana", "viewed") == ["video_3"]
+
+def test_migration_includes_the_rotating_file_and_the_log(repo_data, sqlite):
+    append_events(user_activity.USER_ACTIVITY_ROTATING_FILE, [make_event("share", "Rohan", "video_9")])
+    append_events(user_activity.USER_ACTIVITY_LOG_FILE, [make_event("view", "Rohan", "video_010")])
+    expected = user_activity.load_json_activity()
+    sqlite.migrate_from_json()
+    assert os.path.exists(sqlite.SQLITE_DB_FILE)
+    assert sqlite.load_user_activity() == {username: record for username, record in expected.items()
+                                           if any(record.values())}  # Users without activity have no rows
+    rohan = sqlite.get_user_activity("Rohan")
+    assert "video_9" in rohan["shares"] and "video_10" in rohan["viewed"]
@@ -0,0 +1,52 @@
+"""Compact per-user activity (utils.video_sets) round-trips the JSON activity records."""
+import json
+import struct
+from array import array
+from utils.activity_log import fold_events, make_event
+from utils.video_sets import ActivitySets, SET_KEYS, SETS_MAGIC_V1
+
+RECORDS = {
+    "ana": {"liked": ["video_9", "video_2"], "disliked": ["video_4"], "comments": {"video_9": [{"comment": "hi", "timestamp": "t"}]},
+            "shares": ["video_7", "video_1", "video_3"], "viewed": ["video_9", "video_2", "video_4", "video_1"]},
+    "ben": {"liked": [], "disliked": [], "comments": {}, "shares": [], "viewed": ["video_5"]},
+}
+
+def test_records_round_trip_in_insertion_order():
+    assert ActivitySets.from_activity_data(RECORDS).to_activity_data() == RECORDS
+
+def test_bytes_round_trip_keeps_sets_and_order():
+    activity_sets = ActivitySets.from_activity_data(RECORDS)
+    restored = ActivitySets.from_bytes(activity_sets.to_bytes())
+    for username, record in RECORDS.items():
+        assert restored.users[username].to_activity() == dict(record, comments={})  # Comments are not serialized
+    assert (restored.matrix("liked") == activity_sets.matrix("liked")).all()
+
+def version_1_bytes(activity_sets):
+    """The blob the previous format wrote: the bitsets and only the watch order."""
+    usernames = list(activity_sets.users)
+    header = json.dumps({"videos": activity_sets.index.video_ids, "users": usernames}).encode()
+    parts = [SETS_MAGIC_V1, struct.pack("<I", len(header)), header]
+    for username in usernames:
+        compact = activity_sets.users[username]
+        for key in SET_KEYS:
+            data = compact.sets[key].to_bytes()
+            parts += [struct.pack("<I", len(data)), data]
+        order = array("i", compact.viewed_order)
+        parts += [struct.pack("<I", len(order)), order.tobytes()]
+    return b"".join(parts)
+
+def test_version_1_bytes_read_in_catalog_order():
+    legacy = ActivitySets.from_bytes(version_1_bytes(ActivitySets.from_activity_data(RECORDS)))
+    record = legacy.users["ana"].to_activity()
+    assert record["shares"] == ["video_1", "video_3", "video_7"]
+    assert record["viewed"] == RECORDS["ana"]["viewed"]
+
+def test_events_keep_recency_order():
+    events = [make_event("share", "ana", "video_3"), make_event("share", "ana", "video_1"),
+              make_event("like", "ana", "video_5"), make_event("like", "ana", "video_2"),
+              make_event("like", "ana", "video_5"), make_event("like", "ana", "video_5"),  # Unliked, then liked again
+              make_event("dislike", "ana", "video_2")]
+    record = fold_events({}, events)["ana"]
+    assert record["shares"] == ["video_3", "video_1"]
+    assert record["liked"] == ["video_5"]
+    assert record["disliked"] == ["video_2"]
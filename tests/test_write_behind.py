@@ -0,0 +1,55 @@
+"""Merging and batching in the write-behind activity buffer."""
+import pytest
+from utils.activity_log import make_event
+from utils.write_behind import WriteBehindBuffer
+
+@pytest.fixture
+def buffer():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, interval=60)  # Flushed only by the tests
+    buffer.batches = batches
+    return buffer
+
+def kinds(events):
+    return [(event["type"], event["user"], event["video"]) for event in events]
+
+def test_back_to_back_views_merge(buffer):
+    assert buffer.add(make_event("view", "ana", "video_1"))
+    assert not buffer.add(make_event("view", "ana", "video_1"))
+    assert buffer.add(make_event("view", "ben", "video_1"))  # Another user's
+    assert buffer.add(make_event("view", "ana", "video_2"))
+    assert buffer.add(make_event("view", "ana", "video_1"))  # A rewatch after video_2
+    assert buffer.queued == 4
+    assert buffer.flush() == 4
+    assert kinds(buffer.batches[0]) == [("view", "ana", "video_1"), ("view", "ben", "video_1"),
+                                        ("view", "ana", "video_2"), ("view", "ana", "video_1")]
+
+def test_shares_merge_and_toggles_do_not(buffer):
+    assert buffer.add(make_event("share", "ana", "video_1"))
+    assert buffer.add(make_event("share", "ana", "video_2"))
+    assert not buffer.add(make_event("share", "ana", "video_1"))
+    assert buffer.add(make_event("like", "ana", "video_1"))
+    assert buffer.add(make_event("like", "ana", "video_1"))
+    assert len(buffer.pending("ana")) == 4 and buffer.pending("ben") == []
+
+def test_forget_lets_repeats_through(buffer):
+    buffer.add(make_event("share", "ana", "video_1"))
+    buffer.forget()
+    assert buffer.add(make_event("share", "ana", "video_1"))
+
+def test_failed_flush_keeps_the_batch_in_order():
+    calls = []
+
+    def flush_fn(batch):
+        calls.append(list(batch))
+        if len(calls) == 1:
+            raise OSError("disk full")
+
+    buffer = WriteBehindBuffer(flush_fn, interval=60)
+    buffer.add(make_event("view", "ana", "video_1"))
+    with pytest.raises(OSError):
+        buffer.flush()
+    buffer.add(make_event("view", "ana", "video_2"))
+    assert buffer.flush() == 2
+    assert kinds(calls[1]) == [("view", "ana", "video_1"), ("view", "ana", "video_2")]
+    assert buffer.flush() == 0
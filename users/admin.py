@@ -6,6 +6,9 @@ import os
 import cv2
 import numpy as np
 from tensorflow.keras.models import load_model
+from utils.user_activity import load_user_activity
+from utils.file_store import update_json
+from utils import compaction
 
 # Paths and constants
 CLASSIFIED_VIDEO_DIR = "classified_videos"
@@ -92,15 +95,16 @@ def admin_dashboard(username):
     st.markdown("- Optimize database queries")
     st.markdown("- Clean temporary files")
     st.markdown("- Upgrade hardware as needed")
+    if st.button("Compact Activity and Chat Stores"):
+        st.text(compaction.format_report(compaction.run()))
 
     # Manage Users
     st.header("Manage Users")
-    # Load user names from user_activity.json
+    # Load user names from the activity store (snapshot plus event log)
     try:
-        with open("user_activity.json", "r") as f:
-            user_data = json.load(f)
-            user_names = list(user_data.keys())
-    except (FileNotFoundError, json.JSONDecodeError):
+        user_data = load_user_activity()
+        user_names = list(user_data.keys())
+    except ValueError:  # Corrupt store, in whichever serializer format
         user_data = {}
         user_names = []
 
@@ -179,21 +183,15 @@ def approve_video(video_id):
     """Function to approve a video."""
     try:
         approved_videos_file = "approved_videos.json"
-        approved_videos = []
 
-        # Load existing approved videos if the file exists
-        if os.path.exists(approved_videos_file):
-            with open(approved_videos_file, "r") as f:
-                approved_videos = json.load(f)
-
-        # Add the new video to the list if not already approved
-        if video_id not in approved_videos:
+        # Add the new video to the list if not already approved (locked read-modify-write)
+        def add_video(approved_videos):
+            if video_id in approved_videos:
+                return False
             approved_videos.append(video_id)
+            return True
 
-            # Save the updated list back to the file
-            with open(approved_videos_file, "w") as f:
-                json.dump(approved_videos, f)
-
+        if update_json(approved_videos_file, add_video, default_factory=list):
             st.success(f"Video {video_id} has been approved.")
         else:
             st.warning(f"Video {video_id} is already approved.")
@@ -1,4 +1,6 @@
 import streamlit as st
+from utils.read_cache import cache_stats
+from utils.recommendation_cache import recommendation_cache
 
 def developer_dashboard(username):
     """Developer Dashboard."""
@@ -13,6 +15,19 @@ def developer_dashboard(username):
     st.metric(label="Response Time", value="150 ms")
     st.metric(label="Throughput", value="500 requests/sec")
 
+    # Read cache effectiveness for the JSON stores
+    st.subheader("Storage Read Cache")
+    for store, stats in cache_stats().items():
+        lookups = stats["hits"] + stats["misses"]
+        hit_rate = stats["hits"] / lookups if lookups else 0.0
+        st.metric(label=f"{store} hit rate", value=f"{hit_rate:.0%}", delta=f"{stats['misses']} reparses", delta_color="off")
+
+    st.subheader("Recommendation Cache")
+    stats = recommendation_cache.stats()
+    st.metric(label="Recommendation hit rate", value=f"{stats['hit_rate']:.0%}", delta=f"{stats['misses']} recomputes", delta_color="off")
+    st.text(f"Cached users: {stats['entries']} | Expired: {stats['expired']} | Evicted: {stats['evictions']} | Invalidations: {stats['invalidations']}")
+    st.metric(label="Deadline fallbacks", value=f"{stats['fallback_rate']:.1%}", delta=f"{stats['fallbacks']} popular lists served", delta_color="off")
+
     # Optimize algorithms and codebase
     st.header("Optimize Algorithms and Codebase")
     if st.button("Run Performance Tests"):
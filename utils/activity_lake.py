@@ -0,0 +1,151 @@
+"""Append-only Parquet lake of (User_ID, Video_ID, Interaction_Type) interactions.
+
+    activity_lake/date=2024-05-01/Interaction_Type=view/part-<id>.parquet
+
+Every activity event is appended when the write-behind buffer flushes it to the activity store
+(user_activity.record_events); backfill() adds the store's older raw history once. An append
+writes one small file per (date, interaction type) it touches, so logging an interaction
+never rewrites what is already stored. compact() merges the small files of a
+partition into one sorted by user, whose row-group statistics then let reads skip most of
+it. read() prunes partitions by date and type, reads only the columns asked for, and pushes
+the other filters down into the Parquet scan. The same layout is what Spark's
+partitionBy("date", "Interaction_Type") writes and reads.
+"""
+import argparse
+import os
+import uuid
+from datetime import date, datetime
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from utils.file_store import file_version, locked
+from utils.video_sets import normalize_video_id
+
+ACTIVITY_LAKE_DIR = "activity_lake"
+ACTIVITY_COLUMNS = ["User_ID", "Video_ID", "Interaction_Type"]
+FILE_SCHEMA = pa.schema([("User_ID", pa.string()), ("Video_ID", pa.string()), ("Timestamp", pa.timestamp("us"))])
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string()), ("Interaction_Type", pa.string())]), flavor="hive")
+COMPACT_MIN_FILES = 8  # Partitions with at least this many files are merged
+ROW_GROUP_ROWS = 65536
+
+def partition_dir(day, interaction_type, root=ACTIVITY_LAKE_DIR):
+    return os.path.join(root, f"date={day}", f"Interaction_Type={interaction_type}")
+
+def _write_hidden(table, directory):
+    """Write table to a file the dataset scan ignores (leading '.'); returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f".part-{uuid.uuid4().hex}.parquet.tmp")
+    pq.write_table(table, path, row_group_size=ROW_GROUP_ROWS)
+    return path
+
+def append(rows, root=ACTIVITY_LAKE_DIR):
+    """Add (User_ID, Video_ID, Interaction_Type[, timestamp]) rows, one new file per partition."""
+    now = datetime.now()
+    partitions = {}
+    for row in rows:
+        timestamp = row[3] if len(row) > 3 else now
+        if isinstance(timestamp, str):
+            timestamp = datetime.fromisoformat(timestamp)
+        partitions.setdefault((timestamp.date().isoformat(), row[2]), []).append((row[0], row[1], timestamp))
+    for (day, interaction_type), partition_rows in partitions.items():
+        users, videos, timestamps = zip(*partition_rows)
+        table = pa.table([pa.array(users, pa.string()), pa.array(videos, pa.string()), pa.array(timestamps, pa.timestamp("us"))],
+                         schema=FILE_SCHEMA)
+        directory = partition_dir(day, interaction_type, root)
+        # New files only appear by rename, so a scan never sees one half-written
+        os.replace(_write_hidden(table, directory), os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"))
+    if partitions:
+        touch(root)
+    return len(rows)
+
+def touch(root=ACTIVITY_LAKE_DIR):
+    """Mark the lake as appended to, which changes its version()."""
+    os.utime(root)
+
+def version(root=ACTIVITY_LAKE_DIR):
+    """Return a token that changes whenever rows are appended to the lake."""
+    return str(file_version(root))
+
+def partition_date(value):
+    """Return the date=... partition value of a date, datetime or ISO string."""
+    return value.isoformat()[:10] if isinstance(value, (date, datetime)) else str(value)[:10]
+
+def filter_expression(users=None, videos=None, interaction_types=None, since=None, until=None):
+    """Return the pyarrow filter for the given constraints (None for no filter); since/until are inclusive."""
+    conditions = []
+    if users is not None:
+        conditions.append(ds.field("User_ID").isin(list(users)))
+    if videos is not None:
+        conditions.append(ds.field("Video_ID").isin(list(videos)))
+    if interaction_types is not None:
+        conditions.append(ds.field("Interaction_Type").isin(list(interaction_types)))
+    # The date conditions prune whole partitions; the timestamp ones trim within the boundary days
+    if since is not None:
+        conditions.append(ds.field("date") >= partition_date(since))
+        if isinstance(since, datetime):
+            conditions.append(ds.field("Timestamp") >= pa.scalar(since, pa.timestamp("us")))
+    if until is not None:
+        conditions.append(ds.field("date") <= partition_date(until))
+        if isinstance(until, datetime):
+            conditions.append(ds.field("Timestamp") <= pa.scalar(until, pa.timestamp("us")))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def read(columns=None, root=ACTIVITY_LAKE_DIR, **filters):
+    """Return a pandas DataFrame of the matching rows; filters are those of filter_expression."""
+    columns = columns or ACTIVITY_COLUMNS
+    if not os.path.isdir(root):
+        return pa.table({column: pa.array([], pa.string()) for column in columns}).to_pandas()
+    # Compaction swaps files under the exclusive lock
+    with locked(root, shared=True):
+        dataset = ds.dataset(root, format="parquet", partitioning=PARTITIONING)
+        table = dataset.to_table(columns=columns, filter=filter_expression(**filters))
+    return table.to_pandas()
+
+def backfill(events, root=ACTIVITY_LAKE_DIR):
+    """Append the raw activity events older than anything in the lake; returns how many were added.
+
+    For a lake started after the store, whose history it would otherwise lack.
+    """
+    earliest = None
+    if os.path.isdir(root):
+        timestamps = read(["Timestamp"], root=root)["Timestamp"]
+        earliest = timestamps.min() if len(timestamps) else None
+    rows = [(event["user"], normalize_video_id(event["video"]), event["type"], datetime.fromisoformat(event["timestamp"]))
+            for event in events]
+    rows = [row for row in rows if earliest is None or row[3] < earliest]
+    return append(rows, root) if rows else 0
+
+def _dir_bytes(root):
+    return sum(os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(root) for name in names)
+
+def compact(root=ACTIVITY_LAKE_DIR, min_files=COMPACT_MIN_FILES):
+    """Merge each partition's small files into one sorted by user and time; returns a report."""
+    report = {"bytes_before": _dir_bytes(root) if os.path.isdir(root) else 0, "partitions_compacted": 0, "files_merged": 0}
+    for directory, _, names in (os.walk(root) if os.path.isdir(root) else ()):
+        files = sorted(os.path.join(directory, name) for name in names if name.endswith(".parquet") and not name.startswith((".", "_")))
+        if len(files) < min_files:
+            continue
+        table = pa.concat_tables(pq.ParquetFile(path).read(columns=FILE_SCHEMA.names).cast(FILE_SCHEMA) for path in files)
+        merged = _write_hidden(table.sort_by([("User_ID", "ascending"), ("Timestamp", "ascending")]), directory)
+        # Appends meanwhile add new files, which are left alone; readers wait only for the swap
+        with locked(root):
+            os.replace(merged, os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet"))
+            for path in files:
+                os.remove(path)
+        report["partitions_compacted"] += 1
+        report["files_merged"] += len(files)
+    report["bytes_after"] = _dir_bytes(root) if os.path.isdir(root) else 0
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the small files of the activity lake.")
+    parser.add_argument("--min-files", type=int, default=COMPACT_MIN_FILES, help="merge partitions with at least this many files")
+    parser.add_argument("--backfill", action="store_true", help="first add the activity store's older raw history")
+    args = parser.parse_args()
+    if args.backfill:
+        from utils.interaction_weights import stored_events
+        print(f"Backfilled {backfill(stored_events())} events")
+    print(compact(min_files=args.min_files))
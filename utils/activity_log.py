@@ -0,0 +1,112 @@
+import json
+import os
+from datetime import datetime
+from utils.video_sets import ActivitySets, normalize_video_id
+
+# Once the log grows past this size the next write folds it into a snapshot
+SNAPSHOT_THRESHOLD_BYTES = 256 * 1024
+# The keys of a folded activity record
+FOLDED_KEYS = ("liked", "disliked", "comments", "shares", "viewed")
+
+def empty_activity():
+    """Return the default activity record for a user."""
+    return {"liked": [], "disliked": [], "comments": {}, "shares": [], "viewed": []}
+
+# Videos a user has seen in these ways are never recommended to them again
+SEEN_KEYS = ("viewed", "liked", "disliked", "shares")
+
+def seen_videos(activity):
+    """Return the set of video IDs an activity record has viewed, liked, disliked or shared."""
+    return {video_id for key in SEEN_KEYS for video_id in activity.get(key, [])}
+
+def make_event(event_type, username, video_id, **fields):
+    """Build a single activity event record."""
+    event = {
+        "type": event_type,
+        "user": username,
+        "video": video_id,
+        "timestamp": datetime.now().isoformat()
+    }
+    event.update(fields)
+    return event
+
+def append_events(log_file, events):
+    """Append events to the log as JSON lines in a single write."""
+    lines = "".join(json.dumps(event, separators=(",", ":")) + "\n" for event in events)
+    with open(log_file, "a") as file:
+        file.write(lines)
+
+def read_events(log_file):
+    """Yield the events in the log in the order they were written."""
+    if not os.path.exists(log_file):
+        return
+    with open(log_file, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Skip a torn trailing write
+
+def apply_event(activity_sets, event):
+    """Fold a single event into compact per-user activity (see utils.video_sets)."""
+    user_activity = activity_sets.user(event["user"])
+    video_index = activity_sets.index.id_of(event["video"])
+    event_type = event["type"]
+
+    if event_type == "like":
+        user_activity.toggle("liked", "disliked", video_index)
+    elif event_type == "dislike":
+        user_activity.toggle("disliked", "liked", video_index)
+    elif event_type == "comment":
+        user_activity.comments.setdefault(normalize_video_id(event["video"]), []).append({
+            "comment": event["comment"],
+            "timestamp": event["timestamp"]
+        })
+    elif event_type == "share":
+        user_activity.add("shares", video_index)
+    elif event_type == "view":
+        user_activity.view(video_index)
+    return activity_sets
+
+def fold_to_sets(activity_data, events):
+    """Replay a sequence of events on top of a snapshot, returning ActivitySets."""
+    activity_sets = ActivitySets.from_activity_data(activity_data)
+    for event in events:
+        apply_event(activity_sets, event)
+    return activity_sets
+
+def fold_events(activity_data, events):
+    """Replay a sequence of events on top of a snapshot."""
+    return fold_to_sets(activity_data, events).to_activity_data()
+
+def is_normalized(activity_data):
+    """True if folding would not change the snapshot: full records, canonical video IDs, no repeats."""
+    video_ids = set()
+    for record in activity_data.values():
+        if len(record) != len(FOLDED_KEYS) or not all(key in record for key in FOLDED_KEYS):
+            return False
+        for key in ("liked", "disliked", "shares", "viewed"):
+            videos = record[key]
+            unique = set(videos)
+            if len(unique) != len(videos):
+                return False
+            video_ids |= unique
+        video_ids.update(record["comments"])
+    return all(normalize_video_id(video_id) == video_id for video_id in video_ids)
+
+def archive_events(history_dir, events):
+    """Append events to per-day raw history files (YYYY-MM-DD.jsonl) by event timestamp."""
+    by_day = {}
+    for event in events:
+        by_day.setdefault(event["timestamp"][:10], []).append(event)
+    if by_day:
+        os.makedirs(history_dir, exist_ok=True)
+    for day, day_events in by_day.items():
+        append_events(os.path.join(history_dir, day + ".jsonl"), day_events)
+
+def needs_snapshot(log_file):
+    """Check whether the log has grown enough to be folded into a snapshot."""
+    return os.path.exists(log_file) and os.path.getsize(log_file) >= SNAPSHOT_THRESHOLD_BYTES
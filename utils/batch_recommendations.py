@@ -0,0 +1,139 @@
+"""Batch precomputation of every user's top-N recommendations.
+
+    python -m utils.batch_recommendations --top-n 10 --workers 4
+
+scores all users of user_data.json in chunks of rows (ratings x top-K video similarity, as
+sparse products), optionally across worker processes, and writes the result to a keyed store.
+Each entry carries a fingerprint of the user's likes and views, so serving can tell which
+users' activity changed since the batch and compute those on-line instead.
+"""
+import argparse
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from scipy.sparse import csr_matrix
+from utils import user_activity
+from utils.activity_log import seen_videos
+from utils.content_similarity import CONTENT_WEIGHT, blend_scores, get_content_model, profile_scores
+from utils.data import video_metadata
+from utils.file_store import read_json, write_json
+from utils.item_similarity import ratings_matrix
+from utils.neighbour_index import top_k_neighbours, TOP_K
+from utils.read_cache import cached_load
+from utils.user_auth import load_user_data
+
+RECOMMENDATIONS_FILE = "user_recommendations.json"
+TOP_N = 10
+CHUNK_CELLS = 1 << 24  # Users per chunk are chosen so a dense score block stays this small
+
+def activity_fingerprint(liked, viewed):
+    """Fingerprint of the likes and views recommendations are computed from."""
+    return zlib.crc32("\n".join(sorted(liked) + ["|"] + sorted(viewed)).encode())
+
+def similarity_matrix(ratings, k=TOP_K):
+    """Return the top-K video x video cosine similarity as a CSR matrix."""
+    neighbours, scores = top_k_neighbours(ratings, k)
+    rows = np.repeat(np.arange(neighbours.shape[0]), neighbours.shape[1])
+    valid = neighbours.ravel() >= 0
+    return csr_matrix((scores.ravel()[valid], (rows[valid], neighbours.ravel()[valid])), shape=(ratings.shape[1],) * 2)
+
+def score_chunk(ratings, similarity, top_n, content_matrix=None, candidates=None, content_weight=CONTENT_WEIGHT):
+    """Return each row's top-N unrated video columns (-1 padded) for a chunk of rating rows.
+
+    candidates -- boolean mask of the columns that may be recommended (e.g. catalog videos)
+    """
+    rated = ratings.nonzero()
+    scores = (ratings @ similarity).toarray()
+    scores[rated] = 0  # Never recommend what the user already liked or watched
+    if candidates is not None:
+        scores[:, ~candidates] = 0
+    if content_matrix is not None and content_weight:
+        content = profile_scores(ratings, content_matrix)
+        content[rated] = 0  # Rated videos would otherwise set the scale blend_scores rescales by
+        scores = blend_scores(scores, content, content_weight)
+    top_n = min(top_n, scores.shape[1])
+    best = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best[np.take_along_axis(best_scores, order, axis=1) <= 0] = -1
+    return best
+
+# Set in each worker process by _init_worker, so the matrices are sent once per worker
+_worker_state = {}
+
+def _init_worker(ratings, similarity, top_n, content_matrix, candidates):
+    _worker_state.update(ratings=ratings, similarity=similarity, top_n=top_n, content_matrix=content_matrix, candidates=candidates)
+
+def _score_rows(bounds):
+    start, end = bounds
+    state = _worker_state
+    return start, score_chunk(state["ratings"][start:end], state["similarity"], state["top_n"], state["content_matrix"], state["candidates"])
+
+def build_recommendations(top_n=TOP_N, workers=1, path=RECOMMENDATIONS_FILE):
+    """Compute and store recommendations for every registered user; returns the user count."""
+    user_activity.flush_activity()
+    version = user_activity.activity_version()
+    activity_sets = user_activity.load_activity_sets()
+    usernames, ratings = ratings_matrix(activity_sets)
+    similarity = similarity_matrix(ratings)
+    content_matrix = get_content_model(video_metadata).rows_for(activity_sets.index.video_ids)
+    # Videos no longer in the catalog still count as history, but are never recommended
+    catalog = {video["Video_ID"] for video in video_metadata}
+    candidates = np.array([video_id in catalog for video_id in activity_sets.index.video_ids])
+
+    chunk_rows = max(1, CHUNK_CELLS // max(1, ratings.shape[1]))
+    bounds = [(start, min(start + chunk_rows, len(usernames))) for start in range(0, len(usernames), chunk_rows)]
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(ratings, similarity, top_n, content_matrix, candidates)) as pool:
+            chunks = list(pool.map(_score_rows, bounds))
+    else:
+        _init_worker(ratings, similarity, top_n, content_matrix, candidates)
+        chunks = [_score_rows(chunk) for chunk in bounds]
+
+    video_of = activity_sets.index.video_of
+    registered = set(load_user_data())
+    entries = {}
+    for start, best in chunks:
+        for offset, columns in enumerate(best):
+            username = usernames[start + offset]
+            if username not in registered:
+                continue
+            activity = activity_sets.users[username].to_activity()
+            entries[username] = {
+                "videos": [video_of(column) for column in columns if column >= 0],
+                "fingerprint": activity_fingerprint(activity["liked"], activity["viewed"])
+            }
+    write_json(path, {"activity_version": version, "built_at": datetime.now().isoformat(), "users": entries})
+    return len(entries)
+
+def load_recommendations(path=RECOMMENDATIONS_FILE):
+    """Load the stored batch, cached until the file is rewritten."""
+    return cached_load(path, lambda: read_json(path))
+
+def get_recommendations(username, count=3, path=RECOMMENDATIONS_FILE):
+    """Return the user's precomputed video IDs, or None if they are missing or out of date."""
+    if not os.path.exists(path):
+        return None
+    entry = load_recommendations(path).get("users", {}).get(username)
+    if entry is None:
+        return None
+    activity = user_activity.get_user_activity(username)
+    if activity_fingerprint(activity["liked"], activity.get("viewed", [])) != entry["fingerprint"]:
+        return None  # Activity changed since the batch ran
+    # Dislikes are not in the fingerprint, so drop what the user has seen since
+    seen = seen_videos(activity)
+    videos = [video_id for video_id in entry["videos"] if video_id not in seen]
+    return videos[:count] if len(videos) >= count else None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute recommendations for every user.")
+    parser.add_argument("--top-n", type=int, default=TOP_N, help="recommendations stored per user")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes scoring chunks of users")
+    args = parser.parse_args()
+    start = datetime.now()
+    count = build_recommendations(args.top_n, args.workers)
+    print(f"Stored recommendations for {count} users in {RECOMMENDATIONS_FILE} "
+          f"({(datetime.now() - start).total_seconds():.2f}s)")
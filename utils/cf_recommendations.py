@@ -0,0 +1,52 @@
+"""On-line collaborative filtering of one user, for users the batch store has nothing current for.
+
+The user's row of the interaction weights (utils.interaction_weights) is scored against the
+top-K neighbour index (utils.neighbour_index) or the incrementally updated item similarity
+(utils.item_similarity), and blended with the TF-IDF content scores of
+utils.content_similarity. Videos the user has already seen (activity_log.seen_videos) are
+never recommended, whether or not they still carry weight: a disliked video has none.
+"""
+import numpy as np
+from utils import derived_models, user_activity
+from utils.activity_log import seen_videos
+from utils.content_similarity import get_content_model, blend_scores
+from utils.data import video_metadata
+from utils.interaction_weights import get_weights
+from utils.item_similarity import get_model as get_similarity_model
+from utils.neighbour_index import get_index as get_neighbour_index
+from utils.popularity import cold_start_recommendations
+
+def collaborative_scores(rated_videos):
+    """Return {video ID: score} from the neighbour index while it is fresh, else from the item similarity.
+
+    An index past its staleness bound (see neighbour_index.MAX_STALE_SECONDS) still serves until
+    the item similarity model has loaded.
+    """
+    neighbour_index = get_neighbour_index()
+    if neighbour_index is not None and (neighbour_index.fresh() or not derived_models.ready()):
+        return neighbour_index.scores(rated_videos)
+    return get_similarity_model().scores(rated_videos)
+
+def recommend(username, videos=video_metadata, count=3):
+    """Return up to count of the videos (catalog records) for the user, best first."""
+    video_ids = [video["Video_ID"] for video in videos]
+    # Only the user's row of the weights is read, not the users x videos matrix
+    rated_indices, ratings = get_weights().row(username, video_ids)
+    if not ratings.any():
+        # Nothing to be similar to: the most popular videos of the user's genre and location
+        videos_by_id = {video["Video_ID"]: video for video in videos}
+        return [videos_by_id[video_id] for video_id in cold_start_recommendations(username, count) if video_id in videos_by_id]
+
+    rated_videos = {video_ids[i]: rating for i, rating in zip(rated_indices, ratings)}
+    scores = collaborative_scores(rated_videos)
+    collaborative = np.array([scores.get(video_id, 0.0) for video_id in video_ids])
+    # Blend in how close each video's Title/Description/Genre is to what the user watched
+    content = get_content_model(videos).scores(rated_videos)
+
+    seen = seen_videos(user_activity.get_user_activity(username))
+    excluded = np.array([video_id in seen for video_id in video_ids], dtype=bool)
+    excluded[rated_indices] = True  # Weighted but not in the record, e.g. only commented on
+    collaborative[excluded] = content[excluded] = 0  # Only candidates should set the blending scale
+    blended = blend_scores(collaborative, content)
+    ranked = np.argsort(-blended, kind="stable")
+    return [videos[i] for i in ranked[~excluded[ranked]][:count]]
@@ -0,0 +1,247 @@
+"""Local pub/sub for live chat: one fan-out queue per subscriber, grouped by conversation.
+
+The broker runs on an asyncio loop in a daemon thread of the Streamlit process. To share it
+between several app processes on one host, run it as a sidecar and point the app at it:
+
+    python -m utils.chat_broker --port 8765
+    SPARKPLAY_CHAT_BROKER=127.0.0.1:8765 streamlit run main.py
+
+Messages are persisted by utils.user_activity before they are published, so the broker only
+has to notify subscribers; a slow subscriber that overflows its queue loses notifications,
+not messages.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Subscribers that have not drained for this long are dropped (e.g. closed browser tabs)
+SUBSCRIPTION_IDLE_SECONDS = 300
+# "host:port" of a sidecar broker; unset means an in-process broker
+BROKER_ADDRESS = os.environ.get("SPARKPLAY_CHAT_BROKER")
+
+class Subscription:
+    """A subscriber's queue on one conversation."""
+
+    def __init__(self, broker, key):
+        self.broker = broker
+        self.key = key
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+        self.waiting = False
+        self.last_active = time.monotonic()
+
+    async def get(self):
+        """Wait for the next message (call from the broker's loop)."""
+        self.waiting = True
+        try:
+            return await self.queue.get()
+        finally:
+            self.waiting = False
+            self.last_active = time.monotonic()
+
+    def _drain_now(self):
+        self.last_active = time.monotonic()
+        messages = []
+        while not self.queue.empty():
+            messages.append(self.queue.get_nowait())
+        return messages
+
+    def drain(self):
+        """Return the messages received since the last drain; safe to call from any thread."""
+        return self.broker.call(self._drain_now)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class ChatBroker:
+    """In-process asyncio broker keeping a fan-out set of subscriber queues per conversation."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._loop = None
+        self._lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0}
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="chat-broker", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def call(self, fn, *args):
+        """Run fn on the broker loop and return its result."""
+        loop = self.loop
+        try:
+            if asyncio.get_running_loop() is loop:
+                return fn(*args)
+        except RuntimeError:
+            pass  # Not called from inside an event loop
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(fn(*args))
+            except Exception as error:
+                future.set_exception(error)
+
+        loop.call_soon_threadsafe(run)
+        return future.result()
+
+    def publish(self, key, message):
+        """Fan a message out to every subscriber of a conversation; never blocks."""
+        if key not in self._subscribers:
+            return  # Nobody listening, so do not even wake the loop
+        self.loop.call_soon_threadsafe(self._fanout, key, message)
+
+    def _fanout(self, key, message):
+        self.stats["published"] += 1
+        now = time.monotonic()
+        subscribers = self._subscribers.get(key, set())
+        for subscription in list(subscribers):
+            if not subscription.waiting and now - subscription.last_active > SUBSCRIPTION_IDLE_SECONDS:
+                subscribers.discard(subscription)
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+                self.stats["delivered"] += 1
+            except asyncio.QueueFull:
+                subscription.dropped += 1
+                self.stats["dropped"] += 1
+        if not subscribers:
+            self._subscribers.pop(key, None)
+
+    def _subscribe(self, key):
+        subscription = Subscription(self, key)
+        self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def subscribe(self, key):
+        """Subscribe to a conversation key (see utils.chat_store)."""
+        return self.call(self._subscribe, key)
+
+    def _unsubscribe(self, subscription):
+        subscribers = self._subscribers.get(subscription.key)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.key]
+
+    def unsubscribe(self, subscription):
+        self.call(self._unsubscribe, subscription)
+
+    async def serve(self, host, port):
+        """Expose this broker over a line-delimited JSON TCP protocol (sidecar mode)."""
+
+        async def handle(reader, writer):
+            subscription = forwarder = None
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    request = json.loads(line)
+                    if request["op"] == "publish":
+                        self._fanout(request["key"], request["message"])
+                    elif request["op"] == "subscribe" and subscription is None:
+                        subscription = self._subscribe(request["key"])
+                        forwarder = asyncio.ensure_future(forward(subscription, writer))
+            finally:
+                if forwarder is not None:
+                    forwarder.cancel()
+                if subscription is not None:
+                    self._unsubscribe(subscription)
+                writer.close()
+
+        async def forward(subscription, writer):
+            while True:
+                message = await subscription.get()
+                writer.write(json.dumps(message).encode() + b"\n")
+                await writer.drain()
+
+        server = await asyncio.start_server(handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+class RemoteSubscription:
+    """A subscription held open on a sidecar broker connection."""
+
+    def __init__(self, address, key):
+        self.key = key
+        self._messages = deque(maxlen=SUBSCRIBER_QUEUE_SIZE)
+        self.last_active = time.monotonic()
+        self._socket = socket.create_connection(address)
+        self._socket.sendall(json.dumps({"op": "subscribe", "key": key}).encode() + b"\n")
+        threading.Thread(target=self._read, name="chat-subscription", daemon=True).start()
+
+    def _read(self):
+        with self._socket.makefile("rb") as stream:
+            for line in stream:
+                self._messages.append(json.loads(line))
+                if time.monotonic() - self.last_active > SUBSCRIPTION_IDLE_SECONDS:
+                    break  # Nobody drains this any more
+        self.close()
+
+    def drain(self):
+        self.last_active = time.monotonic()
+        messages = []
+        while self._messages:
+            messages.append(self._messages.popleft())
+        return messages
+
+    def close(self):
+        self._socket.close()
+
+class RemoteChatBroker:
+    """Client for a sidecar broker with the same publish/subscribe interface as ChatBroker."""
+
+    def __init__(self, host, port):
+        self.address = (host, int(port))
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def publish(self, key, message):
+        line = json.dumps({"op": "publish", "key": key, "message": message}).encode() + b"\n"
+        with self._lock:
+            try:
+                if self._socket is None:
+                    self._socket = socket.create_connection(self.address, timeout=1)
+                self._socket.sendall(line)
+            except OSError:
+                self._socket = None  # Notifications are best effort; the message is already stored
+
+    def subscribe(self, key):
+        return RemoteSubscription(self.address, key)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    """Return the process-wide broker (sidecar client if SPARKPLAY_CHAT_BROKER is set)."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                if BROKER_ADDRESS:
+                    host, _, port = BROKER_ADDRESS.rpartition(":")
+                    _broker = RemoteChatBroker(host, port)
+                else:
+                    _broker = ChatBroker()
+    return _broker
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the chat broker as a local sidecar.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(ChatBroker().serve(args.host, args.port))
@@ -0,0 +1,172 @@
+import json
+import os
+import shutil
+from urllib.parse import quote, unquote
+from utils.file_store import locked, atomic_write
+from utils.read_cache import cached_load
+
+CHAT_SHARD_DIR = "chat_shards"
+SHARD_SUFFIX = ".jsonl"
+TAIL_BLOCK_BYTES = 8192
+
+def user_conversation_key(user_a, user_b):
+    """Canonical key of a direct conversation, the same whichever user sends."""
+    first, second = sorted((user_a, user_b))
+    # quote(safe="") escapes '+', so the separator is unambiguous whatever the usernames contain
+    return f"dm+{quote(first, safe='')}+{quote(second, safe='')}"
+
+def video_conversation_key(video_id):
+    """Key of the public chat attached to a video."""
+    return f"video+{quote(video_id, safe='')}"
+
+def conversation_participants(key):
+    """Return the usernames of a direct conversation key, or None for other conversations."""
+    kind, _, rest = key.partition("+")
+    if kind != "dm":
+        return None
+    first, _, second = rest.partition("+")
+    return unquote(first), unquote(second)
+
+def shard_path(key):
+    return os.path.join(CHAT_SHARD_DIR, key + SHARD_SUFFIX)
+
+def _shard_id(path):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+def append_message(key, message):
+    """Append one message to its conversation shard."""
+    os.makedirs(CHAT_SHARD_DIR, exist_ok=True)
+    path = shard_path(key)
+    line = json.dumps(message, separators=(",", ":")) + "\n"
+    with locked(path):
+        with open(path, "a") as file:
+            file.write(line)
+
+def _tail_offset(file, count):
+    """Byte offset where the last `count` lines of an open binary file start."""
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    newlines = 0
+    while position > 0:
+        size = min(TAIL_BLOCK_BYTES, position)
+        position -= size
+        file.seek(position)
+        block = file.read(size)
+        index = len(block)
+        while True:
+            index = block.rfind(b"\n", 0, index)
+            if index < 0:
+                break
+            newlines += 1
+            if newlines > count:  # The first newline found terminates the very last line
+                return position + index + 1
+    return 0
+
+def _parse_lines(data):
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+def read_messages(key, cursor=None, since=None, last=None):
+    """Read one conversation incrementally.
+
+    cursor -- value returned by a previous call; only messages appended after it are read
+    since  -- only return messages with a later ISO timestamp
+    last   -- on a first read (no cursor), only read the last N messages
+
+    Returns (messages, cursor, reset). reset is True when the shard was rewritten since the
+    cursor was taken (e.g. by compaction), in which case messages restart from the beginning.
+    """
+    path = shard_path(key)
+    shard_id = _shard_id(path)
+    if shard_id is None:
+        return [], None, cursor is not None
+    reset = cursor is not None and cursor[0] != shard_id
+    start = cursor[1] if cursor is not None and not reset else 0
+    with open(path, "rb") as file:
+        if start == 0 and last is not None:
+            start = _tail_offset(file, last)
+        file.seek(start)
+        data = file.read()
+    # Only consume complete lines; a write still in progress is picked up next time
+    end = data.rfind(b"\n") + 1
+    messages = _parse_lines(data[:end])
+    if since is not None:
+        messages = [message for message in messages if message.get("timestamp", "") > since]
+    return messages, (shard_id, start + end), reset
+
+def read_conversation(key):
+    """Return every message of one conversation, cached until the shard changes."""
+    path = shard_path(key)
+
+    def load():
+        if not os.path.exists(path):
+            return []
+        with open(path, "rb") as file:
+            data = file.read()
+        return _parse_lines(data[:data.rfind(b"\n") + 1])
+
+    return cached_load(path, load)
+
+def list_conversations():
+    if not os.path.isdir(CHAT_SHARD_DIR):
+        return []
+    return sorted(name[:-len(SHARD_SUFFIX)] for name in os.listdir(CHAT_SHARD_DIR) if name.endswith(SHARD_SUFFIX))
+
+def load_all():
+    """Load every conversation keyed by canonical conversation key."""
+    return {key: list(read_conversation(key)) for key in list_conversations()}
+
+def write_conversation(key, messages):
+    """Atomically replace one conversation shard."""
+    os.makedirs(CHAT_SHARD_DIR, exist_ok=True)
+    path = shard_path(key)
+    lines = "".join(json.dumps(message, separators=(",", ":")) + "\n" for message in messages)
+    with locked(path):
+        atomic_write(path, lambda file: file.write(lines))
+
+def replace_all(chat_data):
+    """Replace all shards with the given conversations, keyed by canonical key."""
+    for key in set(list_conversations()) - set(chat_data):
+        with locked(shard_path(key)):
+            os.remove(shard_path(key))
+    for key, messages in chat_data.items():
+        write_conversation(key, messages)
+
+def _legacy_key(legacy_key, messages):
+    senders = {message["sender"] for message in messages if "sender" in message}
+    if not senders:
+        return video_conversation_key(legacy_key)
+    for sender in senders:
+        if legacy_key.startswith(sender + "_"):
+            return user_conversation_key(sender, legacy_key[len(sender) + 1:])
+        if legacy_key.endswith("_" + sender):
+            return user_conversation_key(legacy_key[:-len(sender) - 1], sender)
+    return f"legacy+{quote(legacy_key, safe='')}"
+
+def legacy_conversations(chat_data):
+    """Map chat_messages.json entries ('a_b' per direction, or a video ID) to canonical keys."""
+    merged = {}
+    for legacy_key, messages in chat_data.items():
+        merged.setdefault(_legacy_key(legacy_key, messages), []).extend(messages)
+    for messages in merged.values():
+        messages.sort(key=lambda message: message.get("timestamp", ""))
+    return merged
+
+def ensure_migrated(legacy_file):
+    """Split the legacy single-file chat store into shards the first time chat is used."""
+    if os.path.isdir(CHAT_SHARD_DIR) or not os.path.exists(legacy_file):
+        return
+    with locked(legacy_file):
+        if os.path.isdir(CHAT_SHARD_DIR):
+            return  # Another process migrated while we waited
+        with open(legacy_file, "r") as file:
+            chat_data = json.load(file)
+        staging_dir = CHAT_SHARD_DIR + ".migrating"
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        os.makedirs(staging_dir)
+        for key, messages in legacy_conversations(chat_data).items():
+            with open(os.path.join(staging_dir, key + SHARD_SUFFIX), "w") as file:
+                file.writelines(json.dumps(m, separators=(",", ":")) + "\n" for m in messages)
+        os.rename(staging_dir, CHAT_SHARD_DIR)
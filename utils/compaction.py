@@ -0,0 +1,229 @@
+"""Compaction and retention for the activity and chat stores.
+
+    python -m utils.compaction --retention-days 90
+
+Folds the activity log into the snapshot, drops repeated events from the raw history and
+the chat shards, and replaces raw history older than the retention window by per-day
+counts. Files are rewritten one at a time and only if nobody appended to them meanwhile,
+so online writers are never held up for longer than a rename. The small files of the
+Parquet activity lake are merged per partition (utils.activity_lake.compact).
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from utils import activity_lake, chat_store, sqlite_store, user_activity
+from utils.activity_log import read_events
+from utils.file_store import locked, atomic_write, file_version, update_json
+from utils.read_cache import invalidate
+
+RETENTION_DAYS = 90  # Raw activity events kept this long, then only counts
+CHAT_RETENTION_DAYS = None  # Chat is kept forever unless configured
+DUPLICATE_WINDOW_SECONDS = 2.0  # Identical repeats closer than this are double submits
+ROLLUPS_FILE = "activity_rollups.json"
+INTERACTIONS_CACHE_FILE = "user_interactions_cache.json"
+
+# Views and shares are idempotent, so a user repeating one back to back adds nothing
+IDEMPOTENT_EVENTS = ("view", "share")
+
+def _seconds_between(earlier, later):
+    try:
+        return (datetime.fromisoformat(later) - datetime.fromisoformat(earlier)).total_seconds()
+    except (TypeError, ValueError):
+        return float("inf")
+
+def dedupe_events(events, window=DUPLICATE_WINDOW_SECONDS):
+    """Drop back-to-back repeats of idempotent events and double-submitted comments.
+
+    Likes and dislikes are toggles, so repeats of those are always kept.
+    """
+    kept = []
+    last_by_user = {}
+    for event in events:
+        previous = last_by_user.get(event["user"])
+        same = (previous is not None and previous["type"] == event["type"]
+                and previous["video"] == event["video"] and previous.get("comment") == event.get("comment"))
+        if same and (event["type"] in IDEMPOTENT_EVENTS
+                     or (event["type"] == "comment"
+                         and _seconds_between(previous["timestamp"], event["timestamp"]) <= window)):
+            continue
+        kept.append(event)
+        last_by_user[event["user"]] = event
+    return kept
+
+def dedupe_messages(messages, window=DUPLICATE_WINDOW_SECONDS):
+    """Drop a message repeated by the same sender with the same text within `window` seconds."""
+    kept = []
+    for message in messages:
+        if kept:
+            previous = kept[-1]
+            author = message.get("sender", message.get("username"))
+            if (author == previous.get("sender", previous.get("username"))
+                    and message.get("message") == previous.get("message")
+                    and _seconds_between(previous.get("timestamp"), message.get("timestamp")) <= window):
+                continue
+        kept.append(message)
+    return kept
+
+def _dir_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path) if os.path.exists(path) else 0
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def _timed(loader):
+    invalidate()
+    start = time.perf_counter()
+    loader()
+    return time.perf_counter() - start
+
+def _replace_if_unchanged(path, version, write_fn):
+    """Atomically rewrite path unless it changed since `version` was taken."""
+    with locked(path):
+        if file_version(path) != version:
+            return False
+        atomic_write(path, write_fn)
+        return True
+
+def _write_events(events):
+    return lambda file: file.writelines(json.dumps(e, separators=(",", ":")) + "\n" for e in events)
+
+def compact_activity(retention_days=RETENTION_DAYS, window=DUPLICATE_WINDOW_SECONDS):
+    """Fold the log, dedupe the raw history and roll up days past retention."""
+    history_dir = user_activity.USER_ACTIVITY_HISTORY_DIR
+    store_files = (user_activity.USER_ACTIVITY_FILE, user_activity.USER_ACTIVITY_LOG_FILE, history_dir)
+    report = {"bytes_before": sum(_dir_size(path) for path in store_files),
+              "load_seconds_before": _timed(user_activity.load_stored_activity)}
+
+    report["events_folded"] = user_activity.snapshot_activity()
+
+    cutoff = (datetime.now() - timedelta(days=retention_days)).date().isoformat() if retention_days is not None else None
+    report["events_deduplicated"] = 0
+    report["days_rolled_up"] = 0
+    day_files = sorted(name for name in os.listdir(history_dir) if name.endswith(".jsonl")) if os.path.isdir(history_dir) else []
+    for name in day_files:
+        path = os.path.join(history_dir, name)
+        day = name[:-len(".jsonl")]
+        version = file_version(path)
+        events = list(read_events(path))
+        # Archive appends happen under the activity store's lock, so rewrite under it too
+        with locked(user_activity.USER_ACTIVITY_FILE):
+            if file_version(path) != version:
+                continue  # Appended to meanwhile; pick it up on the next run
+            if cutoff is not None and day < cutoff:
+                counts = {}
+                for event in events:
+                    video_counts = counts.setdefault(event["video"], {})
+                    video_counts[event["type"]] = video_counts.get(event["type"], 0) + 1
+                update_json(ROLLUPS_FILE, lambda rollups: _merge_counts(rollups.setdefault("activity", {}), day, counts), indent=4)
+                os.remove(path)
+                report["days_rolled_up"] += 1
+                continue
+            kept = dedupe_events(events, window)
+            if len(kept) < len(events):
+                atomic_write(path, _write_events(kept))
+                report["events_deduplicated"] += len(events) - len(kept)
+    # The history's older events were rolled up or deduplicated; let repeat views and shares reach it again
+    user_activity.write_buffer.forget()
+
+    report["bytes_after"] = sum(_dir_size(path) for path in store_files)
+    report["load_seconds_after"] = _timed(user_activity.load_stored_activity)
+    return report
+
+def _merge_counts(section, day, counts):
+    day_counts = section.setdefault(day, {})
+    for key, type_counts in counts.items():
+        merged = day_counts.setdefault(key, {})
+        for count_type, count in type_counts.items():
+            merged[count_type] = merged.get(count_type, 0) + count
+
+def _merge_chat_counts(rollups, key, counts):
+    for day, count in counts.items():
+        _merge_counts(rollups.setdefault("chat", {}), day, {key: {"messages": count}})
+
+def compact_chat(retention_days=CHAT_RETENTION_DAYS, window=DUPLICATE_WINDOW_SECONDS):
+    """Dedupe double-submitted messages in every shard and apply optional retention."""
+    user_activity.load_chat_messages()  # Make sure the legacy file has been split into shards
+    report = {"bytes_before": _dir_size(chat_store.CHAT_SHARD_DIR),
+              "load_seconds_before": _timed(chat_store.load_all),
+              "messages_deduplicated": 0, "messages_rolled_up": 0}
+    cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat() if retention_days is not None else None
+    for key in chat_store.list_conversations():
+        path = chat_store.shard_path(key)
+        version = file_version(path)
+        messages = list(chat_store.read_messages(key)[0])
+        deduplicated = dedupe_messages(messages, window)
+        kept = [m for m in deduplicated if cutoff is None or m.get("timestamp", "") >= cutoff]
+        if len(kept) == len(messages):
+            continue
+        # Rewriting gives the shard a new identity, so open chat panels reload it (see read_messages)
+        if not _replace_if_unchanged(path, version, _write_events(kept)):
+            continue  # Appended to meanwhile; pick it up on the next run
+        report["messages_deduplicated"] += len(messages) - len(deduplicated)
+        report["messages_rolled_up"] += len(deduplicated) - len(kept)
+        counts = {}
+        for message in (m for m in deduplicated if cutoff is not None and m.get("timestamp", "") < cutoff):
+            day = message.get("timestamp", "")[:10]
+            counts[day] = counts.get(day, 0) + 1
+        if counts:
+            update_json(ROLLUPS_FILE, lambda rollups: _merge_chat_counts(rollups, key, counts), indent=4)
+    report["bytes_after"] = _dir_size(chat_store.CHAT_SHARD_DIR)
+    report["load_seconds_after"] = _timed(chat_store.load_all)
+    return report
+
+def compact_interactions_cache():
+    """Collapse the identical rows accumulated in the legacy interactions cache."""
+    if not os.path.exists(INTERACTIONS_CACHE_FILE):
+        return {"bytes_before": 0, "bytes_after": 0}
+    report = {"bytes_before": os.path.getsize(INTERACTIONS_CACHE_FILE)}
+
+    def dedupe(rows):
+        unique = list({json.dumps(row, sort_keys=True): row for row in rows}.values())
+        rows[:] = unique
+
+    update_json(INTERACTIONS_CACHE_FILE, dedupe, default_factory=list)
+    report["bytes_after"] = os.path.getsize(INTERACTIONS_CACHE_FILE)
+    return report
+
+def compact_sqlite():
+    """Checkpoint the WAL and vacuum the SQLite database."""
+    path = sqlite_store.SQLITE_DB_FILE
+    before = sum(_dir_size(path + suffix) for suffix in ("", "-wal", "-shm"))
+    conn = sqlite_store.connect()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    after = sum(_dir_size(path + suffix) for suffix in ("", "-wal", "-shm"))
+    return {"bytes_before": before, "bytes_after": after}
+
+def run(retention_days=RETENTION_DAYS, chat_retention_days=CHAT_RETENTION_DAYS, window=DUPLICATE_WINDOW_SECONDS):
+    """Compact every store and return a report per store."""
+    user_activity.flush_activity()
+    if sqlite_store.USE_SQLITE:
+        return {"sqlite": compact_sqlite(), "activity_lake": activity_lake.compact()}
+    return {
+        "activity": compact_activity(retention_days, window),
+        "chat": compact_chat(chat_retention_days, window),
+        "interactions_cache": compact_interactions_cache(),
+        "activity_lake": activity_lake.compact(),
+    }
+
+def format_report(reports):
+    lines = []
+    for store, report in reports.items():
+        reclaimed = report["bytes_before"] - report["bytes_after"]
+        line = f"{store}: {report['bytes_before']:,} -> {report['bytes_after']:,} bytes ({reclaimed:,} reclaimed)"
+        if "load_seconds_before" in report:
+            line += f", load {report['load_seconds_before'] * 1e3:.2f} -> {report['load_seconds_after'] * 1e3:.2f} ms"
+        details = {k: v for k, v in report.items() if not k.startswith(("bytes_", "load_seconds_"))}
+        if details:
+            line += f" {details}"
+        lines.append(line)
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact the activity and chat stores.")
+    parser.add_argument("--retention-days", type=int, default=RETENTION_DAYS, help="days of raw activity events to keep")
+    parser.add_argument("--chat-retention-days", type=int, default=CHAT_RETENTION_DAYS, help="days of chat to keep (default: forever)")
+    parser.add_argument("--window", type=float, default=DUPLICATE_WINDOW_SECONDS, help="seconds within which identical repeats are duplicates")
+    args = parser.parse_args()
+    print(format_report(run(args.retention_days, args.chat_retention_days, args.window)))
@@ -0,0 +1,133 @@
+"""Compute backend for the activity analytics and recommendation paths: Spark or in-process.
+
+Starting a SparkSession costs seconds of JVM startup, which small stores do not need. The
+SparkSession is therefore created only on first use, and only when the data a query reads is
+at least SPARKPLAY_SPARK_THRESHOLD_MB; below that the same queries run in-process with
+pandas, pyarrow and NumPy (utils.local_als for the ALS recommender).
+SPARKPLAY_COMPUTE_BACKEND=spark or =local forces one backend. Both read and append the
+partitioned Parquet layout of utils.activity_lake.
+"""
+import glob
+import os
+import threading
+from datetime import datetime
+from utils import activity_lake, sqlite_store, user_activity
+from utils.activity_lake import ACTIVITY_COLUMNS
+
+COMPUTE_BACKEND = os.environ.get("SPARKPLAY_COMPUTE_BACKEND", "auto").lower()  # auto, local or spark
+SPARK_THRESHOLD_BYTES = int(float(os.environ.get("SPARKPLAY_SPARK_THRESHOLD_MB", "256")) * 1024 * 1024)
+
+_spark = None
+_spark_lock = threading.Lock()
+
+def get_spark():
+    """Return the process-wide SparkSession, starting it on first use."""
+    global _spark
+    if _spark is None:
+        with _spark_lock:
+            if _spark is None:
+                from pyspark.sql import SparkSession
+                _spark = SparkSession.builder \
+                    .appName("Video Recommendation App") \
+                    .config("spark.driver.memory", "2g") \
+                    .getOrCreate()
+    return _spark
+
+def data_size(paths):
+    """Total bytes of the files (or directories of files) at paths; missing ones count 0."""
+    total = 0
+    for path in paths:
+        if os.path.isdir(path):
+            total += sum(os.path.getsize(name) for name in glob.glob(os.path.join(path, "**"), recursive=True) if os.path.isfile(name))
+        elif os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+def activity_store_paths():
+    if sqlite_store.USE_SQLITE:
+        return [sqlite_store.SQLITE_DB_FILE, sqlite_store.SQLITE_DB_FILE + "-wal"]
+    return [user_activity.USER_ACTIVITY_FILE, user_activity.USER_ACTIVITY_ROTATING_FILE, user_activity.USER_ACTIVITY_LOG_FILE]
+
+class LocalBackend:
+    """The queries with pandas and NumPy in this process."""
+
+    name = "local"
+
+    def read_activity(self, path, columns=None, **filters):
+        """Read the activity lake at path into pandas; filters are those of activity_lake.filter_expression."""
+        return activity_lake.read(columns, root=path, **filters)
+
+    def append_activity(self, path, rows):
+        """Add (User_ID, Video_ID, Interaction_Type[, timestamp]) rows as new files of their partitions."""
+        activity_lake.append(rows, root=path)
+
+    def recommend(self, user_id, num_recommendations=3, exclude=()):
+        from utils import local_als
+        return local_als.get_model().recommend([user_id], num_recommendations, {user_id: set(exclude)}).get(user_id, [])
+
+class SparkBackend:
+    """The queries on the (lazily started) SparkSession."""
+
+    name = "spark"
+
+    def read_activity(self, path, columns=None, users=None, videos=None, interaction_types=None, since=None, until=None):
+        from pyspark.sql import functions as F
+        from pyspark.sql.types import StringType, StructType, StructField
+        columns = columns or ACTIVITY_COLUMNS
+        spark = get_spark()
+        if not os.path.isdir(path):
+            return spark.createDataFrame([], StructType([StructField(column, StringType(), True) for column in columns]))
+        # Partition values stay strings, so date filters compare like the local backend's
+        frame = spark.read.option("basePath", path) \
+            .schema("User_ID string, Video_ID string, Timestamp timestamp, date string, Interaction_Type string").parquet(path)
+        # Conditions on date and Interaction_Type prune partitions; the rest are pushed into the Parquet scan
+        conditions = []
+        if users is not None:
+            conditions.append(F.col("User_ID").isin(list(users)))
+        if videos is not None:
+            conditions.append(F.col("Video_ID").isin(list(videos)))
+        if interaction_types is not None:
+            conditions.append(F.col("Interaction_Type").isin(list(interaction_types)))
+        if since is not None:
+            conditions.append(F.col("date") >= activity_lake.partition_date(since))
+            if isinstance(since, datetime):
+                conditions.append(F.col("Timestamp") >= F.lit(since))
+        if until is not None:
+            conditions.append(F.col("date") <= activity_lake.partition_date(until))
+            if isinstance(until, datetime):
+                conditions.append(F.col("Timestamp") <= F.lit(until))
+        for condition in conditions:
+            frame = frame.where(condition)
+        return frame.select(*columns)
+
+    def append_activity(self, path, rows):
+        now = datetime.now()
+        records = []
+        for row in rows:
+            timestamp = row[3] if len(row) > 3 else now
+            if isinstance(timestamp, str):
+                timestamp = datetime.fromisoformat(timestamp)
+            records.append((row[0], row[1], timestamp, timestamp.date().isoformat(), row[2]))
+        get_spark().createDataFrame(records, "User_ID string, Video_ID string, Timestamp timestamp, date string, Interaction_Type string") \
+            .write.partitionBy("date", "Interaction_Type").parquet(path, mode="append")
+        activity_lake.touch(path)
+
+    def recommend(self, user_id, num_recommendations=3, exclude=()):
+        from utils import spark_als
+        spark = get_spark()
+        als_model = spark_als.get_model()
+        if als_model is None:
+            als_model = spark_als.train_from_store(spark)
+        recommendations = spark_als.recommend(spark, als_model, [user_id], num_recommendations, exclude={user_id: set(exclude)})
+        return recommendations.get(user_id, [])
+
+LOCAL = LocalBackend()
+SPARK = SparkBackend()
+
+def get_backend(paths):
+    """Return the backend for a query reading the data at paths."""
+    if COMPUTE_BACKEND == "spark":
+        return SPARK
+    if COMPUTE_BACKEND == "local":
+        return LOCAL
+    return SPARK if data_size(paths) >= SPARK_THRESHOLD_BYTES else LOCAL
@@ -0,0 +1,76 @@
+"""Content-based scores from the catalog's Title, Description and Genre.
+
+The catalog is turned into one L2-normalised TF-IDF matrix (words and word pairs, plus a
+genre token), built once per process. A user's profile is the rating-weighted sum of the
+rows of the videos they liked or viewed, and every video is scored against it with a single
+sparse matrix-vector product.
+"""
+import os
+import threading
+import numpy as np
+from scipy.sparse import diags
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+# Share of the content score in blended recommendation scores (0 = collaborative only)
+CONTENT_WEIGHT = float(os.environ.get("SPARKPLAY_CONTENT_WEIGHT", "0.3"))
+
+def video_text(video):
+    # The genre becomes its own token so it does not merge with the same word in descriptions
+    genre = video.get("Genre", "").strip().lower().replace(" ", "_")
+    return " ".join((video.get("Title", ""), video.get("Description", ""), f"genre_{genre}" if genre else ""))
+
+class ContentModel:
+    """TF-IDF rows of a catalog, one per video."""
+
+    def __init__(self, videos):
+        self.video_ids = [video["Video_ID"] for video in videos]
+        self.rows = {video_id: row for row, video_id in enumerate(self.video_ids)}
+        vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1, 2), sublinear_tf=True)
+        self.matrix = vectorizer.fit_transform([video_text(video) for video in videos]).tocsr()
+
+    def rows_for(self, video_ids):
+        """Return the matrix with rows in the given video order (zero rows for unknown videos)."""
+        rows = np.array([self.rows.get(video_id, -1) for video_id in video_ids])
+        known = rows >= 0
+        return (diags(known.astype(np.float64)) @ self.matrix[np.where(known, rows, 0)]).tocsr()
+
+    def scores(self, ratings):
+        """Return cosine similarity of every catalog video to the profile of {video ID: rating}."""
+        rated = [(self.rows[video_id], rating) for video_id, rating in ratings.items() if video_id in self.rows]
+        if not rated:
+            return np.zeros(len(self.video_ids))
+        weights = np.zeros(len(self.video_ids))
+        for row, rating in rated:
+            weights[row] = rating
+        profile = normalize(self.matrix.T @ weights[:, None], axis=0)
+        return self.matrix @ profile.ravel()
+
+def profile_scores(ratings, content_matrix):
+    """Content scores for many users at once: a users x videos ratings matrix in, same shape out."""
+    profiles = normalize(ratings @ content_matrix)
+    return (profiles @ content_matrix.T).toarray()
+
+def blend_scores(collaborative, content, weight=CONTENT_WEIGHT):
+    """Mix collaborative and content scores (vectors or users x videos), each rescaled to 0-1 per user."""
+    def rescale(scores):
+        scores = np.asarray(scores, dtype=np.float64)
+        top = scores.max(axis=-1, keepdims=True) if scores.size else scores
+        return np.divide(scores, top, out=np.zeros_like(scores), where=top > 0)
+
+    return (1 - weight) * rescale(collaborative) + weight * rescale(content)
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_content_model(videos):
+    """Return the cached model of a catalog list, rebuilding it when videos are added."""
+    key = (id(videos), len(videos))
+    model = _models.get(key)
+    if model is None:
+        with _models_lock:
+            model = _models.get(key)
+            if model is None:
+                _models.clear()
+                model = _models[key] = ContentModel(videos)
+    return model
@@ -0,0 +1,146 @@
+"""Models derived from every user's activity, kept in step with it through one shared copy.
+
+Item similarity, popularity, up-next and the interaction weights all read every user's
+activity and follow every event made in this process. They share one ActivitySets, loaded
+with user_activity.load_derived, and one activity listener: it lets each model note what it
+needs of the event's user, applies the event to the shared sets once, and lets each model
+update from there. The models are built together, on a background thread when warm_up() is
+called at startup, so requests only wait for them if they ask before that is done.
+
+Models with a file are loaded from it when it was saved at the activity version they are
+built on and otherwise rebuilt. They are saved on exit with that version, unless another
+process wrote activity they never saw (see user_activity.SyncedVersion).
+"""
+import atexit
+import threading
+from utils import user_activity
+from utils.activity_log import apply_event
+from utils.file_store import read_json, write_json
+
+class DerivedModel:
+    """Base of a model kept in step with the shared activity sets."""
+
+    path = None  # JSON file the model is saved to; None to rebuild it on every start
+
+    def __init__(self, activity_sets, synced=None):
+        self.activity_sets = activity_sets
+        self.synced = synced  # user_activity.SyncedVersion of the activity the state reflects
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        """Recompute the model from the activity sets."""
+        raise NotImplementedError
+
+    def before_event(self, event):
+        """Return what update() needs to know of the event's user before the event is applied."""
+        return None
+
+    def update(self, event, before):
+        """Fold in one event that has just been applied to the activity sets."""
+        raise NotImplementedError
+
+    def apply_event(self, event):
+        """Apply one event to the activity sets and the model, for a model with sets of its own."""
+        before = self.before_event(event)
+        apply_event(self.activity_sets, event)
+        self.update(event, before)
+
+    def to_json(self):
+        raise NotImplementedError
+
+    def load_json(self, data):
+        raise NotImplementedError
+
+    def load(self):
+        """Load the saved state if it was saved at the activity version the model is built on, else rebuild."""
+        saved = read_json(self.path) if self.path else {}
+        if self.synced is not None and self.synced.version is not None and saved.get("version") == self.synced.version:
+            self.load_json(saved)
+        else:
+            self.rebuild()
+
+    def save(self):
+        """Persist the model with the activity version it reflects, if that is still the store's."""
+        if self.path is None:
+            return
+        with user_activity.activity_paused():
+            user_activity.flush_activity()
+            with self._lock:
+                # Saved as current, a model that missed other processes' writes would never be rebuilt
+                if not self.dirty or self.synced is None or not self.synced.current():
+                    return
+                write_json(self.path, dict(self.to_json(), version=self.synced.version))
+                self.dirty = False
+
+class DerivedModels:
+    """The derived models of one shared ActivitySets, by name."""
+
+    def __init__(self, activity_sets, synced, models):
+        self.activity_sets = activity_sets
+        self.synced = synced
+        self.models = models
+
+    def apply_event(self, event):
+        """Apply one event to the shared sets and every model; called under the listener lock."""
+        before = {name: model.before_event(event) for name, model in self.models.items()}
+        apply_event(self.activity_sets, event)
+        for name, model in self.models.items():
+            model.update(event, before[name])
+
+def _model_classes():
+    # Imported here, since the model modules import this one
+    from utils.interaction_weights import InteractionWeights
+    from utils.item_similarity import ItemSimilarity
+    from utils.next_video import NextVideoModel
+    from utils.popularity import Popularity
+    return {"popularity": Popularity, "item_similarity": ItemSimilarity, "next_video": NextVideoModel,
+            "interaction_weights": InteractionWeights}
+
+def _build(activity_sets, synced):
+    models = {}
+    for name, model_class in _model_classes().items():
+        models[name] = model_class(activity_sets, synced=synced)
+        models[name].load()
+    return DerivedModels(activity_sets, synced, models)
+
+_models = None
+_models_lock = threading.Lock()
+_warm_up_lock = threading.Lock()  # Not _models_lock, which a load holds throughout
+_warm_up_started = False
+
+def get_models():
+    """Return the process-wide DerivedModels, loading them on first use."""
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                models = user_activity.load_derived(_build)
+                for model in models.models.values():
+                    atexit.register(model.save)
+                _models = models
+    return _models
+
+def get_model(name):
+    return get_models().models[name]
+
+def ready():
+    """True once the models are loaded, so get_model() returns without waiting."""
+    return _models is not None
+
+def warm_up():
+    """Start loading the models on a background thread; later calls do nothing."""
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started or _models is not None:
+            return
+        _warm_up_started = True
+    threading.Thread(target=get_models, name="derived-models-warm-up", daemon=True).start()
+
+def rebuild_and_save(model_class):
+    """Rebuild one model from the stored activity and save it, for the model modules' command lines."""
+    model = user_activity.load_derived(model_class)
+    model.rebuild()
+    model.dirty = True
+    model.save()
+    return model
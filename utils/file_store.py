@@ -0,0 +1,110 @@
+import contextlib
+import os
+import tempfile
+import threading
+from utils import serializers
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Optimistic read-modify-write attempts before falling back to holding the lock throughout
+UPDATE_RETRIES = 5
+
+_held = threading.local()
+
+def file_version(path):
+    """Return (mtime_ns, size, inode) for path, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+@contextlib.contextmanager
+def locked(path, shared=False):
+    """Hold an inter-process lock on path through a sidecar '.lock' file.
+
+    Re-entrant within a thread, so a writer holding the lock can call readers that take it too.
+    """
+    held = getattr(_held, "locks", None)
+    if held is None:
+        held = _held.locks = {}
+    key = os.path.abspath(path)
+    if key in held:
+        if held[key] and not shared:
+            raise RuntimeError(f"Cannot upgrade a shared lock on {path} to exclusive")
+        yield
+        return
+
+    with open(path + ".lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        held[key] = shared
+        try:
+            yield
+        finally:
+            del held[key]
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def atomic_write(path, write_fn, mode="w"):
+    """Write a file via a temporary file in the same directory and an atomic rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as file:
+            write_fn(file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _read_json(path, default_factory):
+    if os.path.exists(path):
+        return serializers.load(path)
+    return default_factory()
+
+def read_json(path, default_factory=dict):
+    """Read a JSON store (in any utils.serializers format) under a shared lock."""
+    with locked(path, shared=True):
+        return _read_json(path, default_factory)
+
+def write_json(path, data, indent=None):
+    """Replace a JSON store atomically under an exclusive lock, in the configured format."""
+    with locked(path):
+        atomic_write(path, serializers.write_to(data, indent), "wb")
+
+def update_json(path, update_fn, default_factory=dict, indent=None):
+    """Read-modify-write a JSON file safely across processes; returns update_fn's result.
+
+    update_fn mutates the loaded data in place. The file is read without the lock and only
+    written if nobody changed it meanwhile; on conflict the update is retried on fresh data.
+    """
+    for _ in range(UPDATE_RETRIES):
+        version = file_version(path)
+        try:
+            data = _read_json(path, default_factory)
+        except ValueError:
+            continue  # Caught a writer mid-way on a filesystem without atomic rename
+        result = update_fn(data)
+        with locked(path):
+            if file_version(path) == version:
+                atomic_write(path, serializers.write_to(data, indent), "wb")
+                return result
+    with locked(path):
+        data = _read_json(path, default_factory)
+        result = update_fn(data)
+        atomic_write(path, serializers.write_to(data, indent), "wb")
+        return result
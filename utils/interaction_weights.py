@@ -0,0 +1,279 @@
+"""Recency-weighted user x video interaction matrix built from the persisted activity.
+
+Which videos a user liked, shared, commented on or viewed comes from the activity store, so
+repeated views count once, a like that was taken back does not count, and disliked videos
+weigh nothing. Every remaining interaction is weighted by its type and decays exponentially
+with the age of its latest event in the raw history (activity_history/ plus the event log).
+Interactions the history does not cover (older snapshots, or the SQLite store, which keeps no
+interaction times) count as if made when the snapshot was written.
+
+Weights are stored relative to a reference time, so decaying them to the present is one
+scalar factor. Events made in this process update their cells in an overlay that is folded
+into the base arrays once it grows, instead of rereading the history. The weights are one of
+utils.derived_models, rebuilt from the store on every start.
+"""
+import math
+import os
+from datetime import datetime
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+from utils import derived_models, sqlite_store, user_activity
+from utils.activity_log import read_events
+from utils.derived_models import DerivedModel
+from utils.file_store import locked
+from utils.video_sets import normalize_video_id
+
+WEIGHT_KINDS = ("liked", "shares", "comments", "viewed")
+INTERACTION_WEIGHTS = {"liked": 1.0, "shares": 0.8, "comments": 0.6, "viewed": 0.5}
+EVENT_KINDS = {"like": "liked", "share": "shares", "comment": "comments", "view": "viewed"}
+HALF_LIFE_DAYS = float(os.environ.get("SPARKPLAY_INTERACTION_HALF_LIFE_DAYS", "30"))
+DECAY_PER_SECOND = math.log(2) / (HALF_LIFE_DAYS * 86400)
+OVERLAY_MAX_CELLS = 65536  # Updated cells kept aside before they are folded into the base arrays
+CHUNK_USERS = 8192
+
+def to_seconds(timestamps):
+    """Seconds since the epoch of ISO timestamps (local time, as make_event records them); NaN if unreadable."""
+    try:
+        return np.asarray(timestamps, dtype="datetime64[us]").astype(np.int64) / 1e6
+    except ValueError:
+        return np.array([to_seconds([timestamp])[0] if _parses(timestamp) else np.nan for timestamp in timestamps])
+
+def _parses(timestamp):
+    try:
+        np.datetime64(timestamp, "us")
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def _now():
+    return to_seconds([datetime.now().isoformat()])[0]
+
+def stored_events():
+    """Return the raw events of the history and the event log, oldest first."""
+    if sqlite_store.USE_SQLITE:
+        return []
+    history_dir = user_activity.USER_ACTIVITY_HISTORY_DIR
+    with locked(user_activity.USER_ACTIVITY_FILE, shared=True):
+        day_files = sorted(name for name in os.listdir(history_dir) if name.endswith(".jsonl")) if os.path.isdir(history_dir) else []
+        events = [event for name in day_files for event in read_events(os.path.join(history_dir, name))]
+        events += list(read_events(user_activity.USER_ACTIVITY_ROTATING_FILE))
+        events += list(read_events(user_activity.USER_ACTIVITY_LOG_FILE))
+    return events
+
+def snapshot_time():
+    """Seconds since the epoch the snapshot was written at, or None without one."""
+    snapshot = user_activity.USER_ACTIVITY_FILE
+    if not os.path.exists(snapshot):
+        return None
+    return to_seconds([datetime.fromtimestamp(os.path.getmtime(snapshot)).isoformat()])[0]
+
+class InteractionWeights(DerivedModel):
+    """Per-cell weights of each interaction type, as sorted arrays plus an overlay of updated cells."""
+
+    def __init__(self, activity_sets, synced=None):
+        super().__init__(activity_sets, synced)
+        self.usernames = []
+        self._rows = {}
+        self.reference = _now()
+        self._cells = np.zeros(0, dtype=np.int64)
+        self._weights = np.zeros((0, len(WEIGHT_KINDS)))
+        self._disliked = np.zeros(0, dtype=bool)
+        self._overlay = {}  # cell key -> (weights per kind, disliked)
+        self._overlay_rows = {}  # row -> its cell keys in the overlay
+        self._matrix = None  # Combined CSR at the reference time, until a cell changes
+
+    def rebuild(self, events=None, fallback_time=None):
+        """Recompute every cell from the activity sets and events (by default the store's raw events).
+
+        Interactions without an event count as if made at fallback_time (by default when the
+        snapshot was written, else now).
+        """
+        if events is None:
+            events, fallback_time = stored_events(), snapshot_time()
+        with self._lock:
+            self.usernames = list(self.activity_sets.users)
+            self._rows = {username: row for row, username in enumerate(self.usernames)}
+            self.reference = _now()
+            self._overlay, self._overlay_rows, self._matrix = {}, {}, None
+            self._build(events, self.reference if fallback_time is None else fallback_time)
+
+    def _build(self, events, fallback_time):
+        """Compute every cell's weights from the activity sets and the latest event times."""
+        index = self.activity_sets.index
+        kind_of = {kind: k for k, kind in enumerate(WEIGHT_KINDS)}
+        timed = [event for event in events if event.get("type") in EVENT_KINDS and event.get("user") in self._rows]
+        event_keys = np.array([(self._rows[e["user"]] << 32 | index.id_of(e["video"])) * 4 + kind_of[EVENT_KINDS[e["type"]]]
+                               for e in timed], dtype=np.int64)
+        event_times = to_seconds([event["timestamp"] for event in timed]) if timed else np.zeros(0)
+        # Latest time per (cell, kind): sort by key then time, keep each key's last entry
+        order = np.lexsort((event_times, event_keys))
+        event_keys, event_times = event_keys[order], event_times[order]
+        last = np.append(event_keys[1:] != event_keys[:-1], True) if len(event_keys) else np.zeros(0, dtype=bool)
+        event_keys, event_times = event_keys[last], event_times[last]
+
+        cells, kinds, times, disliked = [], [], [], []
+        for start in range(0, len(self.usernames), CHUNK_USERS):
+            chunk = self.usernames[start:start + CHUNK_USERS]
+            for kind in ("liked", "shares", "viewed", "disliked"):
+                bits = self.activity_sets.matrix(kind, chunk)
+                # flatnonzero over a bool view is several times faster than nonzero on uint8
+                rows, columns = divmod(np.flatnonzero(bits.view(bool)), bits.shape[1])
+                keys = (rows.astype(np.int64) + start) << 32 | columns
+                if kind == "disliked":
+                    disliked.append(keys)
+                    continue
+                cells.append(keys)
+                kinds.append(np.full(len(keys), kind_of[kind]))
+                times.append(np.full(len(keys), np.nan))
+        # Comments are not bitsets; their records carry their own times
+        comment_cells, comment_times = [], []
+        for username, compact in self.activity_sets.users.items():
+            for video_id, comments in compact.comments.items():
+                if comments:
+                    comment_cells.append(self._rows[username] << 32 | index.id_of(video_id))
+                    comment_times.append(max(comment["timestamp"] for comment in comments))
+        cells.append(np.array(comment_cells, dtype=np.int64))
+        kinds.append(np.full(len(comment_cells), kind_of["comments"]))
+        times.append(to_seconds(comment_times) if comment_times else np.zeros(0))
+
+        cells, kinds, times = np.concatenate(cells), np.concatenate(kinds), np.concatenate(times)
+        if len(event_keys):
+            keys = cells * 4 + kinds
+            positions = np.minimum(np.searchsorted(event_keys, keys), len(event_keys) - 1)
+            found = (event_keys[positions] == keys) & np.isnan(times)
+            times[found] = event_times[positions[found]]
+        times[np.isnan(times)] = fallback_time
+
+        self._cells, inverse = np.unique(cells, return_inverse=True)
+        self._weights = np.zeros((len(self._cells), len(WEIGHT_KINDS)))
+        type_weights = np.array([INTERACTION_WEIGHTS[kind] for kind in WEIGHT_KINDS])
+        self._weights[inverse, kinds] = type_weights[kinds] * np.exp(DECAY_PER_SECOND * (times - self.reference))
+        self._disliked = np.isin(self._cells, np.concatenate(disliked) if disliked else np.zeros(0, dtype=np.int64))
+
+    def _cell(self, key):
+        """Return (weights per kind, disliked) of one cell."""
+        if key in self._overlay:
+            return self._overlay[key]
+        position = np.searchsorted(self._cells, key)
+        if position < len(self._cells) and self._cells[position] == key:
+            return self._weights[position].copy(), bool(self._disliked[position])
+        return np.zeros(len(WEIGHT_KINDS)), False
+
+    def update(self, event, before):
+        """Fold one activity event in, updating only the cell of its user and video."""
+        if event["type"] not in EVENT_KINDS and event["type"] != "dislike":
+            return
+        with self._lock:
+            username = event["user"]
+            if username not in self._rows:
+                self._rows[username] = len(self.usernames)
+                self.usernames.append(username)
+            column = self.activity_sets.index.id_of(event["video"])
+            key = self._rows[username] << 32 | column
+            weights, _ = self._cell(key)
+            compact = self.activity_sets.users[username]
+            members = {kind: column in compact.sets[kind] for kind in ("liked", "shares", "viewed")}
+            members["comments"] = normalize_video_id(event["video"]) in compact.comments
+            for k, kind in enumerate(WEIGHT_KINDS):
+                if not members[kind]:
+                    weights[k] = 0.0
+                elif EVENT_KINDS.get(event["type"]) == kind:
+                    age = to_seconds([event["timestamp"]])[0] - self.reference
+                    weights[k] = INTERACTION_WEIGHTS[kind] * math.exp(DECAY_PER_SECOND * age)
+            self._overlay[key] = (weights, column in compact.sets["disliked"])
+            self._overlay_rows.setdefault(self._rows[username], set()).add(key)
+            self._matrix = None
+            if len(self._overlay) > OVERLAY_MAX_CELLS:
+                self._fold()
+
+    def _fold(self):
+        """Merge the overlay into the base arrays and move the reference time to now."""
+        keys = np.array(sorted(self._overlay), dtype=np.int64)
+        weights = np.array([self._overlay[key][0] for key in keys]).reshape(len(keys), len(WEIGHT_KINDS))
+        disliked = np.array([self._overlay[key][1] for key in keys], dtype=bool)
+        kept = ~np.isin(self._cells, keys)
+        cells = np.concatenate([self._cells[kept], keys])
+        order = np.argsort(cells, kind="stable")
+        self._cells = cells[order]
+        self._weights = np.concatenate([self._weights[kept], weights])[order]
+        self._disliked = np.concatenate([self._disliked[kept], disliked])[order]
+        self._overlay, self._overlay_rows = {}, {}
+        now = _now()
+        self._weights *= math.exp(DECAY_PER_SECOND * (self.reference - now))
+        self.reference = now
+
+    def _combined(self):
+        """Return the users x videos CSR of summed weights at the reference time."""
+        with self._lock:
+            if self._matrix is not None:
+                return self._matrix, self.reference
+            cells, weights, disliked = self._cells, self._weights, self._disliked
+            if self._overlay:
+                keys = np.fromiter(self._overlay, dtype=np.int64, count=len(self._overlay))
+                kept = ~np.isin(cells, keys)
+                cells = np.concatenate([cells[kept], keys])
+                overlay = list(self._overlay.values())
+                weights = np.concatenate([weights[kept], np.array([cell[0] for cell in overlay]).reshape(len(keys), len(WEIGHT_KINDS))])
+                disliked = np.concatenate([disliked[kept], np.array([cell[1] for cell in overlay], dtype=bool)])
+            values = np.where(disliked, 0.0, weights.sum(axis=1))
+            shape = (len(self.usernames), len(self.activity_sets.index))
+            self._matrix = csr_matrix((values, (cells >> 32, cells & 0xFFFFFFFF)), shape=shape)
+            self._matrix.eliminate_zeros()
+            return self._matrix, self.reference
+
+    def matrix(self, user_ids=None, video_ids=None, now=None):
+        """Return the weights decayed to now as a CSR matrix, optionally in the given row and column order.
+
+        Users or videos the store has never seen get zero rows or columns.
+        """
+        matrix, reference = self._combined()
+        matrix = matrix * math.exp(-DECAY_PER_SECOND * ((_now() if now is None else now) - reference))
+        if user_ids is not None:
+            rows = np.array([self._rows.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+            matrix = _select(matrix, rows, axis=0)
+        if video_ids is not None:
+            index = self.activity_sets.index
+            columns = np.array([index.id_of(video_id) for video_id in video_ids], dtype=np.int64)
+            matrix = _select(matrix, columns, axis=1)
+        return matrix.tocsr()
+
+    def row(self, user_id, video_ids=None, now=None):
+        """Return (positions, weights) of one user's non-zero cells decayed to now, positions into video_ids.
+
+        Reads only that user's base cells and overlay entries, so unlike matrix() it does not
+        rebuild the combined CSR after every event. Without video_ids, positions are the
+        activity index's video IDs; videos not in video_ids are left out.
+        """
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return np.zeros(0, dtype=np.int64), np.zeros(0)
+            start, end = np.searchsorted(self._cells, [row << 32, (row + 1) << 32])
+            values = dict(zip((self._cells[start:end] & 0xFFFFFFFF).tolist(),
+                              np.where(self._disliked[start:end], 0.0, self._weights[start:end].sum(axis=1)).tolist()))
+            for key in self._overlay_rows.get(row, ()):
+                weights, disliked = self._overlay[key]
+                values[key & 0xFFFFFFFF] = 0.0 if disliked else float(weights.sum())
+            reference = self.reference
+        decay = math.exp(-DECAY_PER_SECOND * ((_now() if now is None else now) - reference))
+        values = {column: value * decay for column, value in values.items() if value}
+        if video_ids is not None:
+            index = self.activity_sets.index
+            cells = [(position, values.get(index.id_of(video_id))) for position, video_id in enumerate(video_ids)]
+            values = {position: value for position, value in cells if value is not None}
+        positions = np.array(sorted(values), dtype=np.int64)
+        return positions, np.array([values[position] for position in positions.tolist()])
+
+def _select(matrix, positions, axis):
+    """Take rows or columns by position, with zeros where the position is -1 or out of range."""
+    known = (positions >= 0) & (positions < matrix.shape[axis])
+    if not known.any():
+        shape = (len(positions), matrix.shape[1]) if axis == 0 else (matrix.shape[0], len(positions))
+        return csr_matrix(shape)
+    mask = diags(known.astype(np.float64))
+    positions = np.where(known, positions, 0)
+    return mask @ matrix[positions] if axis == 0 else matrix.tocsc()[:, positions] @ mask
+
+def get_weights():
+    """Return the process-wide weights (see utils.derived_models)."""
+    return derived_models.get_model("interaction_weights")
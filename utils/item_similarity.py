@@ -0,0 +1,142 @@
+"""Item-item cosine similarity over all users' likes and views, maintained incrementally.
+
+Each user rates a video 1 if they liked it and 0.5 if they only viewed it, as in the
+interaction matrix of main.py. The model keeps, per video, the squared norm of its rating
+column and its dot products with every video it co-occurs with, so a new like or view only
+touches the rows of the videos the user has rated, and similarities are read off directly.
+
+The model is one of utils.derived_models: it shares the process's activity sets and is
+saved on exit together with the activity version it reflects.
+"""
+import math
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from utils import derived_models
+from utils.derived_models import DerivedModel
+
+ITEM_SIMILARITY_FILE = "item_similarity.json"
+LIKE_WEIGHT = 1.0
+VIEW_WEIGHT = 0.5
+RATINGS_CHUNK_USERS = 8192
+
+class ItemSimilarity(DerivedModel):
+    """Per-video squared norms and sparse co-occurrence dot products."""
+
+    path = ITEM_SIMILARITY_FILE
+
+    def __init__(self, activity_sets, synced=None):
+        super().__init__(activity_sets, synced)
+        self.norms = {}  # video -> sum of squared ratings
+        self.dots = {}  # video -> {other video: sum of rating products}
+
+    def ratings(self, username):
+        """Return {video index: rating} for one user."""
+        compact = self.activity_sets.users.get(username)
+        if compact is None:
+            return {}
+        ratings = {i: VIEW_WEIGHT for i in compact.sets["viewed"]}
+        ratings.update((i, LIKE_WEIGHT) for i in compact.sets["liked"])
+        return ratings
+
+    def _set_rating(self, ratings, video, rating):
+        """Move one user's rating of video to `rating`, updating only that video's rows."""
+        delta = rating - ratings.get(video, 0.0)
+        if delta == 0:
+            return
+        self.norms[video] = self.norms.get(video, 0.0) + rating * rating - ratings.get(video, 0.0) ** 2
+        row = self.dots.setdefault(video, {})
+        for other, other_rating in ratings.items():
+            if other == video:
+                continue
+            product = delta * other_rating
+            row[other] = row.get(other, 0.0) + product
+            other_row = self.dots.setdefault(other, {})
+            other_row[video] = other_row.get(video, 0.0) + product
+            if row[other] == 0:  # Ratings are multiples of 0.5, so the sums are exact
+                del row[other], other_row[video]
+        if rating:
+            ratings[video] = rating
+        else:
+            ratings.pop(video, None)
+        self.dirty = True
+
+    def rebuild(self):
+        """Recompute norms and dot products from scratch."""
+        self.norms, self.dots = {}, {}
+        for username in self.activity_sets.users:
+            ratings = {}
+            for video, rating in self.ratings(username).items():
+                self._set_rating(ratings, video, rating)
+
+    def before_event(self, event):
+        # Only likes, dislikes and views change ratings
+        return self.ratings(event["user"]) if event["type"] in ("like", "dislike", "view") else None
+
+    def update(self, event, before):
+        if before is None:
+            return
+        with self._lock:
+            after = self.ratings(event["user"])
+            for video in set(before) | set(after):
+                if before.get(video) != after.get(video):
+                    self._set_rating(before, video, after.get(video, 0.0))
+
+    def similarity(self, video_a, video_b):
+        norm = math.sqrt(self.norms.get(video_a, 0.0) * self.norms.get(video_b, 0.0))
+        return self.dots.get(video_a, {}).get(video_b, 0.0) / norm if norm else 0.0
+
+    def scores(self, ratings):
+        """Return {video ID: sum of similarity x rating} for ratings keyed by video ID.
+
+        Like multiplying the similarity matrix with a rating vector, but only the rows of
+        the rated videos are read.
+        """
+        index = self.activity_sets.index
+        scores = {}
+        with self._lock:
+            for video_id, rating in ratings.items():
+                video = index.id_of(video_id)
+                norm = math.sqrt(self.norms.get(video, 0.0))
+                if not norm or not rating:
+                    continue
+                # The diagonal (a video with itself) is 1 for every rated video
+                scores[video] = scores.get(video, 0.0) + rating
+                for other, dot in self.dots.get(video, {}).items():
+                    scores[other] = scores.get(other, 0.0) + rating * dot / (norm * math.sqrt(self.norms[other]))
+        return {index.video_of(video): score for video, score in scores.items()}
+
+    def to_json(self):
+        video_of = self.activity_sets.index.video_of
+        return {
+            "norms": {video_of(v): norm for v, norm in self.norms.items()},
+            "dots": {video_of(v): {video_of(o): dot for o, dot in row.items()} for v, row in self.dots.items()}
+        }
+
+    def load_json(self, data):
+        id_of = self.activity_sets.index.id_of
+        self.norms = {id_of(v): norm for v, norm in data["norms"].items()}
+        self.dots = {id_of(v): {id_of(o): dot for o, dot in row.items()} for v, row in data["dots"].items()}
+
+def ratings_matrix(activity_sets, chunk_users=RATINGS_CHUNK_USERS):
+    """Return (usernames, CSR users x videos matrix) of the same ratings the model uses."""
+    usernames = list(activity_sets.users)
+    chunks = []
+    for start in range(0, len(usernames), chunk_users):
+        # Unpack the bitsets of a chunk of users at a time, then keep only the non-zeros
+        chunk = usernames[start:start + chunk_users]
+        liked = activity_sets.matrix("liked", chunk)
+        viewed = activity_sets.matrix("viewed", chunk)
+        ratings = np.where(liked, np.float32(LIKE_WEIGHT), np.where(viewed, np.float32(VIEW_WEIGHT), np.float32(0)))
+        chunks.append(csr_matrix(ratings))
+    if not chunks:
+        return usernames, csr_matrix((0, len(activity_sets.index)), dtype=np.float32)
+    return usernames, vstack(chunks, format="csr")
+
+def get_model():
+    """Return the process-wide model (see utils.derived_models)."""
+    return derived_models.get_model("item_similarity")
+
+if __name__ == "__main__":
+    model = derived_models.rebuild_and_save(ItemSimilarity)
+    print(f"Saved {ITEM_SIMILARITY_FILE}: {len(model.norms)} videos, "
+          f"{sum(len(row) for row in model.dots.values()) // 2} co-occurring pairs")
@@ -0,0 +1,141 @@
+"""In-process implicit-feedback ALS with NumPy, the small-data counterpart of utils.spark_als.
+
+Uses the same implicit weights and parameters (rank, iterations, regularization, alpha) and
+alternates the same least-squares problems (Hu, Koren and Volinsky) without Spark: each
+user's and video's factors come from the Gram matrix of the other side plus a correction over
+only the videos (users) they interacted with, solved approximately by conjugate gradient. Meant for stores below the Spark threshold of
+utils.compute_backend, where it trains in about the time Spark needs to start.
+
+Every activity flush changes the store, so get_model() does not retrain in the request: only the
+first call trains before returning. After that, a changed store starts a retrain on a background
+thread, at most one at a time and at most once every SPARKPLAY_ALS_RETRAIN_MINUTES (default 10),
+and the previous model serves until the new one replaces it.
+"""
+import os
+import threading
+import time
+import traceback
+import numpy as np
+from scipy.sparse import csr_matrix
+from utils import user_activity
+from utils.spark_als import ALS_RANK, ALS_MAX_ITER, ALS_REG_PARAM, ALS_ALPHA, interaction_rows
+
+CG_STEPS = 3  # Conjugate gradient steps per half-iteration, warm-started from the previous factors
+RETRAIN_INTERVAL_SECONDS = float(os.environ.get("SPARKPLAY_ALS_RETRAIN_MINUTES", "10")) * 60
+
+class LocalALSModel:
+    """User and video factors with the IDs they belong to."""
+
+    def __init__(self, usernames, video_ids, user_factors, video_factors):
+        self.usernames = usernames
+        self.video_ids = video_ids
+        self.user_rows = {username: row for row, username in enumerate(usernames)}
+        self.user_factors = user_factors
+        self.video_factors = video_factors
+
+    def recommend(self, usernames, count=3, exclude=None):
+        """Return {username: [video IDs]} like spark_als.recommend; unknown users get no entry."""
+        exclude = exclude or {}
+        recommendations = {}
+        for username in usernames:
+            row = self.user_rows.get(username)
+            if row is None:
+                continue
+            scores = self.video_factors @ self.user_factors[row]
+            skip = exclude.get(username, ())
+            ranked = (self.video_ids[column] for column in np.argsort(-scores, kind="stable"))
+            recommendations[username] = [video_id for video_id in ranked if video_id not in skip][:count]
+        return recommendations
+
+def _solve(confidence, fixed, factors, reg_param, steps=CG_STEPS):
+    """Refine every row's factors against the fixed side; confidence is rows x fixed-rows CSR.
+
+    Runs a few conjugate gradient steps on all rows' normal equations at once,
+    (YtY + Yu^T (Cu - I) Yu + reg I) x = Yu^T Cu 1, so a step costs one pass over the
+    ratings instead of a rank x rank system per row.
+    """
+    gram = fixed.T @ fixed + reg_param * np.eye(fixed.shape[1])
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+    rated = fixed[confidence.indices]
+
+    def product(x):
+        dots = np.einsum("ij,ij->i", x[rows], rated)
+        correction = csr_matrix((confidence.data * dots, confidence.indices, confidence.indptr), shape=confidence.shape)
+        return x @ gram + correction @ fixed
+
+    targets = csr_matrix((1 + confidence.data, confidence.indices, confidence.indptr), shape=confidence.shape) @ fixed
+    x = factors.copy()
+    residual = targets - product(x)
+    direction = residual.copy()
+    residual_norms = (residual * residual).sum(axis=1)
+    for _ in range(steps):
+        step_product = product(direction)
+        curvature = (direction * step_product).sum(axis=1)
+        alpha = np.divide(residual_norms, curvature, out=np.zeros_like(curvature), where=curvature > 0)
+        x += alpha[:, None] * direction
+        residual -= alpha[:, None] * step_product
+        new_norms = (residual * residual).sum(axis=1)
+        beta = np.divide(new_norms, residual_norms, out=np.zeros_like(new_norms), where=residual_norms > 0)
+        direction = residual + beta[:, None] * direction
+        residual_norms = new_norms
+    return x
+
+def train(activity_data, rank=ALS_RANK, max_iter=ALS_MAX_ITER, reg_param=ALS_REG_PARAM, alpha=ALS_ALPHA, seed=0):
+    """Fit factors on activity store data ({username: activity record})."""
+    rows = list(interaction_rows(activity_data))
+    usernames = list(dict.fromkeys(username for username, _, _ in rows))
+    video_ids = list(dict.fromkeys(video_id for _, video_id, _ in rows))
+    user_rows = {username: row for row, username in enumerate(usernames)}
+    video_columns = {video_id: column for column, video_id in enumerate(video_ids)}
+    # Stored as alpha x weight; the solves add the 1 of confidence = 1 + alpha x weight
+    confidence = csr_matrix(([alpha * weight for _, _, weight in rows],
+                             ([user_rows[username] for username, _, _ in rows], [video_columns[video_id] for _, video_id, _ in rows])),
+                            shape=(len(usernames), len(video_ids)))
+    by_video = confidence.T.tocsr()
+
+    rng = np.random.default_rng(seed)
+    video_factors = rng.normal(scale=0.01, size=(len(video_ids), rank))
+    user_factors = np.zeros((len(usernames), rank))
+    for _ in range(max_iter):
+        user_factors = _solve(confidence, video_factors, user_factors, reg_param)
+        video_factors = _solve(by_video, user_factors, video_factors, reg_param)
+    return LocalALSModel(usernames, video_ids, user_factors, video_factors)
+
+_model = None
+_model_version = None
+_trained_at = None  # time.monotonic() of the last retrain's start
+_model_lock = threading.Lock()  # Held by the first, synchronous training
+_retrain_lock = threading.Lock()
+_retraining = False
+
+def _retrain():
+    """Train on the store as it is now and swap the model in; returns nothing, errors are printed."""
+    global _model, _model_version, _retraining
+    try:
+        version = user_activity.activity_version()  # Before the load, so a write during it is retrained later
+        model = train(user_activity.load_user_activity())
+        _model, _model_version = model, version
+    except Exception:
+        traceback.print_exc()  # Keep serving the previous model
+    finally:
+        _retraining = False
+
+def get_model():
+    """Return a model of the activity store; the first call trains, later ones may serve an older one."""
+    global _model, _model_version, _trained_at, _retraining
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _trained_at = time.monotonic()
+                version = user_activity.activity_version()
+                _model = train(user_activity.load_user_activity())
+                _model_version = version
+        return _model
+    if user_activity.activity_version() != _model_version and time.monotonic() - _trained_at >= RETRAIN_INTERVAL_SECONDS:
+        with _retrain_lock:
+            if _retraining or time.monotonic() - _trained_at < RETRAIN_INTERVAL_SECONDS:
+                return _model
+            _retraining = True
+            _trained_at = time.monotonic()
+        threading.Thread(target=_retrain, name="local-als-retrain", daemon=True).start()
+    return _model
@@ -0,0 +1,170 @@
+"""Top-K most similar videos per video, precomputed offline and memory-mapped for serving.
+
+    python -m utils.neighbour_index --k 50
+
+builds the index from the stored activity with the ratings of utils.item_similarity. The
+file holds a JSON header (video IDs, build info) followed by an int32 (videos x K) array of
+neighbour rows (-1 where a video has fewer than K neighbours) and a float32 array of their
+cosine similarities. Serving reads only the neighbour rows of the user's rated videos, so its
+cost depends on K and the user's history, not on the catalog size.
+
+The index reflects the activity at the time it was built, whose version its header records
+(the activity store's, or the activity lake's when built from it); it is never updated in
+place. Staleness is bounded by age: serving keeps using an index that is no longer current()
+for up to MAX_STALE_SECONDS after its build (see fresh()), since a few hours of new activity
+barely move the top neighbours of a video. Past that it serves from the incrementally updated
+utils.item_similarity model, whose cost grows with the catalog, so rebuild the index more
+often than that with the command above (or utils.spark_similarity from the activity lake),
+e.g. alongside the batch recommendations.
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+from datetime import datetime
+import numpy as np
+from scipy.sparse import diags
+from utils import activity_lake, user_activity
+from utils.file_store import atomic_write, file_version
+from utils.item_similarity import ratings_matrix
+
+NEIGHBOUR_INDEX_FILE = "video_neighbours.idx"
+INDEX_MAGIC = b"SPNI1"
+TOP_K = 50
+BUILD_CHUNK_VIDEOS = 1024  # Rows of the similarity matrix computed at a time
+# How long after its build an index that is no longer current still serves
+MAX_STALE_SECONDS = float(os.environ.get("SPARKPLAY_NEIGHBOUR_INDEX_MAX_STALE_HOURS", "24")) * 3600
+
+def top_k_neighbours(ratings, k=TOP_K, chunk_size=BUILD_CHUNK_VIDEOS):
+    """Return (neighbours int32, scores float32), both (videos x k), from a users x videos CSR matrix."""
+    video_count = ratings.shape[1]
+    norms = np.sqrt(np.asarray(ratings.multiply(ratings).sum(axis=0)).ravel())
+    inverse_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    normalized = (ratings @ diags(inverse_norms)).tocsc()
+    by_video = normalized.T.tocsr()
+
+    neighbours = np.full((video_count, k), -1, dtype=np.int32)
+    scores = np.zeros((video_count, k), dtype=np.float32)
+    for start in range(0, video_count, chunk_size):
+        # Only this chunk's rows of the (sparse) video x video similarity matrix exist at once
+        block = (by_video[start:start + chunk_size] @ normalized).tocsr()
+        for offset in range(block.shape[0]):
+            video = start + offset
+            row_start, row_end = block.indptr[offset], block.indptr[offset + 1]
+            columns, values = block.indices[row_start:row_end], block.data[row_start:row_end]
+            keep = (columns != video) & (values > 0)
+            columns, values = columns[keep], values[keep]
+            if len(values) > k:
+                top = np.argpartition(-values, k)[:k]
+                columns, values = columns[top], values[top]
+            order = np.argsort(-values, kind="stable")
+            neighbours[video, :len(order)] = columns[order]
+            scores[video, :len(order)] = values[order]
+    return neighbours, scores
+
+def write_index(path, video_ids, neighbours, scores, info=None):
+    """Atomically write an index file that NeighbourIndex can memory-map."""
+    header = json.dumps({"videos": video_ids, **(info or {})}).encode()
+    prefix = INDEX_MAGIC + struct.pack("<III", len(video_ids), neighbours.shape[1], len(header)) + header
+    padding = b"\0" * (-len(prefix) % 8)  # Keep the arrays aligned for the memory map
+
+    def write(file):
+        file.write(prefix + padding)
+        file.write(np.ascontiguousarray(neighbours, dtype="<i4").tobytes())
+        file.write(np.ascontiguousarray(scores, dtype="<f4").tobytes())
+
+    atomic_write(path, write, "wb")
+
+def build_index(path=NEIGHBOUR_INDEX_FILE, k=TOP_K):
+    """Build the index from the stored activity and write it to path."""
+    user_activity.flush_activity()
+    version = user_activity.activity_version()
+    activity_sets = user_activity.load_activity_sets()
+    _, ratings = ratings_matrix(activity_sets)
+    neighbours, scores = top_k_neighbours(ratings, k)
+    write_index(path, activity_sets.index.video_ids, neighbours, scores,
+                {"activity_version": version, "built_at": datetime.now().isoformat()})
+    return len(activity_sets.index), int((neighbours >= 0).sum())
+
+class NeighbourIndex:
+    """Read-only, memory-mapped view of an index file."""
+
+    def __init__(self, path=NEIGHBOUR_INDEX_FILE):
+        with open(path, "rb") as file:
+            prefix = file.read(len(INDEX_MAGIC) + 12)
+            if not prefix.startswith(INDEX_MAGIC):
+                raise ValueError(f"{path} is not a neighbour index")
+            video_count, k, header_len = struct.unpack_from("<III", prefix, len(INDEX_MAGIC))
+            self.info = json.loads(file.read(header_len))
+        offset = len(prefix) + header_len
+        offset += -offset % 8
+        self.video_ids = self.info.pop("videos")
+        self._rows = {video_id: row for row, video_id in enumerate(self.video_ids)}
+        self.neighbours = np.memmap(path, dtype="<i4", mode="r", offset=offset, shape=(video_count, k))
+        self.similarities = np.memmap(path, dtype="<f4", mode="r", offset=offset + 4 * video_count * k, shape=(video_count, k))
+
+    def current(self):
+        """True if nothing was stored since the index was built, in the store it was built from.
+
+        That is the activity lake for an index built by utils.spark_similarity, else the activity store.
+        """
+        if "lake" in self.info:
+            return self.info.get("lake_version") == activity_lake.version(self.info["lake"])
+        return self.info.get("activity_version") == user_activity.activity_version()
+
+    def age(self):
+        """Seconds since the index was built; infinite if the header does not say."""
+        built_at = self.info.get("built_at")
+        return (datetime.now() - datetime.fromisoformat(built_at)).total_seconds() if built_at else float("inf")
+
+    def fresh(self, max_stale=MAX_STALE_SECONDS):
+        """True if the index may serve: built less than max_stale seconds ago, or current()."""
+        return self.age() < max_stale or self.current()
+
+    def _merge(self, ratings):
+        """Return (unrated neighbour rows, summed rating x similarity) for ratings keyed by video ID."""
+        rated = [(self._rows[video_id], rating) for video_id, rating in ratings.items() if video_id in self._rows and rating > 0]
+        if not rated:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        rows = np.array([row for row, _ in rated])
+        # Gather the rated videos' neighbour rows, then merge by summing rating x similarity
+        candidates = self.neighbours[rows].ravel()
+        weights = (self.similarities[rows] * np.array([rating for _, rating in rated], dtype=np.float32)[:, None]).ravel()
+        valid = (candidates >= 0) & ~np.isin(candidates, rows)
+        videos, positions = np.unique(candidates[valid], return_inverse=True)
+        return videos, np.bincount(positions, weights=weights[valid])
+
+    def scores(self, ratings):
+        """Return {video ID: score} for the unrated neighbours of the rated videos."""
+        videos, totals = self._merge(ratings)
+        return {self.video_ids[video]: total for video, total in zip(videos, totals)}
+
+    def recommend(self, ratings, count=3):
+        """Return up to `count` video IDs for ratings keyed by video ID, best first, excluding rated ones."""
+        videos, totals = self._merge(ratings)
+        best = np.argsort(-totals, kind="stable")[:count]
+        return [self.video_ids[video] for video in videos[best]]
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+def get_index(path=NEIGHBOUR_INDEX_FILE):
+    """Return the memory-mapped index, remapping it after a rebuild; None if it was never built."""
+    global _index, _index_version
+    version = file_version(path)
+    if version != _index_version:
+        with _index_lock:
+            if version != _index_version:
+                _index = NeighbourIndex(path) if version is not None else None
+                _index_version = version
+    return _index
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the top-K video neighbour index.")
+    parser.add_argument("--k", type=int, default=TOP_K, help="neighbours kept per video")
+    parser.add_argument("--output", default=NEIGHBOUR_INDEX_FILE)
+    args = parser.parse_args()
+    video_count, pairs = build_index(args.output, args.k)
+    print(f"Wrote {args.output}: {video_count} videos, {pairs} neighbour entries (k={args.k})")
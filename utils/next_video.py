@@ -0,0 +1,115 @@
+"""Up-next candidates from the order users watch videos in.
+
+This model counts, over all users, how often one video was watched right after another
+(first order) and right after a pair of videos (second order). The counts come from the raw
+view events (activity_history/ plus the event log, see interaction_weights.stored_events), so
+rewatches count: A, B, A is two transitions. Only a view repeating the user's previous view is
+not one. The store's viewed lists keep each video once, in first-view order, and stand in for
+the views the raw history does not cover: those of the snapshot before it, and all of them
+with the SQLite store, which keeps no raw events.
+
+A new view adds one to at most two counts, and serving reads the counts that follow the
+current video, so nothing on the request path depends on the number of users or videos. The
+model is one of utils.derived_models, saved on exit with the activity version it reflects.
+"""
+import heapq
+from utils import derived_models
+from utils.derived_models import DerivedModel
+from utils.interaction_weights import stored_events
+
+NEXT_VIDEO_FILE = "next_video.json"
+MIN_PAIR_COUNT = 2  # Second-order counts are used once a pair was followed at least this often
+
+class NextVideoModel(DerivedModel):
+    """Sparse transition counts between video indexes of an ActivitySets."""
+
+    path = NEXT_VIDEO_FILE
+
+    def __init__(self, activity_sets, synced=None):
+        super().__init__(activity_sets, synced)
+        self.transitions = {}  # video -> {next video: count}
+        self.pair_transitions = {}  # (video before, video) -> {next video: count}
+        self.recent = {}  # username -> the last (up to) two videos they watched
+
+    def _count(self, order):
+        """Count the transitions ending at the last video of a watch order."""
+        if len(order) < 2:
+            return
+        row = self.transitions.setdefault(order[-2], {})
+        row[order[-1]] = row.get(order[-1], 0) + 1
+        if len(order) >= 3:
+            row = self.pair_transitions.setdefault((order[-3], order[-2]), {})
+            row[order[-1]] = row.get(order[-1], 0) + 1
+        self.dirty = True
+
+    def _watch(self, username, video):
+        """Extend a user's watch sequence by one view and count its transitions."""
+        recent = self.recent.get(username, [])
+        if recent and recent[-1] == video:
+            return  # Watched again right away: not a transition
+        order = recent[-2:] + [video]
+        self._count(order)
+        self.recent[username] = order[-2:]
+
+    def rebuild(self):
+        """Recount all transitions from the raw view events, and the viewed lists before them."""
+        index = self.activity_sets.index
+        views = {}
+        for event in stored_events():
+            if event.get("type") == "view" and event.get("user") in self.activity_sets.users:
+                views.setdefault(event["user"], []).append(index.id_of(event["video"]))
+        with self._lock:
+            self.transitions, self.pair_transitions, self.recent = {}, {}, {}
+            for username, compact in self.activity_sets.users.items():
+                watched = views.get(username, [])
+                # First views older than the raw history, in the order the store kept them
+                covered = set(watched)
+                for video in [video for video in compact.viewed_order if video not in covered] + watched:
+                    self._watch(username, video)
+
+    def update(self, event, before):
+        if event["type"] != "view":
+            return
+        with self._lock:
+            self._watch(event["user"], self.activity_sets.index.id_of(event["video"]))
+
+    def up_next(self, video_id, previous_id=None, count=5, exclude=()):
+        """Return video IDs most often watched after video_id (after previous_id then video_id, if known)."""
+        index = self.activity_sets.index
+        video = index.id_of(video_id)
+        skip = {index.id_of(excluded) for excluded in exclude} | {video}
+        with self._lock:
+            candidates = self.transitions.get(video, {})
+            if previous_id is not None:
+                pair = self.pair_transitions.get((index.id_of(previous_id), video), {})
+                if sum(pair.values()) >= MIN_PAIR_COUNT:
+                    candidates = pair
+            best = heapq.nlargest(count + len(skip), candidates.items(), key=lambda item: item[1])
+        return [index.video_of(next_video) for next_video, _ in best if next_video not in skip][:count]
+
+    def to_json(self):
+        video_of = self.activity_sets.index.video_of
+        return {
+            "transitions": {video_of(v): {video_of(n): c for n, c in row.items()} for v, row in self.transitions.items()},
+            "pair_transitions": [[video_of(a), video_of(b), {video_of(n): c for n, c in row.items()}]
+                                 for (a, b), row in self.pair_transitions.items()],
+            "recent": {username: [video_of(v) for v in recent] for username, recent in self.recent.items()}
+        }
+
+    def load_json(self, data):
+        id_of = self.activity_sets.index.id_of
+        self.transitions = {id_of(v): {id_of(n): c for n, c in row.items()} for v, row in data["transitions"].items()}
+        self.pair_transitions = {(id_of(a), id_of(b)): {id_of(n): c for n, c in row.items()} for a, b, row in data["pair_transitions"]}
+        if "recent" in data:
+            self.recent = {username: [id_of(v) for v in recent] for username, recent in data["recent"].items()}
+        else:  # Saved before rewatches were counted
+            self.recent = {username: compact.viewed_order[-2:] for username, compact in self.activity_sets.users.items()}
+
+def get_model():
+    """Return the process-wide model (see utils.derived_models)."""
+    return derived_models.get_model("next_video")
+
+if __name__ == "__main__":
+    model = derived_models.rebuild_and_save(NextVideoModel)
+    print(f"Saved {NEXT_VIDEO_FILE}: {sum(len(row) for row in model.transitions.values())} transitions, "
+          f"{sum(len(row) for row in model.pair_transitions.values())} pair transitions")
@@ -0,0 +1,156 @@
+"""Popularity rankings per genre and per location, for users with little or no activity.
+
+A user adds to a video's popularity by viewing (1), sharing (2) or liking (3) it; disliking it
+takes their contribution away. Scores are kept overall (ranked within each catalog genre) and
+per sign-up location, and updated from the activity stream one event at a time. Rankings are
+sorted only when a segment changed since it was last read, so serving is a dictionary lookup.
+
+The model is one of utils.derived_models, saved on exit with the activity version it reflects.
+"""
+import heapq
+from utils import derived_models, user_activity
+from utils.activity_log import seen_videos
+from utils.data import video_metadata
+from utils.derived_models import DerivedModel
+from utils.video_sets import ActivitySets
+from utils.user_auth import load_user_data
+
+POPULARITY_FILE = "popularity.json"
+POPULARITY_WEIGHTS = {"viewed": 1.0, "shares": 2.0, "liked": 3.0}
+RANKING_SIZE = 50  # Videos kept per ranking
+COLD_START_MAX_RATINGS = 2  # Users with at most this many liked/viewed videos get popularity lists
+
+class Popularity(DerivedModel):
+    """Per-video popularity scores overall and per location, with lazily sorted rankings."""
+
+    path = POPULARITY_FILE
+
+    def __init__(self, activity_sets, videos=video_metadata, user_locations=None, synced=None):
+        super().__init__(activity_sets, synced)
+        self.genres = {video["Video_ID"]: video.get("Genre") for video in videos}
+        self.overall = {}  # video ID -> score
+        self.locations = {}  # location -> {video ID: score}
+        self._rankings = {}  # ("genre" | "location" | "all", name) -> [video IDs], dropped when stale
+        self._user_locations = dict(user_locations or {})  # Filled from user_data.json on first use
+
+    def location_of(self, username):
+        if username not in self._user_locations:
+            self._user_locations[username] = load_user_data().get(username, {}).get("location")
+        return self._user_locations[username]
+
+    def contribution(self, username):
+        """Return {video ID: score} the user adds to the rankings."""
+        compact = self.activity_sets.users.get(username)
+        if compact is None:
+            return {}
+        video_of = self.activity_sets.index.video_of
+        scores = {}
+        for key, weight in POPULARITY_WEIGHTS.items():
+            for video in compact.sets[key]:
+                scores[video] = scores.get(video, 0.0) + weight
+        for video in compact.sets["disliked"]:
+            scores.pop(video, None)
+        return {video_of(video): score for video, score in scores.items()}
+
+    def _add(self, username, contribution, sign=1):
+        location = self.location_of(username)
+        segments = [self.overall] + ([self.locations.setdefault(location, {})] if location else [])
+        for video_id, score in contribution.items():
+            for scores in segments:
+                total = scores.get(video_id, 0.0) + sign * score
+                if total:
+                    scores[video_id] = total
+                else:
+                    scores.pop(video_id, None)
+            self._rankings.pop(("genre", self.genres.get(video_id)), None)
+        self._rankings.pop(("all", None), None)
+        if location:
+            self._rankings.pop(("location", location), None)
+        self.dirty = True
+
+    def rebuild(self):
+        """Recompute all scores from scratch."""
+        with self._lock:
+            self.overall, self.locations, self._rankings = {}, {}, {}
+            for username in self.activity_sets.users:
+                self._add(username, self.contribution(username))
+
+    def before_event(self, event):
+        # Only likes, dislikes, shares and views count
+        return self.contribution(event["user"]) if event["type"] in ("like", "dislike", "share", "view") else None
+
+    def update(self, event, before):
+        if before is None:
+            return
+        with self._lock:
+            after = self.contribution(event["user"])
+            delta = {video_id: after.get(video_id, 0.0) - before.get(video_id, 0.0) for video_id in set(before) | set(after)}
+            self._add(event["user"], {video_id: score for video_id, score in delta.items() if score})
+
+    def ranking(self, kind, name=None):
+        """Return the most popular catalog video IDs of a genre, a location, or overall ("all")."""
+        key = (kind, name)
+        ranking = self._rankings.get(key)
+        if ranking is not None:
+            return ranking
+        with self._lock:
+            if kind == "genre":
+                scores = {video_id: score for video_id, score in self.overall.items() if self.genres.get(video_id) == name}
+            else:
+                scores = self.locations.get(name, {}) if kind == "location" else self.overall
+            ranking = [video_id for video_id in heapq.nlargest(RANKING_SIZE, scores, key=scores.get)
+                       if video_id in self.genres and scores[video_id] > 0]
+            self._rankings[key] = ranking
+        return ranking
+
+    def recommend(self, favorite_genre=None, location=None, count=3, exclude=()):
+        """Return video IDs alternating the user's genre and location rankings, topped up overall."""
+        rankings = [self.ranking("genre", favorite_genre), self.ranking("location", location)]
+        interleaved = [video_id for pair in zip(*rankings) for video_id in pair]
+        shorter = min(len(ranking) for ranking in rankings)
+        candidates = interleaved + rankings[0][shorter:] + rankings[1][shorter:] + self.ranking("all")
+        # Catalog order fills in when there is no activity at all yet
+        candidates += [video_id for video_id, genre in self.genres.items() if genre == favorite_genre]
+        candidates += list(self.genres)
+        recommendations = []
+        for video_id in candidates:
+            if video_id not in exclude and video_id not in recommendations:
+                recommendations.append(video_id)
+                if len(recommendations) == count:
+                    break
+        return recommendations
+
+    def to_json(self):
+        return {"overall": self.overall, "locations": self.locations}
+
+    def load_json(self, data):
+        self.overall, self.locations, self._rankings = data["overall"], data["locations"], {}
+
+def is_cold_start(activity):
+    """True if a user's activity record has too few likes and views for collaborative filtering."""
+    return len(set(activity.get("liked", [])) | set(activity.get("viewed", []))) <= COLD_START_MAX_RATINGS
+
+def cold_start_recommendations(username, count=3):
+    """Return popular video IDs for the user's sign-up genre and location, minus what they have seen."""
+    profile = load_user_data().get(username, {})
+    exclude = seen_videos(user_activity.get_user_activity(username))
+    return get_model().recommend(profile.get("favorite_genre"), profile.get("location"), count, exclude)
+
+def fallback_recommendations(username, count=3, exclude=()):
+    """Like cold_start_recommendations, but never waits: for a page whose recommendations are late.
+
+    Until utils.derived_models has loaded the model, the catalog videos of the user's favorite
+    genre come first, then the rest of the catalog. exclude comes from the caller, since reading
+    the user's stored activity can wait on a load.
+    """
+    profile = load_user_data().get(username, {})
+    model = get_model() if derived_models.ready() else Popularity(ActivitySets())
+    return model.recommend(profile.get("favorite_genre"), profile.get("location"), count, set(exclude))
+
+def get_model():
+    """Return the process-wide model (see utils.derived_models)."""
+    return derived_models.get_model("popularity")
+
+if __name__ == "__main__":
+    model = derived_models.rebuild_and_save(Popularity)
+    print(f"Saved {POPULARITY_FILE}: {len(model.overall)} videos, {len(model.locations)} locations")
@@ -0,0 +1,48 @@
+import os
+import threading
+from utils.file_store import file_version
+
+# Process-wide cache of parsed stores: key -> (file versions, value)
+_entries = {}
+_stats = {}
+_lock = threading.Lock()
+
+def cached_load(paths, loader):
+    """Return loader()'s result, reparsing only when one of the files behind it changed.
+
+    A file counts as changed when its (mtime_ns, size, inode) differs. The cached value is
+    shared by every caller in the process, so treat it as read-only.
+    """
+    if isinstance(paths, str):
+        paths = (paths,)
+    key = tuple(os.path.abspath(path) for path in paths)
+    # Versions are taken before loading: a write racing the load just causes one more reparse
+    versions = tuple(file_version(path) for path in paths)
+    with _lock:
+        entry = _entries.get(key)
+        stats = _stats.setdefault(key, {"hits": 0, "misses": 0})
+        if entry is not None and entry[0] == versions:
+            stats["hits"] += 1
+            return entry[1]
+        stats["misses"] += 1
+    value = loader()
+    with _lock:
+        _entries[key] = (versions, value)
+    return value
+
+def invalidate(paths=None):
+    """Drop cached values for the given files, or all of them."""
+    with _lock:
+        if paths is None:
+            _entries.clear()
+            return
+        if isinstance(paths, str):
+            paths = (paths,)
+        targets = {os.path.abspath(path) for path in paths}
+        for key in [key for key in _entries if targets & set(key)]:
+            del _entries[key]
+
+def cache_stats():
+    """Return hit/miss counters per cached store, keyed by the primary file name."""
+    with _lock:
+        return {os.path.basename(key[0]): dict(stats) for key, stats in _stats.items()}
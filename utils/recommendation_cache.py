@@ -0,0 +1,120 @@
+"""Process-wide cache of computed recommendations, shared by all Streamlit sessions.
+
+An entry is valid for one (user, activity version, model version): the user's activity
+version is bumped by every like/dislike/view/share/comment they make in this process, and the
+model version changes when the neighbour index or the batch store is rebuilt. Entries also
+expire after a TTL, which bounds staleness from writes made by other processes.
+
+get_within() bounds how long a page waits: a computation that misses the deadline keeps
+running on a worker thread and fills the cache for the next rerun, while the page shows a
+fallback list instead.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from utils import user_activity
+from utils.batch_recommendations import RECOMMENDATIONS_FILE
+from utils.content_similarity import CONTENT_WEIGHT
+from utils.file_store import file_version
+from utils.neighbour_index import NEIGHBOUR_INDEX_FILE
+
+CACHE_MAX_USERS = int(os.environ.get("SPARKPLAY_RECOMMENDATION_CACHE_SIZE", "4096"))
+CACHE_TTL_SECONDS = 300
+SERVING_DEADLINE_SECONDS = float(os.environ.get("SPARKPLAY_RECOMMENDATION_DEADLINE_MS", "50")) / 1000
+SERVING_WORKERS = 4
+
+def model_version(catalog_size=0):
+    """Token of everything besides the user's activity that recommendations depend on."""
+    return (file_version(NEIGHBOUR_INDEX_FILE), file_version(RECOMMENDATIONS_FILE), CONTENT_WEIGHT, catalog_size)
+
+class RecommendationCache:
+    """LRU over users, one entry each, with TTL expiry and hit/miss counters."""
+
+    def __init__(self, max_users=CACHE_MAX_USERS, ttl=CACHE_TTL_SECONDS):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()  # username -> (activity version, model version, expires, value)
+        self._versions = {}  # username -> activity version
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0, "fallbacks": 0}
+        self._inflight = {}  # (username, activity version, model version) -> future of a computation on the workers
+        self._executor = ThreadPoolExecutor(SERVING_WORKERS, thread_name_prefix="recommendations")
+
+    def _lookup(self, username, model_version):
+        """Return (hit, value, activity version), counting the hit or miss."""
+        with self._lock:
+            activity_version = self._versions.get(username, 0)
+            entry = self._entries.get(username)
+            if entry is not None and entry[:2] == (activity_version, model_version):
+                if entry[2] > time.monotonic():
+                    self._entries.move_to_end(username)
+                    self._stats["hits"] += 1
+                    return True, entry[3], activity_version
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return False, None, activity_version
+
+    def get_or_compute(self, username, model_version, compute):
+        """Return the cached value for the user if still valid, else compute() and cache it."""
+        hit, value, activity_version = self._lookup(username, model_version)
+        if hit:
+            return value
+        return self._compute(username, activity_version, model_version, compute)
+
+    def get_within(self, username, model_version, compute, fallback, deadline=SERVING_DEADLINE_SECONDS):
+        """Like get_or_compute, but return fallback() if compute() has not finished within the deadline.
+
+        compute() runs on a worker thread, so it must not touch Streamlit session state.
+        """
+        hit, value, activity_version = self._lookup(username, model_version)
+        if hit:
+            return value
+        key = (username, activity_version, model_version)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:  # Else a rerun that fell back earlier is still computing it
+                future = self._inflight[key] = self._executor.submit(self._compute, username, activity_version, model_version, compute)
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        try:
+            return future.result(timeout=deadline)
+        except TimeoutError:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return fallback()
+
+    def _compute(self, username, activity_version, model_version, compute):
+        now = time.monotonic()
+        value = compute()
+        with self._lock:
+            # Skip storing if the user's activity changed while computing
+            if self._versions.get(username, 0) == activity_version:
+                self._entries[username] = (activity_version, model_version, now + self.ttl, value)
+                self._entries.move_to_end(username)
+                while len(self._entries) > self.max_users:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        return value
+
+    def invalidate(self, username=None):
+        """Drop one user's entry (bumping their activity version), or every entry."""
+        with self._lock:
+            self._stats["invalidations"] += 1
+            if username is None:
+                self._entries.clear()
+                return
+            self._versions[username] = self._versions.get(username, 0) + 1
+            self._entries.pop(username, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["fallback_rate"] = stats["fallbacks"] / lookups if lookups else 0.0
+        return stats
+
+recommendation_cache = RecommendationCache()
+# Any activity event of a user makes their cached recommendations stale
+user_activity.add_activity_listener(lambda event: recommendation_cache.invalidate(event["user"]))
@@ -0,0 +1,104 @@
+"""Implicit-feedback matrix factorization recommender on Spark MLlib ALS.
+
+    python -m utils.spark_als
+
+trains on the activity store and saves the fitted pipeline (user and video ID indexers plus
+the ALS model) to ALS_MODEL_DIR. Views, shares and likes count as implicit feedback of
+increasing strength; disliked videos are left out. pyspark is imported on first use, so the
+weights and parameters here are also usable by utils.local_als without it.
+"""
+import argparse
+import os
+import threading
+from utils.file_store import file_version
+
+ALS_MODEL_DIR = "als_model"
+# Implicit feedback strength per interaction; a user's weights for one video add up
+IMPLICIT_WEIGHTS = {"viewed": 1.0, "shares": 2.0, "liked": 3.0}
+ALS_RANK = 16
+ALS_MAX_ITER = 10
+ALS_REG_PARAM = 0.1
+ALS_ALPHA = 10.0  # Confidence scaling of the implicit weights
+
+def interaction_rows(activity_data):
+    """Yield (User_ID, Video_ID, weight) per user and video of the activity store."""
+    for username, activity in activity_data.items():
+        weights = {}
+        for key, weight in IMPLICIT_WEIGHTS.items():
+            for video_id in activity.get(key, []):
+                weights[video_id] = weights.get(video_id, 0.0) + weight
+        for video_id in activity.get("disliked", []):
+            weights.pop(video_id, None)
+        for video_id, weight in weights.items():
+            yield username, video_id, weight
+
+def interactions_frame(spark, activity_data):
+    return spark.createDataFrame(list(interaction_rows(activity_data)), schema="User_ID string, Video_ID string, weight double")
+
+def train(interactions, path=ALS_MODEL_DIR, rank=ALS_RANK, max_iter=ALS_MAX_ITER, reg_param=ALS_REG_PARAM, alpha=ALS_ALPHA):
+    """Fit indexers and ALS on a (User_ID, Video_ID, weight) DataFrame and save the pipeline."""
+    from pyspark.ml import Pipeline
+    from pyspark.ml.feature import StringIndexer
+    from pyspark.ml.recommendation import ALS
+    pipeline = Pipeline(stages=[
+        # ALS needs integer IDs; the fitted indexers map them back for serving
+        StringIndexer(inputCol="User_ID", outputCol="user", handleInvalid="skip"),
+        StringIndexer(inputCol="Video_ID", outputCol="item", handleInvalid="skip"),
+        ALS(userCol="user", itemCol="item", ratingCol="weight", implicitPrefs=True, rank=rank, maxIter=max_iter,
+            regParam=reg_param, alpha=alpha, nonnegative=True, coldStartStrategy="drop")
+    ])
+    model = pipeline.fit(interactions)
+    if path is not None:
+        model.write().overwrite().save(path)
+    return model
+
+def train_from_store(spark, path=ALS_MODEL_DIR):
+    """Train on the current activity store (utils.user_activity) and save the model."""
+    from utils.user_activity import load_user_activity
+    return train(interactions_frame(spark, load_user_activity()), path)
+
+def recommend(spark, model, usernames, count=3, exclude=None):
+    """Return {username: [video IDs]} for a batch of users with one recommendForUserSubset job.
+
+    exclude -- {username: videos not to recommend}, e.g. what the user already watched. Users
+    the model has not seen get no entry.
+    """
+    user_indexer, video_indexer, als_model = model.stages
+    exclude = exclude or {}
+    margin = max((len(videos) for videos in exclude.values()), default=0)
+    users = user_indexer.transform(spark.createDataFrame([(username,) for username in usernames], "User_ID string"))
+    rows = als_model.recommendForUserSubset(users.select("user"), count + margin).collect()
+
+    user_labels, video_labels = user_indexer.labels, video_indexer.labels
+    recommendations = {}
+    for row in rows:
+        username = user_labels[int(row["user"])]
+        skip = exclude.get(username, ())
+        videos = [video_labels[item["item"]] for item in row["recommendations"]]
+        recommendations[username] = [video_id for video_id in videos if video_id not in skip][:count]
+    return recommendations
+
+_model = None
+_model_version = None
+_model_lock = threading.Lock()
+
+def get_model(path=ALS_MODEL_DIR):
+    """Return the saved pipeline, reloading it after retraining; None if none was saved."""
+    global _model, _model_version
+    version = file_version(os.path.join(path, "metadata"))
+    if version != _model_version:
+        with _model_lock:
+            if version != _model_version:
+                from pyspark.ml import PipelineModel
+                _model = PipelineModel.load(path) if version is not None else None
+                _model_version = version
+    return _model
+
+if __name__ == "__main__":
+    from pyspark.sql import SparkSession
+    parser = argparse.ArgumentParser(description="Train the ALS recommender on the activity store.")
+    parser.add_argument("--output", default=ALS_MODEL_DIR)
+    args = parser.parse_args()
+    spark = SparkSession.builder.appName("Video Recommendation ALS").getOrCreate()
+    model = train_from_store(spark, args.output)
+    print(f"Saved ALS model to {args.output} (rank {model.stages[-1].rank})")
@@ -0,0 +1,107 @@
+"""Item-item cosine similarity on Spark, for catalogs too large for one machine's sparse products.
+
+    python -m utils.spark_similarity --k 50 --threshold 0.1 --partitions 64
+
+runs RowMatrix.columnSimilarities over the users x videos ratings of utils.item_similarity
+(liked 1, viewed 0.5), read from the Parquet activity lake (utils.activity_lake). The ratings
+are aggregated and grouped into user rows on the executors; only the distinct video IDs reach
+the driver, to number the columns. The lake is append-only, so a like that was later taken
+back still counts there, unlike in the activity store. With a threshold above 0 Spark uses
+DIMSUM sampling, which skips most of the work for pairs below it. Each video's top K
+neighbours are then picked per partition and written as a utils.neighbour_index file, so the
+Streamlit process serves them with the same memory-mapped index it uses for the single-node
+build. The file records the lake's version, taken before reading, so serving can tell when
+rows were appended since.
+"""
+import argparse
+import heapq
+from datetime import datetime
+import numpy as np
+from pyspark.mllib.linalg import Vectors
+from pyspark.mllib.linalg.distributed import RowMatrix
+from pyspark.sql import functions as F
+from utils import activity_lake
+from utils.activity_lake import ACTIVITY_LAKE_DIR
+from utils.compute_backend import SPARK
+from utils.data import video_metadata
+from utils.item_similarity import LIKE_WEIGHT, VIEW_WEIGHT
+from utils.neighbour_index import NEIGHBOUR_INDEX_FILE, TOP_K, write_index
+from utils.video_sets import VideoIndex
+
+SIMILARITY_THRESHOLD = 0.1  # Pairs expected below this may be dropped by sampling; 0 for exact
+DEFAULT_PARTITIONS = 8
+
+def lake_ratings(spark, path=ACTIVITY_LAKE_DIR, video_ids=None):
+    """Return (DataFrame of User_ID, video, rating, video IDs by column number) from the activity lake.
+
+    Columns follow video_ids (by default the catalog), then videos only the lake has.
+    """
+    interactions = SPARK.read_activity(path, ["User_ID", "Video_ID", "Interaction_Type"], interaction_types=["like", "view"])
+    index = VideoIndex(video_ids if video_ids is not None else (video["Video_ID"] for video in video_metadata))
+    # Legacy IDs of one video share its column, so the mapping is made here rather than on Spark
+    stored_ids = [row["Video_ID"] for row in interactions.select("Video_ID").distinct().collect()]
+    columns = spark.createDataFrame([(video_id, index.id_of(video_id)) for video_id in stored_ids], "Video_ID string, video int")
+    rating = F.when(F.col("Interaction_Type") == "like", LIKE_WEIGHT).otherwise(VIEW_WEIGHT)
+    ratings = interactions.join(F.broadcast(columns), "Video_ID").groupBy("User_ID", "video").agg(F.max(rating).alias("rating"))
+    return ratings, index.video_ids
+
+def rating_rows(ratings, video_count, partitions=DEFAULT_PARTITIONS):
+    """Return an RDD of sparse user rows of a (User_ID, video, rating) DataFrame, grouped on the executors."""
+    users = ratings.repartition(partitions, "User_ID").groupBy("User_ID") \
+        .agg(F.sort_array(F.collect_list(F.struct("video", "rating"))).alias("cells"))
+    return users.rdd.map(lambda user: Vectors.sparse(video_count, [cell["video"] for cell in user["cells"]],
+                                                     [cell["rating"] for cell in user["cells"]]))
+
+def _push(heap, item, k):
+    if len(heap) < k:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+    return heap
+
+def _merge(heap, other, k):
+    for item in other:
+        _push(heap, item, k)
+    return heap
+
+def top_k_similarities(rows, video_count, k=TOP_K, threshold=SIMILARITY_THRESHOLD):
+    """Return (neighbours int32, scores float32), both (videos x k), like neighbour_index.top_k_neighbours."""
+    entries = RowMatrix(rows, numCols=video_count).columnSimilarities(threshold).entries
+    # columnSimilarities returns the upper triangle; each pair is a neighbour of both its videos
+    both_ways = entries.flatMap(lambda entry: [(entry.i, (entry.value, entry.j)), (entry.j, (entry.value, entry.i))])
+    top = both_ways.aggregateByKey([], lambda heap, item: _push(heap, item, k), lambda a, b: _merge(a, b, k))
+
+    neighbours = np.full((video_count, k), -1, dtype=np.int32)
+    scores = np.zeros((video_count, k), dtype=np.float32)
+    for video, heap in top.toLocalIterator():
+        ranked = sorted(heap, reverse=True)
+        neighbours[video, :len(ranked)] = [neighbour for _, neighbour in ranked]
+        scores[video, :len(ranked)] = [score for score, _ in ranked]
+    return neighbours, scores
+
+def build_index(spark, path=NEIGHBOUR_INDEX_FILE, k=TOP_K, threshold=SIMILARITY_THRESHOLD, partitions=DEFAULT_PARTITIONS,
+                lake=ACTIVITY_LAKE_DIR):
+    """Build the neighbour index from the activity lake on Spark and write it to path."""
+    # The lake's version, not the activity store's: it is what the index is built from
+    version = activity_lake.version(lake)
+    ratings, video_ids = lake_ratings(spark, lake)
+    neighbours, scores = top_k_similarities(rating_rows(ratings, len(video_ids), partitions), len(video_ids), k, threshold)
+    write_index(path, video_ids, neighbours, scores,
+                {"lake": lake, "lake_version": version, "built_at": datetime.now().isoformat(),
+                 "method": "spark columnSimilarities", "threshold": threshold})
+    return len(video_ids), int((neighbours >= 0).sum())
+
+if __name__ == "__main__":
+    from pyspark.sql import SparkSession
+    parser = argparse.ArgumentParser(description="Build the video neighbour index on Spark.")
+    parser.add_argument("--k", type=int, default=TOP_K, help="neighbours kept per video")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD, help="DIMSUM similarity threshold")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument("--lake", default=ACTIVITY_LAKE_DIR, help="activity lake to read")
+    parser.add_argument("--output", default=NEIGHBOUR_INDEX_FILE)
+    args = parser.parse_args()
+    spark = SparkSession.builder.appName("Video Similarity").getOrCreate()
+    start = datetime.now()
+    videos, pairs = build_index(spark, args.output, args.k, args.threshold, args.partitions, args.lake)
+    print(f"Wrote {args.output}: {videos} videos, {pairs} neighbour entries "
+          f"({(datetime.now() - start).total_seconds():.2f}s)")
@@ -0,0 +1,271 @@
+import json
+import os
+import sqlite3
+import threading
+from utils.activity_log import empty_activity
+from utils.video_sets import normalize_video_id
+
+# Set SPARKPLAY_STORAGE=sqlite to serve activity, chat and user records from SQLite
+USE_SQLITE = os.environ.get("SPARKPLAY_STORAGE", "json").lower() == "sqlite"
+SQLITE_DB_FILE = os.environ.get("SPARKPLAY_DB", "sparkplay.db")
+
+# Interaction types stored in the interactions table, named after the activity lists
+INTERACTION_TYPES = ("liked", "disliked", "shares", "viewed")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    type TEXT NOT NULL,
+    UNIQUE (username, video_id, type)  -- Also serves as the (user, video) index
+);
+CREATE INDEX IF NOT EXISTS idx_interactions_video_type ON interactions (video_id, type);
+CREATE TABLE IF NOT EXISTS comments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    comment TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_comments_user_video ON comments (username, video_id);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_timestamp ON messages (conversation, timestamp);
+"""
+
+_local = threading.local()
+
+def connect():
+    """Return this thread's connection, creating the schema on first use."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(SQLITE_DB_FILE, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+# Activity
+
+def _has(conn, username, video_id, interaction_type):
+    row = conn.execute(
+        "SELECT 1 FROM interactions WHERE username = ? AND video_id = ? AND type = ?",
+        (username, video_id, interaction_type)).fetchone()
+    return row is not None
+
+def _add(conn, username, video_id, interaction_type):
+    conn.execute(
+        "INSERT OR IGNORE INTO interactions (username, video_id, type) VALUES (?, ?, ?)",
+        (username, video_id, interaction_type))
+
+def _remove(conn, username, video_id, interaction_type):
+    conn.execute(
+        "DELETE FROM interactions WHERE username = ? AND video_id = ? AND type = ?",
+        (username, video_id, interaction_type))
+
+def _apply(conn, event):
+    # Canonical IDs, as the JSON store folds them (see utils.video_sets)
+    username, video_id, event_type = event["user"], normalize_video_id(event["video"]), event["type"]
+    if event_type in ("like", "dislike"):
+        key, opposite_key = ("liked", "disliked") if event_type == "like" else ("disliked", "liked")
+        if _has(conn, username, video_id, key):
+            _remove(conn, username, video_id, key)
+        else:
+            _add(conn, username, video_id, key)
+            _remove(conn, username, video_id, opposite_key)
+    elif event_type == "comment":
+        conn.execute(
+            "INSERT INTO comments (username, video_id, comment, timestamp) VALUES (?, ?, ?, ?)",
+            (username, video_id, event["comment"], event["timestamp"]))
+    elif event_type == "share":
+        _add(conn, username, video_id, "shares")
+    elif event_type == "view":
+        _add(conn, username, video_id, "viewed")
+
+def apply_event(event):
+    """Apply one activity event (see utils.activity_log.make_event) in a transaction."""
+    apply_events([event])
+
+def apply_events(events):
+    """Apply a batch of activity events in a single transaction."""
+    conn = connect()
+    with conn:
+        for event in events:
+            _apply(conn, event)
+
+def get_user_videos(username, interaction_type):
+    """Return the videos a user has in one interaction list, oldest first."""
+    rows = connect().execute(
+        "SELECT video_id FROM interactions WHERE username = ? AND type = ? ORDER BY id",
+        (username, interaction_type)).fetchall()
+    return [row["video_id"] for row in rows]
+
+def get_user_activity(username):
+    """Build the activity record for a single user from indexed point queries."""
+    conn = connect()
+    user_activity = empty_activity()
+    for row in conn.execute(
+            "SELECT video_id, type FROM interactions WHERE username = ? ORDER BY id", (username,)):
+        user_activity[row["type"]].append(row["video_id"])
+    for row in conn.execute(
+            "SELECT video_id, comment, timestamp FROM comments WHERE username = ? ORDER BY id", (username,)):
+        user_activity["comments"].setdefault(row["video_id"], []).append(
+            {"comment": row["comment"], "timestamp": row["timestamp"]})
+    return user_activity
+
+def load_user_activity():
+    """Load the activity records of every user."""
+    conn = connect()
+    activity_data = {}
+    for row in conn.execute("SELECT username, video_id, type FROM interactions ORDER BY id"):
+        activity_data.setdefault(row["username"], empty_activity())[row["type"]].append(row["video_id"])
+    for row in conn.execute("SELECT username, video_id, comment, timestamp FROM comments ORDER BY id"):
+        comments = activity_data.setdefault(row["username"], empty_activity())["comments"]
+        comments.setdefault(row["video_id"], []).append({"comment": row["comment"], "timestamp": row["timestamp"]})
+    return activity_data
+
+def save_user_activity(activity_data):
+    """Replace all activity records with the given data, video IDs made canonical."""
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM interactions")
+        conn.execute("DELETE FROM comments")
+        for username, user_activity in activity_data.items():
+            for interaction_type in INTERACTION_TYPES:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO interactions (username, video_id, type) VALUES (?, ?, ?)",
+                    [(username, normalize_video_id(video_id), interaction_type)
+                     for video_id in user_activity.get(interaction_type, [])])
+            for video_id, comments in user_activity.get("comments", {}).items():
+                conn.executemany(
+                    "INSERT INTO comments (username, video_id, comment, timestamp) VALUES (?, ?, ?, ?)",
+                    [(username, normalize_video_id(video_id), c["comment"], c["timestamp"]) for c in comments])
+
+# Chat
+
+def fetch_conversation(conversation, cursor=None, since=None, last=None):
+    """Read one conversation (see utils.chat_store for the keys) in timestamp order.
+
+    Takes and returns the same (messages, cursor, reset) contract as chat_store.read_messages;
+    the cursor is the (timestamp, id) of the last message returned.
+    """
+    conn = connect()
+    if cursor is not None and cursor[1] is not None:
+        timestamp, message_id = cursor[1]
+        rows = conn.execute(
+            "SELECT id, timestamp, payload FROM messages WHERE conversation = ? "
+            "AND (timestamp > ? OR (timestamp = ? AND id > ?)) ORDER BY timestamp, id",
+            (conversation, timestamp, timestamp, message_id)).fetchall()
+    elif since is not None:
+        rows = conn.execute(
+            "SELECT id, timestamp, payload FROM messages WHERE conversation = ? AND timestamp > ? "
+            "ORDER BY timestamp, id", (conversation, since)).fetchall()
+    elif last is not None:
+        rows = conn.execute(
+            "SELECT id, timestamp, payload FROM messages WHERE conversation = ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?", (conversation, last)).fetchall()[::-1]
+    else:
+        rows = conn.execute(
+            "SELECT id, timestamp, payload FROM messages WHERE conversation = ? ORDER BY timestamp, id",
+            (conversation,)).fetchall()
+    if rows:
+        cursor = ("sqlite", (rows[-1]["timestamp"], rows[-1]["id"]))
+    elif cursor is None:
+        cursor = ("sqlite", None)
+    messages = [json.loads(row["payload"]) for row in rows]
+    if since is not None:
+        messages = [message for message in messages if message.get("timestamp", "") > since]
+    return messages, cursor, False
+
+def add_message(conversation, message):
+    """Append a message dict to a conversation."""
+    conn = connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO messages (conversation, timestamp, payload) VALUES (?, ?, ?)",
+            (conversation, message["timestamp"], json.dumps(message)))
+
+def load_chat_messages():
+    """Load every conversation keyed by conversation name."""
+    chat_data = {}
+    for row in connect().execute("SELECT conversation, payload FROM messages ORDER BY id"):
+        chat_data.setdefault(row["conversation"], []).append(json.loads(row["payload"]))
+    return chat_data
+
+def save_chat_messages(chat_data):
+    """Replace all conversations with the given data."""
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM messages")
+        for conversation, messages in chat_data.items():
+            conn.executemany(
+                "INSERT INTO messages (conversation, timestamp, payload) VALUES (?, ?, ?)",
+                [(conversation, m.get("timestamp", ""), json.dumps(m)) for m in messages])
+
+# Users
+
+def get_user(username):
+    """Return the stored record for a user, or None."""
+    row = connect().execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+    return json.loads(row["data"]) if row else None
+
+def add_user(username, record):
+    """Insert a new user; returns False if the username already exists."""
+    conn = connect()
+    with conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)", (username, json.dumps(record)))
+    return cursor.rowcount == 1
+
+def load_user_data():
+    """Load every user record keyed by username."""
+    return {row["username"]: json.loads(row["data"])
+            for row in connect().execute("SELECT username, data FROM users ORDER BY rowid")}
+
+def save_user_data(user_data):
+    """Replace all user records with the given data."""
+    conn = connect()
+    with conn:
+        conn.execute("DELETE FROM users")
+        conn.executemany(
+            "INSERT INTO users (username, data) VALUES (?, ?)",
+            [(username, json.dumps(record)) for username, record in user_data.items()])
+
+# Migration
+
+def migrate_from_json():
+    """One-shot import of the JSON stores into the SQLite database.
+
+    Rerunning it replaces the database's activity, so it also rewrites IDs an earlier run
+    stored as given with their canonical form.
+    """
+    # Imported here: both modules import this one to dispatch to SQLite
+    from utils import user_activity, user_auth, chat_store
+    from utils.file_store import read_json
+
+    # The snapshot with the rotating file and the event log replayed on top, as the JSON store reads it
+    activity_data = user_activity.load_json_activity()
+    chat_store.ensure_migrated(user_activity.CHAT_MESSAGES_FILE)
+    chat_data = chat_store.load_all()
+    user_data = read_json(user_auth.USER_DATA_FILE)
+
+    save_user_activity(activity_data)
+    save_chat_messages(chat_data)
+    save_user_data(user_data)
+    return {"users": len(user_data), "activity_users": len(activity_data),
+            "conversations": len(chat_data)}
+
+if __name__ == "__main__":
+    counts = migrate_from_json()
+    print(f"Migrated into {SQLITE_DB_FILE}: {counts}")
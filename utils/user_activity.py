@@ -1,147 +1,353 @@
-import json
+import contextlib
 import os
+import threading
+import traceback
 from datetime import datetime
+from utils import activity_lake, sqlite_store, chat_store, chat_broker, serializers
+from utils.file_store import locked, atomic_write, file_version
+from utils.read_cache import cached_load
+from utils.activity_log import (empty_activity, make_event, append_events, read_events, fold_events, fold_to_sets, archive_events, needs_snapshot, is_normalized)
+from utils.video_sets import normalize_video_id
+from utils.write_behind import WriteBehindBuffer
 
 USER_ACTIVITY_FILE = "user_activity.json"
+USER_ACTIVITY_LOG_FILE = "user_activity_log.jsonl"
+# Events being folded into a new snapshot; readers replay it between the snapshot and the log
+USER_ACTIVITY_ROTATING_FILE = USER_ACTIVITY_LOG_FILE + ".rotating"
+# Raw events, one file per day, kept after they are folded into the snapshot
+USER_ACTIVITY_HISTORY_DIR = "activity_history"
 CHAT_MESSAGES_FILE = "chat_messages.json"
 
+# (file version, normalized data) of the snapshot last read, so log appends do not reparse it
+_snapshot = (None, {})
+
+def _read_activity_files():
+    global _snapshot
+    # The snapshot file's lock guards both the snapshot and the log
+    with locked(USER_ACTIVITY_FILE, shared=True):
+        snapshot_version = file_version(USER_ACTIVITY_FILE)
+        cached_version, activity_data = _snapshot
+        parsed = snapshot_version is not None and snapshot_version != cached_version
+        if parsed:
+            activity_data = serializers.load(USER_ACTIVITY_FILE)
+        elif snapshot_version is None:
+            activity_data = {}
+        events = list(read_events(USER_ACTIVITY_ROTATING_FILE)) + list(read_events(USER_ACTIVITY_LOG_FILE))
+    if parsed:
+        if not is_normalized(activity_data):
+            # Written with legacy IDs or repeats (e.g. before IDs were normalized): fold it in memory,
+            # so every read returns canonical IDs; the next snapshot writes it out that way
+            activity_data = fold_events(activity_data, [])
+        _snapshot = (snapshot_version, activity_data)
+    # Folding round-trips every user through ActivitySets, so skip it when there is nothing to replay
+    return fold_events(activity_data, events) if events else activity_data
+
+def load_stored_activity():
+    """Load the persisted user activity: the JSON snapshot with the event log replayed on top."""
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.load_user_activity()
+    return load_json_activity()
+
+def load_json_activity():
+    """Load the JSON store whichever backend is active, e.g. to migrate it (see sqlite_store.migrate_from_json)."""
+    return cached_load((USER_ACTIVITY_FILE, USER_ACTIVITY_ROTATING_FILE, USER_ACTIVITY_LOG_FILE), _read_activity_files)
+
 def load_user_activity():
-    """Load user activity data from a JSON file."""
-    if os.path.exists(USER_ACTIVITY_FILE):
-        with open(USER_ACTIVITY_FILE, "r") as file:
-            return json.load(file)
-    return {}
+    """Load user activity, including events still waiting in the write-behind buffer."""
+    with write_buffer.flush_lock:
+        activity_data = load_stored_activity()
+        pending = write_buffer.pending()
+        if not pending:
+            return activity_data
+        # Refold only the users with pending events; the stored data is shared and read-only
+        usernames = {event["user"] for event in pending}
+        refolded = fold_events({u: activity_data[u] for u in usernames if u in activity_data}, pending)
+        return {**activity_data, **refolded}
+
+def load_activity_sets():
+    """Load user activity as compact per-user bitsets over dense video IDs."""
+    with write_buffer.flush_lock:
+        return fold_to_sets(load_stored_activity(), write_buffer.pending())
 
 def save_user_activity(activity_data):
-    """Save user activity data to a JSON file."""
-    with open(USER_ACTIVITY_FILE, "w") as file:
-        json.dump(activity_data, file, indent=4)
+    """Save user activity data as a new snapshot and truncate the event log."""
+    if sqlite_store.USE_SQLITE:
+        sqlite_store.save_user_activity(activity_data)
+    else:
+        with locked(USER_ACTIVITY_FILE):
+            atomic_write(USER_ACTIVITY_FILE, serializers.write_to(activity_data, indent=4), "wb")
+            open(USER_ACTIVITY_LOG_FILE, "w").close()
+            if os.path.exists(USER_ACTIVITY_ROTATING_FILE):
+                os.remove(USER_ACTIVITY_ROTATING_FILE)
+    # The new data may lack views and shares merged away as repeats; record them again
+    write_buffer.forget()
+
+def snapshot_activity():
+    """Fold the event log into the snapshot and move its events to the raw history.
+
+    Writers are only locked out while the log is renamed and while the new snapshot is swapped
+    in; the fold itself runs unlocked, with readers replaying the rotating file meanwhile.
+    """
+    if sqlite_store.USE_SQLITE:
+        return 0
+    # One snapshotter at a time, across processes
+    with locked(USER_ACTIVITY_ROTATING_FILE):
+        with locked(USER_ACTIVITY_FILE):
+            if not os.path.exists(USER_ACTIVITY_ROTATING_FILE):  # Else finish an interrupted rotation
+                if not os.path.exists(USER_ACTIVITY_LOG_FILE) or os.path.getsize(USER_ACTIVITY_LOG_FILE) == 0:
+                    return 0
+                before = activity_version()
+                os.replace(USER_ACTIVITY_LOG_FILE, USER_ACTIVITY_ROTATING_FILE)
+                _advance_synced(before, activity_version())  # Same activity, new file versions
+            activity_data = {}
+            if os.path.exists(USER_ACTIVITY_FILE):
+                activity_data = serializers.load(USER_ACTIVITY_FILE)
+
+        events = list(read_events(USER_ACTIVITY_ROTATING_FILE))
+        write_snapshot = serializers.write_to(fold_events(activity_data, events), indent=4)
+
+        with locked(USER_ACTIVITY_FILE):
+            before = activity_version()
+            atomic_write(USER_ACTIVITY_FILE, write_snapshot, "wb")
+            os.remove(USER_ACTIVITY_ROTATING_FILE)
+            _advance_synced(before, activity_version())
+            archive_events(USER_ACTIVITY_HISTORY_DIR, events)
+    return len(events)
+
+def record_events(events):
+    """Persist a batch of activity events, folding the log into a snapshot once it grows large.
+
+    The events are also appended to the activity lake, which the Spark jobs and the activity
+    queries read (see utils.activity_lake).
+    """
+    if sqlite_store.USE_SQLITE:
+        with locked(sqlite_store.SQLITE_DB_FILE):
+            before = activity_version()
+            sqlite_store.apply_events(events)
+            _advance_synced(before, activity_version())
+    else:
+        with locked(USER_ACTIVITY_FILE):
+            before = activity_version()
+            append_events(USER_ACTIVITY_LOG_FILE, events)
+            _advance_synced(before, activity_version())
+            snapshot_due = needs_snapshot(USER_ACTIVITY_LOG_FILE)
+        if snapshot_due:
+            snapshot_activity()
+    _append_to_lake(events)
+
+def _append_to_lake(events):
+    try:
+        activity_lake.append([(event["user"], normalize_video_id(event["video"]), event["type"], event["timestamp"])
+                              for event in events])
+    except Exception:
+        # The store already has the events; raising would have the buffer write them twice
+        traceback.print_exc()
+
+# Views, likes and shares are buffered here so Streamlit reruns do not wait on disk
+write_buffer = WriteBehindBuffer(record_events)
+
+def flush_activity():
+    """Write any buffered activity events to the store now."""
+    return write_buffer.flush()
+
+def activity_version():
+    """Return a token that changes whenever the stored activity changes."""
+    if sqlite_store.USE_SQLITE:
+        paths = (sqlite_store.SQLITE_DB_FILE, sqlite_store.SQLITE_DB_FILE + "-wal")
+    else:
+        paths = (USER_ACTIVITY_FILE, USER_ACTIVITY_ROTATING_FILE, USER_ACTIVITY_LOG_FILE)
+    return str(tuple(file_version(path) for path in paths))
+
+class SyncedVersion:
+    """The activity_version() a derived model reflects.
+
+    Taken when the model is loaded and advanced only by this process's own writes, whose events
+    the model sees; a write by another process leaves it behind for good.
+    """
+
+    def __init__(self, version):
+        self.version = version
+
+    def current(self):
+        """True if the store holds exactly the activity the model reflects."""
+        return self.version is not None and self.version == activity_version()
+
+# Advanced under the write buffer's flush lock, which every write of this process holds
+_synced_versions = []
+
+def _advance_synced(before, after):
+    for synced in _synced_versions:
+        if synced.version == before:
+            synced.version = after
+
+# Derived models (see utils.derived_models) listen to events as they are made in this process
+_listeners = []
+_listeners_lock = threading.RLock()
+# Lists of (sequence number, event) collecting the events made while a derived model loads
+_recorders = []
+
+@contextlib.contextmanager
+def activity_paused():
+    """Hold off new activity events in this process, e.g. while a derived model is snapshotted."""
+    with _listeners_lock:
+        yield
+
+def add_activity_listener(listener):
+    """Call listener(event) for every activity event made in this process from now on.
+
+    Models built from the stored activity register through load_derived instead, so no event
+    is missed or counted twice.
+    """
+    with _listeners_lock:
+        _listeners.append(listener)
+
+def load_derived(build):
+    """Build a derived model of the stored activity and keep it updated by this process's events.
+
+    build(activity_sets, synced=...) returns an object with apply_event(event) and runs without
+    holding up activity events. The events made meanwhile are then replayed into it and it is
+    registered as a listener; only that replay holds events up.
+    """
+    missed = []
+    with _listeners_lock:
+        _recorders.append(missed)
+    try:
+        # No write of this process can happen under the flush lock, so the snapshot is exact
+        with write_buffer.flush_lock:
+            version = activity_version()
+            stored = load_stored_activity()
+            pending, queued = write_buffer.snapshot()
+            synced = SyncedVersion(version if activity_version() == version else None)  # Else another process wrote meanwhile
+            _synced_versions.append(synced)
+        model = build(fold_to_sets(stored, pending), synced=synced)
+    except BaseException:
+        with _listeners_lock:
+            _recorders.remove(missed)
+        raise
+    with _listeners_lock:
+        _recorders.remove(missed)
+        for sequence, event in missed:
+            if sequence > queued:  # Earlier ones were in the store or the pending events loaded
+                model.apply_event(event)
+        _listeners.append(model.apply_event)
+    return model
+
+def _emit(event, buffered=True):
+    with _listeners_lock:
+        if not write_buffer.add(event):
+            return  # A repeat view or share merged into one already recorded; nothing changed
+        for missed in _recorders:
+            missed.append((write_buffer.queued, event))
+        for listener in _listeners:
+            listener(event)
+    if not buffered:
+        flush_activity()  # Written now, after the events queued before it
 
 def load_chat_messages():
-    """Load chat messages data from a JSON file."""
-    if os.path.exists(CHAT_MESSAGES_FILE):
-        with open(CHAT_MESSAGES_FILE, "r") as file:
-            return json.load(file)
-    return {}
+    """Load every conversation, keyed by canonical conversation key (see utils.chat_store)."""
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.load_chat_messages()
+    chat_store.ensure_migrated(CHAT_MESSAGES_FILE)
+    return chat_store.load_all()
 
 def save_chat_messages(chat_data):
-    """Save chat messages data to a JSON file."""
-    with open(CHAT_MESSAGES_FILE, "w") as file:
-        json.dump(chat_data, file, indent=4)
+    """Replace every conversation, keyed by canonical conversation key."""
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.save_chat_messages(chat_data)
+    chat_store.replace_all(chat_data)
 
 def get_user_activity(username):
     """Retrieve activity data for a specific user."""
-    activity_data = load_user_activity()
-    return activity_data.get(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
+    if not sqlite_store.USE_SQLITE:
+        activity_data = load_user_activity()
+        return activity_data.get(username, empty_activity())
+    with write_buffer.flush_lock:
+        activity_data = {username: sqlite_store.get_user_activity(username)}
+        return fold_events(activity_data, write_buffer.pending(username))[username]
 
 def update_like(username, video_id):
     """Update the like status for a specific video by a user."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.setdefault(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
-
-    if video_id in user_activity["liked"]:
-        user_activity["liked"].remove(video_id)
-    else:
-        user_activity["liked"].append(video_id)
-        if video_id in user_activity["disliked"]:
-            user_activity["disliked"].remove(video_id)
-    
-    save_user_activity(activity_data)
+    _emit(make_event("like", username, video_id))
 
 def update_dislike(username, video_id):
     """Update the dislike status for a specific video by a user."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.setdefault(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
-
-    if video_id in user_activity["disliked"]:
-        user_activity["disliked"].remove(video_id)
-    else:
-        user_activity["disliked"].append(video_id)
-        if video_id in user_activity["liked"]:
-            user_activity["liked"].remove(video_id)
-    
-    save_user_activity(activity_data)
+    _emit(make_event("dislike", username, video_id))
 
 def add_comment(username, video_id, comment_text):
     """Add a comment by a user to a specific video."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.setdefault(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
-
-    if video_id not in user_activity["comments"]:
-        user_activity["comments"][video_id] = []
-    
-    user_activity["comments"][video_id].append({
-        "comment": comment_text,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    save_user_activity(activity_data)
+    _emit(make_event("comment", username, video_id, comment=comment_text), buffered=False)
 
 def share_video(username, video_id):
     """Track when a user shares a video."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.setdefault(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
-
-    if video_id not in user_activity["shares"]:
-        user_activity["shares"].append(video_id)
-    
-    save_user_activity(activity_data)
+    _emit(make_event("share", username, video_id))
 
 def get_user_likes(username):
     """Retrieve the list of videos liked by the user."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.get(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
-    return user_activity["liked"]
+    if sqlite_store.USE_SQLITE and not write_buffer.pending(username):
+        return sqlite_store.get_user_videos(username, "liked")
+    return get_user_activity(username)["liked"]
 
 def get_user_history(username):
     """Retrieve the list of videos viewed by the user."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.get(username, {"liked": [], "disliked": [], "comments": {}, "shares": []})
-    return user_activity.get("viewed", [])  # Ensure "viewed" is tracked
+    if sqlite_store.USE_SQLITE and not write_buffer.pending(username):
+        return sqlite_store.get_user_videos(username, "viewed")
+    return get_user_activity(username).get("viewed", [])  # Older snapshots may lack "viewed"
 
 def track_view(username, video_id):
     """Track when a user views a video."""
-    activity_data = load_user_activity()
-    user_activity = activity_data.setdefault(username, {"liked": [], "disliked": [], "comments": {}, "shares": [], "viewed": []})
-    
-    if video_id not in user_activity["viewed"]:
-        user_activity["viewed"].append(video_id)
-    
-    save_user_activity(activity_data)
-
-def fetch_chat_messages(video_id):
-    """Fetch all chat messages for a specific video."""
-    chat_data = load_chat_messages()
-    return chat_data.get(video_id, [])
+    _emit(make_event("view", username, video_id))
+
+def _read_conversation(key, cursor=None, since=None, last=None):
+    """Read a conversation from the active backend as (messages, cursor, reset)."""
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.fetch_conversation(key, cursor, since, last)
+    chat_store.ensure_migrated(CHAT_MESSAGES_FILE)
+    if cursor is None and since is None and last is None:
+        return list(chat_store.read_conversation(key)), None, False
+    return chat_store.read_messages(key, cursor, since, last)
+
+def _append_message(key, message):
+    if sqlite_store.USE_SQLITE:
+        sqlite_store.add_message(key, message)
+    else:
+        chat_store.ensure_migrated(CHAT_MESSAGES_FILE)
+        chat_store.append_message(key, message)
+    # Persist first, then notify live chat panels
+    chat_broker.get_broker().publish(key, message)
+
+def subscribe_user_chat(username, other_user):
+    """Subscribe to live notifications of new messages between two users."""
+    return chat_broker.get_broker().subscribe(chat_store.user_conversation_key(username, other_user))
+
+def fetch_chat_messages(video_id, since=None, last=None):
+    """Fetch chat messages for a specific video, optionally only newer than `since` or the last N."""
+    return _read_conversation(chat_store.video_conversation_key(video_id), since=since, last=last)[0]
 
 def send_chat_message(username, video_id, message_text):
     """Send a chat message for a specific video."""
-    chat_data = load_chat_messages()
-    video_chat = chat_data.setdefault(video_id, [])
-
-    video_chat.append({
+    _append_message(chat_store.video_conversation_key(video_id), {
         "username": username,
         "message": message_text,
         "timestamp": datetime.now().isoformat()
     })
-    
-    save_chat_messages(chat_data)
 
-def fetch_user_chat(sender, recipient):
-    """Fetch chat messages between two users."""
-    chat_data = load_chat_messages()
-    return chat_data.get(f"{sender}_{recipient}", []) + chat_data.get(f"{recipient}_{sender}", [])
+def fetch_user_chat(sender, recipient, since=None, last=None):
+    """Fetch chat messages between two users in the order they were sent."""
+    return _read_conversation(chat_store.user_conversation_key(sender, recipient), since=since, last=last)[0]
+
+def fetch_user_chat_updates(sender, recipient, cursor=None, last=None):
+    """Fetch only the messages between two users sent after `cursor`.
+
+    Start with cursor=None (and optionally last=N to read just the recent history), then pass
+    the returned cursor on the next call. Returns (messages, cursor, reset); when reset is True
+    the conversation was rewritten and messages replace, rather than extend, what was shown.
+    """
+    return _read_conversation(chat_store.user_conversation_key(sender, recipient), cursor=cursor, last=last)
 
 def send_user_message(sender, recipient, message_text):
     """Send a chat message between users."""
-    chat_data = load_chat_messages()
-    conversation_key = f"{sender}_{recipient}"
-    if conversation_key not in chat_data:
-        chat_data[conversation_key] = []
-    chat_data[conversation_key].append({
+    _append_message(chat_store.user_conversation_key(sender, recipient), {
         "sender": sender,
         "message": message_text,
         "timestamp": datetime.now().isoformat()
     })
-    save_chat_messages(chat_data)
-
@@ -1,6 +1,7 @@
-import json
 import hashlib
-import os
+from utils import sqlite_store
+from utils.file_store import read_json, write_json, update_json
+from utils.read_cache import cached_load
 
 USER_DATA_FILE = "user_data.json"
 
@@ -10,35 +11,43 @@ def hash_password(password):
 
 def load_user_data():
     """Load user data from a JSON file."""
-    if os.path.exists(USER_DATA_FILE):
-        with open(USER_DATA_FILE, "r") as file:
-            return json.load(file)
-    return {}
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.load_user_data()
+    return cached_load(USER_DATA_FILE, lambda: read_json(USER_DATA_FILE))
 
 def save_user_data(user_data):
     """Save user data to a JSON file."""
-    with open(USER_DATA_FILE, "w") as file:
-        json.dump(user_data, file)
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.save_user_data(user_data)
+    write_json(USER_DATA_FILE, user_data)
 
 def sign_up(username, password, age, sex, location, favorite_genre):
     """Sign up a new user."""
-    user_data = load_user_data()
-    if username in user_data:
-        return False  # Username already exists
-    user_data[username] = {
+    record = {
         "password": hash_password(password),
         "age": age,
         "sex": sex,
         "location": location,
         "favorite_genre": favorite_genre
     }
-    save_user_data(user_data)
-    return True
+    if sqlite_store.USE_SQLITE:
+        return sqlite_store.add_user(username, record)
+
+    def add_user(user_data):
+        if username in user_data:
+            return False  # Username already exists
+        user_data[username] = record
+        return True
+
+    return update_json(USER_DATA_FILE, add_user)
 
 def login(username, password):
     """Login user by verifying credentials."""
-    user_data = load_user_data()
     hashed_password = hash_password(password)
+    if sqlite_store.USE_SQLITE:
+        user = sqlite_store.get_user(username)
+        return user is not None and user["password"] == hashed_password
+    user_data = load_user_data()
     if username in user_data and user_data[username]["password"] == hashed_password:
         return True
     return False
@@ -0,0 +1,248 @@
+import json
+import os
+import re
+import struct
+from array import array
+import numpy as np
+from utils.data import video_metadata
+
+SET_KEYS = ("liked", "disliked", "shares", "viewed")
+ORDERED_KEYS = ("liked", "disliked", "shares")  # Kept in the order they were added, like viewed_order
+SETS_MAGIC = b"SPVS2"
+SETS_MAGIC_V1 = b"SPVS1"  # Without the order lists; read in bit order
+
+_VIDEO_NUMBER = re.compile(r"^video_0*(\d+)$")
+
+def normalize_video_id(video_id):
+    """Map legacy IDs such as 'E:/videoapp/Videos_Data/video_3.mp4' or 'video_003' to 'video_3'."""
+    name = os.path.splitext(os.path.basename(str(video_id).replace("\\", "/")))[0]
+    match = _VIDEO_NUMBER.match(name)
+    return f"video_{int(match.group(1))}" if match else name
+
+class VideoIndex:
+    """Dense integer IDs for videos, seeded in catalog order."""
+
+    def __init__(self, video_ids=()):
+        self.video_ids = []
+        self._ids = {}
+        for video_id in video_ids:
+            self.id_of(video_id)
+
+    def id_of(self, video_id):
+        """Return the integer ID of a video, assigning the next free one if it is new."""
+        index = self._ids.get(video_id)
+        if index is not None:  # Already canonical, the common case
+            return index
+        video_id = normalize_video_id(video_id)
+        index = self._ids.get(video_id)
+        if index is None:
+            index = self._ids[video_id] = len(self.video_ids)
+            self.video_ids.append(video_id)
+        return index
+
+    def video_of(self, index):
+        return self.video_ids[index]
+
+    def __len__(self):
+        return len(self.video_ids)
+
+class Bitset:
+    """Growable set of small non-negative integers stored one bit each."""
+
+    __slots__ = ("_bytes", "_count")
+
+    def __init__(self, data=b""):
+        self._bytes = bytearray(data)
+        self._count = bin(int.from_bytes(self._bytes, "little")).count("1") if data else 0
+
+    def __contains__(self, i):
+        byte = i >> 3
+        return byte < len(self._bytes) and bool(self._bytes[byte] & (1 << (i & 7)))
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        # Peel set bits off one integer rather than walking every (mostly zero) byte in Python
+        value = int.from_bytes(self._bytes, "little")
+        while value:
+            low = value & -value
+            yield low.bit_length() - 1
+            value ^= low
+
+    def add(self, i):
+        byte = i >> 3
+        if byte >= len(self._bytes):
+            self._bytes.extend(bytes(byte + 1 - len(self._bytes)))
+        mask = 1 << (i & 7)
+        if not self._bytes[byte] & mask:
+            self._bytes[byte] |= mask
+            self._count += 1
+
+    def discard(self, i):
+        if i in self:
+            self._bytes[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+            self._count -= 1
+
+    def toggle(self, i):
+        """Flip membership of i; returns True if it is now a member."""
+        if i in self:
+            self.discard(i)
+            return False
+        self.add(i)
+        return True
+
+    def to_bytes(self):
+        return bytes(self._bytes).rstrip(b"\0")
+
+class CompactActivity:
+    """One user's activity with liked/disliked/shares/viewed held as bitsets over a VideoIndex."""
+
+    __slots__ = ("index", "sets", "viewed_order", "orders", "comments")
+
+    def __init__(self, index):
+        self.index = index
+        self.sets = {key: Bitset() for key in SET_KEYS}
+        self.viewed_order = []  # Watch order, since a bitset cannot keep it
+        self.orders = {key: [] for key in ORDERED_KEYS}  # Insertion order of the other sets
+        self.comments = {}
+
+    @classmethod
+    def from_activity(cls, index, user_activity):
+        compact = cls(index)
+        for key in ORDERED_KEYS:
+            for video_id in user_activity.get(key, []):
+                compact.add(key, index.id_of(video_id))
+        for video_id in user_activity.get("viewed", []):
+            compact.view(index.id_of(video_id))
+        for video_id, comments in user_activity.get("comments", {}).items():
+            compact.comments.setdefault(normalize_video_id(video_id), []).extend(comments)
+        return compact
+
+    def add(self, key, i):
+        """Add i to one of the ORDERED_KEYS sets, after its current members."""
+        if i not in self.sets[key]:
+            self.sets[key].add(i)
+            self.orders[key].append(i)
+
+    def discard(self, key, i):
+        if i in self.sets[key]:
+            self.sets[key].discard(i)
+            self.orders[key].remove(i)
+
+    def toggle(self, key, opposite_key, i):
+        """Toggle i in one set and clear it from the opposite set when it is added."""
+        if i in self.sets[key]:
+            self.discard(key, i)
+        else:
+            self.add(key, i)
+            self.discard(opposite_key, i)
+
+    def view(self, i):
+        if i not in self.sets["viewed"]:
+            self.sets["viewed"].add(i)
+            self.viewed_order.append(i)
+
+    def to_activity(self):
+        """Return the JSON-shaped activity record used by utils.user_activity."""
+        video_of = self.index.video_of
+        return {
+            "liked": [video_of(i) for i in self.orders["liked"]],
+            "disliked": [video_of(i) for i in self.orders["disliked"]],
+            "comments": self.comments,
+            "shares": [video_of(i) for i in self.orders["shares"]],
+            "viewed": [video_of(i) for i in self.viewed_order]
+        }
+
+class ActivitySets:
+    """Compact activity of many users sharing one VideoIndex."""
+
+    def __init__(self, index=None):
+        self.index = index if index is not None else VideoIndex(v["Video_ID"] for v in video_metadata)
+        self.users = {}
+
+    @classmethod
+    def from_activity_data(cls, activity_data, index=None):
+        activity_sets = cls(index)
+        for username, user_activity in activity_data.items():
+            activity_sets.users[username] = CompactActivity.from_activity(activity_sets.index, user_activity)
+        return activity_sets
+
+    def user(self, username):
+        compact = self.users.get(username)
+        if compact is None:
+            compact = self.users[username] = CompactActivity(self.index)
+        return compact
+
+    def to_activity_data(self):
+        return {username: compact.to_activity() for username, compact in self.users.items()}
+
+    def matrix(self, key, usernames=None):
+        """Return a (users x videos) uint8 0/1 matrix of one set, built with vectorized bit unpacking."""
+        usernames = list(self.users) if usernames is None else usernames
+        width = (len(self.index) + 7) >> 3
+        packed = np.zeros((len(usernames), width), dtype=np.uint8)
+        for row, username in enumerate(usernames):
+            compact = self.users.get(username)
+            if compact is not None:
+                data = compact.sets[key].to_bytes()
+                packed[row, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+        return np.unpackbits(packed, axis=1, bitorder="little")[:, :len(self.index)]
+
+    def to_bytes(self):
+        """Serialize the sets (not comments) as a compact binary blob."""
+        usernames = list(self.users)
+        header = json.dumps({"videos": self.index.video_ids, "users": usernames}).encode()
+        parts = [SETS_MAGIC, struct.pack("<I", len(header)), header]
+        for username in usernames:
+            compact = self.users[username]
+            for key in SET_KEYS:
+                data = compact.sets[key].to_bytes()
+                parts.append(struct.pack("<I", len(data)))
+                parts.append(data)
+            for order in (compact.viewed_order, *(compact.orders[key] for key in ORDERED_KEYS)):
+                order = array("i", order)
+                parts.append(struct.pack("<I", len(order)))
+                parts.append(order.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, blob):
+        if not blob.startswith((SETS_MAGIC, SETS_MAGIC_V1)):
+            raise ValueError("Not a serialized ActivitySets blob")
+        ordered = blob.startswith(SETS_MAGIC)
+        offset = len(SETS_MAGIC)
+        (header_len,) = struct.unpack_from("<I", blob, offset)
+        offset += 4
+        header = json.loads(blob[offset:offset + header_len])
+        offset += header_len
+        activity_sets = cls(VideoIndex(header["videos"]))
+        for username in header["users"]:
+            compact = activity_sets.user(username)
+            for key in SET_KEYS:
+                (size,) = struct.unpack_from("<I", blob, offset)
+                offset += 4
+                compact.sets[key] = Bitset(blob[offset:offset + size])
+                offset += size
+            orders = []
+            for _ in range(1 + len(ORDERED_KEYS) if ordered else 1):
+                (count,) = struct.unpack_from("<I", blob, offset)
+                offset += 4
+                order = array("i")
+                order.frombytes(blob[offset:offset + 4 * count])
+                orders.append(order.tolist())
+                offset += 4 * count
+            compact.viewed_order = orders[0]
+            for key in ORDERED_KEYS:
+                compact.orders[key] = orders[1 + ORDERED_KEYS.index(key)] if ordered else list(compact.sets[key])
+        return activity_sets
+
+def write_activity_sets(path, activity_sets):
+    """Write ActivitySets to a binary file."""
+    with open(path, "wb") as file:
+        file.write(activity_sets.to_bytes())
+
+def read_activity_sets(path):
+    """Read ActivitySets written by write_activity_sets."""
+    with open(path, "rb") as file:
+        return ActivitySets.from_bytes(file.read())
@@ -0,0 +1,107 @@
+import atexit
+import threading
+import traceback
+from collections import OrderedDict
+
+# Flush once this many events are pending, or after this many seconds
+FLUSH_MAX_EVENTS = 64
+FLUSH_INTERVAL_SECONDS = 1.0
+
+# Event types that are idempotent, so a repeat of the same (type, user, video) can be dropped
+MERGEABLE_TYPES = ("view", "share")
+# Except that watch order matters: a view only merges into the same user's immediately previous view
+SEQUENCE_TYPES = ("view",)
+MAX_REMEMBERED_EVENTS = 4096
+
+class WriteBehindBuffer:
+    """Collect activity events in memory and flush them in batches from a background thread."""
+
+    def __init__(self, flush_fn, max_events=FLUSH_MAX_EVENTS, interval=FLUSH_INTERVAL_SECONDS):
+        self.flush_fn = flush_fn
+        self.max_events = max_events
+        self.interval = interval
+        # Held while a batch is written; readers take it to fold pending events consistently
+        self.flush_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._pending = []
+        self.queued = 0
+        self._seen = OrderedDict()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, event):
+        """Queue an event; returns False if it merged into one already recorded.
+
+        Every queued event is counted in self.queued, so it is the event's sequence number.
+        """
+        key = None
+        if event["type"] in SEQUENCE_TYPES:
+            key = (event["type"], event["user"])  # Remembers the user's last video
+        elif event["type"] in MERGEABLE_TYPES:
+            key = (event["type"], event["user"], event["video"])
+        with self._lock:
+            if key is not None:
+                if self._seen.get(key) == event["video"]:
+                    self._seen.move_to_end(key)
+                    return False
+                self._seen[key] = event["video"]
+                self._seen.move_to_end(key)
+                if len(self._seen) > MAX_REMEMBERED_EVENTS:
+                    self._seen.popitem(last=False)
+            self._pending.append(event)
+            self.queued += 1
+            full = len(self._pending) >= self.max_events
+        self._ensure_started()
+        if full:
+            self._wakeup.set()
+        return True
+
+    def pending(self, username=None):
+        """Return the events not yet flushed, optionally only those of one user."""
+        with self._lock:
+            if username is None:
+                return list(self._pending)
+            return [event for event in self._pending if event["user"] == username]
+
+    def snapshot(self):
+        """Return the pending events and the number queued so far, taken together."""
+        with self._lock:
+            return list(self._pending), self.queued
+
+    def flush(self):
+        """Write all pending events in one batch."""
+        with self.flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self.flush_fn(batch)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch  # Keep them for the next attempt
+                raise
+            return len(batch)
+
+    def forget(self):
+        """Drop the memory of merged events, e.g. after the stores were rewritten."""
+        with self._lock:
+            self._seen.clear()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="activity-write-behind", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)  # Durable flush on interpreter shutdown
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()